@@ -0,0 +1,145 @@
+"""
+Time the dataset context's `df_info` profiler in each subkernel language.
+
+A synthetic frame of `--rows` rows and `--cols` columns (a mix of integer, float and string columns) is written to a
+CSV file and loaded in each language that is installed: Python always, R if `Rscript` is on the path and Julia if
+`julia` is (with DataFrames, CSV, JSON3 and DisplayAs installed). The rendered `df_info` procedure is then run three
+times in the same session:
+
+* `cold`: the first profile of the frame.
+* `unchanged`: the frame has not changed, so its cached profile is reused.
+* `edited`: one value has been edited in place, so the frame is profiled again.
+
+Frames with more rows than `--row-budget` are profiled from a sample, as they are in the context.
+
+    python benchmarks/df_info.py --rows 1000000 --cols 20
+    python benchmarks/df_info.py --rows 2000 --cols 2000
+"""
+import argparse
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from jinja2 import Template
+
+PROCEDURES = Path(__file__).parents[1] / "src/askem_beaker/contexts/dataset/procedures"
+PHASES = ("cold", "unchanged", "edited")
+
+R_SCRIPT = """
+suppressMessages(library(jsonlite))
+df <- read.csv("{data}")
+timing <- function(phase) {{
+    elapsed <- system.time(capture.output(source("{procedure}")))[["elapsed"]]
+    message(sprintf("timing %s %f", phase, elapsed))
+}}
+timing("cold")
+timing("unchanged")
+df[1, 1] <- df[1, 1] + 1
+timing("edited")
+"""
+
+JULIA_SCRIPT = """
+using DataFrames, CSV, JSON3, DisplayAs
+df = CSV.read("{data}", DataFrame)
+function timing(phase)
+    elapsed = @elapsed redirect_stdout(devnull) do
+        Base.include(Main, "{procedure}")
+    end
+    println(stderr, "timing $phase $elapsed")
+end
+timing("cold")
+timing("unchanged")
+df[1, 1] += 1
+timing("edited")
+"""
+
+
+def render(language: str, extension: str, row_budget: int) -> str:
+    template = Template((PROCEDURES / language / f"df_info.{extension}").read_text())
+    return template.render(row_budget=row_budget, preview_encoding="json", transfer_dir="")
+
+
+def make_frame(rows: int, cols: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    columns = {}
+    for i in range(cols):
+        if i % 3 == 0:
+            columns[f"int_{i}"] = rng.integers(0, 1000, rows)
+        elif i % 3 == 1:
+            columns[f"float_{i}"] = rng.random(rows)
+        else:
+            columns[f"str_{i}"] = rng.choice(["alpha", "beta", "gamma", "delta"], rows)
+    return pd.DataFrame(columns)
+
+
+def run_python(df: pd.DataFrame, row_budget: int) -> dict:
+    code = render("python3", "py", row_budget)
+    namespace = {"df": df}
+    timings = {}
+    for phase in PHASES:
+        if phase == "edited":
+            namespace["df"].iat[0, 0] += 1
+        start = time.perf_counter()
+        exec(code, namespace)
+        timings[phase] = time.perf_counter() - start
+    return timings
+
+
+def run_subprocess(command: list, script: str, temp_dir: Path) -> dict:
+    script_path = temp_dir / "benchmark_script"
+    script_path.write_text(script)
+    result = subprocess.run([*command, str(script_path)], capture_output=True, text=True)
+    timings = {phase: float(elapsed) for phase, elapsed in re.findall(r"^timing (\w+) ([\d.e-]+)$", result.stderr, re.M)}
+    if set(timings) != set(PHASES):
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "no timings reported")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--cols", type=int, default=20)
+    parser.add_argument("--row-budget", type=int, default=250_000, help="as DATASET_PROFILE_ROW_BUDGET")
+    args = parser.parse_args()
+
+    df = make_frame(args.rows, args.cols)
+    temp_dir = Path(tempfile.mkdtemp())
+    data_path = temp_dir / "frame.csv"
+    df.to_csv(data_path, index=False)
+
+    print(f"{args.rows:,} rows x {args.cols} columns")
+    print(f"{'language':<10} " + " ".join(f"{phase + ' (s)':>15}" for phase in PHASES))
+    try:
+        runs = {"python": lambda: run_python(df, args.row_budget)}
+        if shutil.which("Rscript"):
+            procedure = temp_dir / "df_info.r"
+            procedure.write_text(render("rlang", "r", args.row_budget))
+            script = R_SCRIPT.format(data=data_path, procedure=procedure)
+            runs["r"] = lambda: run_subprocess(["Rscript"], script, temp_dir)
+        if shutil.which("julia"):
+            procedure = temp_dir / "df_info.jl"
+            procedure.write_text(render("julia", "jl", args.row_budget))
+            script = JULIA_SCRIPT.format(data=data_path, procedure=procedure)
+            runs["julia"] = lambda: run_subprocess(["julia"], script, temp_dir)
+
+        for language, run in runs.items():
+            try:
+                timings = run()
+            except RuntimeError as e:
+                print(f"{language:<10} failed: {e}")
+                continue
+            print(f"{language:<10} " + " ".join(f"{timings[phase]:>15.3f}" for phase in PHASES))
+        for language in ("r", "julia"):
+            if language not in runs:
+                print(f"{language:<10} not installed")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Event-loop latency while several contexts load from the HMI server at once.
+
+Starts a local stand-in HMI server that answers every request after a fixed delay, then simulates a number of contexts
+loading concurrently, each making a handful of metadata/download-url calls. While the contexts load, a heartbeat task
+measures how late the event loop wakes it up. The run is repeated with the old direct `requests.get` calls and with the
+shared `HMIClient`.
+
+    python benchmarks/hmi_client_event_loop.py --contexts 6 --calls 4 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from askem_beaker.hmi import HMIClient
+
+
+def start_server(latency: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = json.dumps({"id": self.path, "fileNames": ["data.csv"]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def heartbeat(stop: asyncio.Event, interval: float, lags: list):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def run(mode: str, base_url: str, contexts: int, calls: int, interval: float) -> dict:
+    client = HMIClient(base_url=base_url)
+
+    async def load_context(idx: int):
+        for call in range(calls):
+            path = f"datasets/{idx}-{call}"
+            if mode == "blocking":
+                requests.get(f"{base_url}/{path}").json()
+            else:
+                (await client.get(path)).json()
+
+    lags = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(stop, interval, lags))
+    start = time.perf_counter()
+    await asyncio.gather(*(load_context(idx) for idx in range(contexts)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    client.close()
+
+    lags = sorted(lags) or [0.0]
+    return {
+        "mode": mode,
+        "wall_s": elapsed,
+        "beats": len(lags),
+        "lag_median_ms": statistics.median(lags) * 1000,
+        "lag_p99_ms": lags[int(0.99 * (len(lags) - 1))] * 1000,
+        "lag_max_ms": lags[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--contexts", type=int, default=6, help="number of contexts loading at once")
+    parser.add_argument("--calls", type=int, default=4, help="HMI calls made by each context")
+    parser.add_argument("--latency", type=float, default=0.05, help="server-side delay per request, in seconds")
+    parser.add_argument("--interval", type=float, default=0.005, help="heartbeat interval, in seconds")
+    args = parser.parse_args()
+
+    server = start_server(args.latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"{args.contexts} contexts x {args.calls} calls, {args.latency * 1000:.0f}ms server latency")
+    print(f"{'mode':<10} {'wall (s)':>9} {'beats':>6} {'lag p50 (ms)':>13} {'lag p99 (ms)':>13} {'lag max (ms)':>13}")
+    for mode in ("blocking", "client"):
+        result = asyncio.run(run(mode, base_url, args.contexts, args.calls, args.interval))
+        print(
+            f"{result['mode']:<10} {result['wall_s']:>9.2f} {result['beats']:>6} {result['lag_median_ms']:>13.1f} "
+            f"{result['lag_p99_ms']:>13.1f} {result['lag_max_ms']:>13.1f}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Uploads a dataframe through the dataset context's Python upload procedures against a local stand-in object store.
+
+The stand-in serves the HMI endpoints the context uses (`upload-url`, `upload-url-multipart` and
+`upload-url-multipart-complete`) and S3-style presigned part urls that check `Content-MD5`, return the part's MD5 as
+its ETag and fail a configurable fraction of requests. Each run stages the frame with `df_stage`, uploads it with
+`df_upload_parts` (resuming until every part is stored, as `resume_save_dataset_request` would), completes the upload
+and checks the assembled object matches the staged file byte for byte. `--format` stages the frame as CSV, gzipped CSV,
+Parquet or Arrow.
+
+    python benchmarks/multipart_upload.py --rows 2000000 --part-size 8 --failure-rate 0.1
+    python benchmarks/multipart_upload.py --rows 2000000 --format parquet
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+from jinja2 import Template
+
+PROCEDURES = Path(__file__).parents[1] / "src/askem_beaker/contexts/dataset/procedures/python3"
+
+
+class ObjectStore:
+    def __init__(self, failure_rate: float):
+        self.failure_rate = failure_rate
+        self.objects: dict[str, bytes] = {}
+        self.uploads: dict[str, dict[int, bytes]] = {}
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def handler(self):
+        store = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def reply(self, status, body=b"", headers=None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                base = f"http://{self.headers['Host']}"
+                if url.path.endswith("/upload-url-multipart"):
+                    upload_id = f"upload-{len(store.uploads)}"
+                    store.uploads[upload_id] = {}
+                    urls = [f"{base}/store/{upload_id}/{n}" for n in range(1, int(params["part-count"]) + 1)]
+                    return self.reply(200, json.dumps({"uploadId": upload_id, "urls": urls}).encode())
+                if url.path.endswith("/upload-url"):
+                    return self.reply(200, json.dumps({"url": f"{base}/store/{params['filename']}"}).encode())
+                self.reply(404)
+
+            def do_PUT(self):
+                url = urlparse(self.path)
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if url.path.endswith("/upload-url-multipart-complete"):
+                    request = json.loads(body)
+                    parts = store.uploads.pop(request["uploadId"])
+                    etags = [hashlib.md5(parts[n]).hexdigest() for n in sorted(parts)]
+                    if etags != request["etags"]:
+                        return self.reply(400, b"InvalidPart")
+                    store.objects[request["filename"]] = b"".join(parts[n] for n in sorted(parts))
+                    return self.reply(200)
+
+                with store.lock:
+                    fail = random.random() < store.failure_rate
+                    store.failures += fail
+                if fail:
+                    return self.reply(503, b"SlowDown")
+                if base64.b64encode(hashlib.md5(body).digest()).decode() != self.headers.get("Content-MD5"):
+                    return self.reply(400, b"BadDigest")
+                match = re.fullmatch(r"/store/(upload-\d+)/(\d+)", url.path)
+                if match:
+                    store.uploads[match.group(1)][int(match.group(2))] = body
+                else:
+                    store.objects[url.path.rsplit("/", 1)[-1]] = body
+                self.reply(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def evaluate(name: str, namespace: dict, **kwargs):
+    """Runs a procedure the way the Python subkernel would, returning the value of its final expression."""
+    code = Template((PROCEDURES / f"{name}.py").read_text()).render(**kwargs)
+    body, _, last = code.rstrip().rpartition("\n\n")
+    exec(body, namespace)
+    return eval(last, namespace)
+
+
+def upload(base_url: str, mode: str, save_format: str, part_size: int, concurrency: int, retries: int, namespace: dict):
+    import requests
+
+    compression = {"parquet": "snappy", "arrow": "lz4"}.get(save_format, "none")
+    [staged] = evaluate("df_stage", namespace, frames=[{"var_name": "df", "format": save_format, "compression": compression}])
+    size = staged["size"]
+    if mode == "multipart":
+        part_size = max(part_size, math.ceil(size / 10_000))
+        presigned = requests.get(
+            f"{base_url}/datasets/1/upload-url-multipart",
+            params={"filename": "dataset.csv", "part-count": max(math.ceil(size / part_size), 1)},
+        ).json()
+        urls = presigned["urls"]
+    else:
+        part_size = max(size, 1)
+        data_url = requests.get(f"{base_url}/datasets/1/upload-url", params={"filename": "dataset.csv"}).json()["url"]
+        urls = [data_url]
+    parts = [
+        {"part_number": n, "url": url, "path": staged["path"], "part_size": part_size}
+        for n, url in enumerate(urls, start=1)
+    ]
+
+    with open(staged["path"], "rb") as staged_file:
+        expected = staged_file.read()
+
+    rounds, attempts, etags = 0, 0, {}
+    start = time.perf_counter()
+    while parts:
+        rounds += 1
+        results = evaluate(
+            "df_upload_parts", namespace,
+            parts=parts, concurrency=concurrency, retries=retries,
+        )
+        attempts += sum(result["attempts"] for result in results)
+        etags.update({result["part_number"]: result["etag"] for result in results if result["error"] is None})
+        failed = {result["part_number"] for result in results if result["error"] is not None}
+        parts = [part for part in parts if part["part_number"] in failed]
+    if mode == "multipart":
+        requests.put(
+            f"{base_url}/datasets/1/upload-url-multipart-complete",
+            json={"filename": "dataset.csv", "uploadId": presigned["uploadId"], "etags": [etags[n] for n in sorted(etags)]},
+        ).raise_for_status()
+    return size, time.perf_counter() - start, len(etags), attempts, rounds, expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--part-size", type=float, default=8, help="part size in MB")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--format", default="csv", choices=("csv", "csv.gz", "parquet", "arrow"))
+    parser.add_argument("--failure-rate", type=float, default=0.1, help="fraction of part uploads the store rejects")
+    args = parser.parse_args()
+
+    store = ObjectStore(args.failure_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), store.handler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "date": pd.date_range("2020-01-01", periods=args.rows, freq="min").astype(str),
+        "location": rng.integers(0, 3000, args.rows),
+        "value": rng.random(args.rows),
+    })
+    temp_dir = tempfile.mkdtemp()
+    tempfile.tempdir = temp_dir
+
+    print(f"{'mode':<10} {'MB':>8} {'parts':>6} {'attempts':>9} {'rounds':>7} {'seconds':>8} {'MB/s':>7} {'intact':>7}")
+    try:
+        for mode in ("single", "multipart"):
+            store.objects.clear()
+            size, seconds, parts, attempts, rounds, expected = upload(
+                base_url, mode, args.format, int(args.part_size * 1024 * 1024), args.concurrency, args.retries, {"df": df},
+            )
+            intact = store.objects.get("dataset.csv") == expected
+            mb = size / 1024 / 1024
+            print(f"{mode:<10} {mb:>8.1f} {parts:>6} {attempts:>9} {rounds:>7} {seconds:>8.2f} {mb / seconds:>7.1f} {intact!s:>7}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Cost of handing a model to a Python subkernel as a literal versus through `askem_beaker.transfer`.
+
+For synthetic petrinet AMRs of increasing size, compares:
+
+* `literal`: the previous approach, `model = {amr}` rendered as a Python dict literal in the cell source.
+* `json`: `injection_code(..., mode="json")`, the AMR embedded as a single JSON string literal.
+* `file`: `injection_code(..., mode="file")`, the AMR written to a transfer file and read by the subkernel.
+
+"cell" is the size of the code sent to the subkernel, "kernel" the time to build it and "subkernel" the time to
+compile and run it (what the subkernel would spend before the model is available).
+
+    python benchmarks/subkernel_injection.py --sizes 10 100 1000 5000
+"""
+import argparse
+import time
+
+from askem_beaker.transfer import injection_code
+
+
+def make_amr(n_states: int) -> dict:
+    states = [
+        {"id": f"S_{i}", "name": f"S_{i}", "grounding": {"identifiers": {"ido": "0000514"}, "modifiers": {"city": f"c{i}"}},
+         "units": {"expression": "person", "expression_mathml": "<ci>person</ci>"}}
+        for i in range(n_states)
+    ]
+    transitions = [
+        {"id": f"t_{i}", "input": [f"S_{i}", f"S_{(i + 1) % n_states}"], "output": [f"S_{(i + 1) % n_states}"] * 2,
+         "properties": {"name": f"t_{i}"}}
+        for i in range(n_states)
+    ]
+    parameters = [
+        {"id": f"beta_{i}", "value": 0.1 + i * 1e-6, "distribution": None, "units": {"expression": "1/day"}}
+        for i in range(n_states)
+    ]
+    return {
+        "header": {"name": "benchmark", "schema_name": "petrinet", "description": "synthetic", "model_version": "0.1"},
+        "model": {"states": states, "transitions": transitions},
+        "semantics": {"ode": {
+            "rates": [{"target": f"t_{i}", "expression": f"beta_{i}*S_{i}", "expression_mathml": "<apply/>"}
+                      for i in range(n_states)],
+            "initials": [{"target": f"S_{i}", "expression": "1000.0", "expression_mathml": "<cn>1000.0</cn>"}
+                         for i in range(n_states)],
+            "parameters": parameters,
+            "time": {"id": "t"},
+        }},
+        "metadata": {"annotations": {}, "flag": True},
+    }
+
+
+def run_in_subkernel(code: str) -> float:
+    start = time.perf_counter()
+    exec(compile(code, "<cell>", "exec"), {})
+    return time.perf_counter() - start
+
+
+def measure(mode: str, amr: dict) -> tuple[int, float, float]:
+    start = time.perf_counter()
+    if mode == "literal":
+        code = f"model = {amr}"
+        kernel = time.perf_counter() - start
+        return len(code), kernel, run_in_subkernel(code)
+    with injection_code("model", amr, mode=mode) as code:
+        kernel = time.perf_counter() - start
+        return len(code), kernel, run_in_subkernel(code)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000], help="number of states")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, best is reported")
+    args = parser.parse_args()
+
+    print(f"{'states':>7} {'mode':<8} {'cell (KB)':>10} {'kernel (ms)':>12} {'subkernel (ms)':>15}")
+    for size in args.sizes:
+        amr = make_amr(size)
+        for mode in ("literal", "json", "file"):
+            runs = [measure(mode, amr) for _ in range(args.repeat)]
+            cell_size = runs[0][0]
+            kernel = min(run[1] for run in runs)
+            subkernel = min(run[2] for run in runs)
+            print(f"{size:>7} {mode:<8} {cell_size / 1024:>10.1f} {kernel * 1000:>12.2f} {subkernel * 1000:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 from typing import TYPE_CHECKING, Any, Dict
@@ -9,6 +10,8 @@ from beaker_kernel.lib.subkernels.python import PythonSubkernel
 from beaker_kernel.lib.utils import intercept
 
 from .agent import ClimateDataUtilityAgent
+from askem_beaker.dataset_cache import get_dataset_cache
+from askem_beaker.hmi import get_hmi_client
 
 if TYPE_CHECKING:
     from beaker_kernel.kernel import LLMKernel
@@ -17,6 +20,17 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# How downloaded datasets are opened: `auto` chunks them with dask when it is installed in the subkernel, `none` always
+# uses xarray's own lazy loading
+DATASET_CHUNKS = ("auto", "none")
+
+# Serialization options `save_dataset_request` accepts, as they are rendered into the code the subkernel runs
+NETCDF_ENGINES = ("netcdf4", "scipy", "h5netcdf")
+NETCDF_ENCODING_KEYS = (
+    "zlib", "complevel", "shuffle", "fletcher32", "contiguous", "chunksizes", "dtype", "_FillValue", "units",
+    "calendar", "least_significant_digit",
+)
+
 
 class ClimateDataUtilityContext(BaseContext):
     slug = "climate_data_utility"
@@ -31,6 +45,15 @@ class ClimateDataUtilityContext(BaseContext):
         self.climate_data_utility__functions = {}
         self.config = config
         self.dataset_map = {}
+        self.hmi = get_hmi_client()
+        self.dataset_cache = get_dataset_cache()
+        # Cached files pinned for the session's datasets
+        self.pinned_paths = []
+        self.dataset_chunks = os.environ.get("CLIMATE_DATASET_CHUNKS", "auto")
+        if self.dataset_chunks not in DATASET_CHUNKS:
+            raise ValueError(
+                f"Unknown dataset chunking '{self.dataset_chunks}'. Expected one of: {', '.join(DATASET_CHUNKS)}"
+            )
         super().__init__(beaker_kernel, self.agent_cls, config)
         if not isinstance(self.subkernel, PythonSubkernel):
             raise ValueError("This context is only valid for Python.")
@@ -46,9 +69,12 @@ class ClimateDataUtilityContext(BaseContext):
             if dataset_id is None or filename is None:
                 logging.error(f"failed to download dataset from initial context: {dataset}")
                 return
-            await self.download_dataset(name, dataset_id, filename)
+            await self.download_dataset(name, dataset_id, filename, parent_header=parent_header)
 
     def reset(self):
+        for path in self.pinned_paths:
+            self.dataset_cache.unpin(path)
+        self.pinned_paths = []
         self.dataset_map = {}
 
     async def auto_context(self):
@@ -78,18 +104,70 @@ class ClimateDataUtilityContext(BaseContext):
             filename = f"{uuid}.nc"
         variable_name = content.get("variable_name") or "dataset_" + str(len(self.dataset_map))
 
-        await self.download_dataset(variable_name, uuid, filename)
+        await self.download_dataset(variable_name, uuid, filename, parent_header=message.header)
+
+    async def download_dataset(self, variable_name, hmi_dataset_id, filename, parent_header=None):
+        """
+        Fetches the dataset into the node's shared dataset cache, reporting progress with `download_progress`
+        messages, and opens it lazily in the subkernel, chunked as set by `CLIMATE_DATASET_CHUNKS`.
+        """
+        if parent_header is None:
+            parent_header = {}
+        self.dataset_map[variable_name] = {"id": hmi_dataset_id, "variable_name": variable_name}
+
+        loop = asyncio.get_running_loop()
+
+        def send_progress(transferred, total, done=False):
+            self.beaker_kernel.send_response(
+                "iopub",
+                "download_progress",
+                {
+                    "variable_name": variable_name,
+                    "id": hmi_dataset_id,
+                    "filename": filename,
+                    "bytes": transferred,
+                    "total": total,
+                    "done": done,
+                },
+                parent_header=parent_header,
+            )
+
+        download_url = await self.hmi.get_json(
+            f"datasets/{hmi_dataset_id}/download-url", params={"filename": filename}
+        )
+        cached = await asyncio.to_thread(
+            self.dataset_cache.fetch,
+            hmi_dataset_id,
+            filename,
+            download_url["url"],
+            # Called from the download thread, so the message is sent from the event loop
+            progress=lambda transferred, total: loop.call_soon_threadsafe(send_progress, transferred, total),
+        )
+        send_progress(cached.size, cached.size, done=True)
+        # xarray reads the file for as long as the dataset is open, so it is opened from a pinned copy that other
+        # kernels evicting or revalidating the shared entry can't remove or change
+        path = await asyncio.to_thread(self.dataset_cache.pin, cached.path)
+        self.pinned_paths.append(path)
+        self.dataset_map[variable_name].update(
+            {"path": path, "bytes": cached.size, "seconds": cached.seconds, "cached": cached.hit}
+        )
 
-    async def download_dataset(self, variable_name, hmi_dataset_id, filename):
         code = self.get_code(
             "hmi_dataset_download",
-            {"auth": self.get_auth(), "id": hmi_dataset_id, "filename": filename, "variable_name": variable_name},
+            {
+                "path": path,
+                "variable_name": variable_name,
+                "chunks": self.dataset_chunks,
+            },
         )
-
-        self.dataset_map[variable_name] = {"id": hmi_dataset_id, "variable_name": variable_name}
-        await self.beaker_kernel.execute(
-            code,
-            parent_header={},
+        open_response = await self.evaluate(code, parent_header=parent_header)
+        opened = open_response.get("return")
+        if opened is None:
+            raise Exception(f"Unable to open dataset '{hmi_dataset_id}' ({filename}): {open_response.get('error')}")
+        self.dataset_map[variable_name]["chunked"] = opened["chunked"]
+        logger.info(
+            f"Opened dataset '{hmi_dataset_id}' as '{variable_name}' "
+            f"{'chunked with dask' if opened['chunked'] else 'without dask chunking'}"
         )
 
     @intercept()
@@ -107,6 +185,7 @@ class ClimateDataUtilityContext(BaseContext):
             "hmi_create_dataset",
             {
                 "identifier": new_dataset_filename,
+                "auth": self.get_auth(),
             },
         )
         create_response = await self.evaluate(
@@ -128,6 +207,10 @@ class ClimateDataUtilityContext(BaseContext):
                 "id": id,
                 "filename": f"{new_dataset_filename}",
                 "auth": self.get_auth(),
+                # Optional serialization settings, e.g. {"complevel": 4} or a per-variable netCDF `encoding`
+                "engine": repr(self.netcdf_engine(content.get("engine"))),
+                "encoding": repr(self.netcdf_encoding(content.get("encoding") or {})),
+                "complevel": int(content.get("complevel") or 0),
             },
         )
 
@@ -136,10 +219,47 @@ class ClimateDataUtilityContext(BaseContext):
             parent_header={},
         )
 
-        persist_status = result.get("return")
+        persist_result = result.get("return") or {}
+        upload_stats = {key: persist_result.get(key) for key in ("bytes", "seconds", "bytes_per_second")}
+        logger.info(f"Uploaded dataset {id} ({new_dataset_filename}): {upload_stats}")
 
         self.beaker_kernel.send_response(
             "iopub",
             "save_dataset_response",
-            {"dataset_create_status": create_response_object, "file_upload_status": persist_status},
+            {
+                "dataset_create_status": create_response_object,
+                "file_upload_status": persist_result.get("message"),
+                "upload_stats": upload_stats,
+            },
         )
+
+    def netcdf_engine(self, engine):
+        """
+        Checks that `engine` is one of the `NETCDF_ENGINES` (or None for xarray's default).
+        """
+        if engine is not None and engine not in NETCDF_ENGINES:
+            raise ValueError(f"Unknown netCDF engine '{engine}'. Expected one of: {', '.join(NETCDF_ENGINES)}")
+        return engine
+
+    def netcdf_encoding(self, encoding):
+        """
+        Checks that `encoding` maps variable names to settings with keys from `NETCDF_ENCODING_KEYS` and plain values
+        (numbers, strings, booleans, None or lists of integers), so that it can be rendered as a literal.
+        """
+        if not isinstance(encoding, dict):
+            raise ValueError("The netCDF encoding must map variable names to their settings")
+        for var_name, settings in encoding.items():
+            if not isinstance(var_name, str) or not isinstance(settings, dict):
+                raise ValueError(f"Invalid netCDF encoding for variable {var_name!r}")
+            for key, value in settings.items():
+                if key not in NETCDF_ENCODING_KEYS:
+                    raise ValueError(
+                        f"Unknown netCDF encoding setting '{key}'. Expected one of: {', '.join(NETCDF_ENCODING_KEYS)}"
+                    )
+                if isinstance(value, list):
+                    valid = all(isinstance(item, int) and not isinstance(item, bool) for item in value)
+                else:
+                    valid = value is None or isinstance(value, (bool, int, float, str))
+                if not valid:
+                    raise ValueError(f"Invalid value for netCDF encoding setting '{key}' of {var_name!r}")
+        return encoding
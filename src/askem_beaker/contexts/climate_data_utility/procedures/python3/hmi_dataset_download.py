@@ -1,34 +1,14 @@
-import logging
-import os
-from io import BytesIO
-from json import JSONDecodeError
-
-import requests
 import xarray
-
-logger = logging.getLogger(__name__)
-
-# Get the HMI_SERVER endpoint from the environment variable
-hmi_server = os.getenv("HMI_SERVER_URL")
-
-# Define the id
-id = "{{id}}"
-
-# Prepare the request URL
-url = f"{hmi_server}/datasets/{id}/download-file?filename={{filename}}"
-
-# Make the HTTP GET request to retrieve the dataset
-response = requests.get(url, auth={{auth}}, stream=True)
-
-# Check the response status code
-if response.status_code <= 300:
-    message = f"Dataset retrieved successfully with status code {response.status_code}."
-    logger.info(response.content)
-else:
-    message = f"Dataset retrieval failed with status code {response.status_code}."
-    if response.text:
-        message += f" Response message: {response.text}"
-    logger.error(message)
-
-
-{{variable_name}} = xarray.open_dataset(BytesIO(response.content))
+{%- if chunks == "auto" %}
+# Open lazily from the shared dataset cache, chunked with dask when it is installed
+try:
+    import dask
+    _chunks = {}
+except ImportError:
+    _chunks = None
+{%- else %}
+# Open lazily from the shared dataset cache with xarray's own lazy loading
+_chunks = None
+{%- endif %}
+{{variable_name}} = xarray.open_dataset("{{path}}", chunks=_chunks)
+{"chunked": _chunks is not None}
@@ -1,31 +1,97 @@
+import io
 import os
+import shutil
+import tempfile
+import time
+import uuid
 import requests
 
 from json import JSONDecodeError
 
-# Binary data bytes
-file_bytes = {{data}}  # Replace with your binary data
 
-if not isinstance(file_bytes, bytes):
-    file_bytes = file_bytes.to_netcdf()
+class _MultipartFileBody:
+    """
+    File-like multipart/form-data body that streams the file part from disk instead of building the whole request in
+    memory. Its length is known up front so the upload is sent with a Content-Length rather than chunked.
+    """
 
-# Get the HMI_SERVER endpoint and auth token from the environment variable
-hmi_server = os.getenv('HMI_SERVER_URL')
+    def __init__(self, fields, file_field, filename, path):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        head = "".join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+        )
+        head += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        )
+        tail = f"\r\n--{boundary}--\r\n".encode()
+        self._parts = [io.BytesIO(head.encode()), open(path, "rb"), io.BytesIO(tail)]
+        self._length = len(head.encode()) + os.path.getsize(path) + len(tail)
+        self.bytes_sent = 0
 
-# Define the id and filename dynamically
-id = "{{id}}"
-filename = "{{filename}}"
+    def __len__(self):
+        return self._length
 
-# Prepare the request payload
-payload = {'id': id, 'filename': filename}
-files = {'file': file_bytes}
+    def read(self, size=-1):
+        chunk = b""
+        while self._parts and (size < 0 or len(chunk) < size):
+            data = self._parts[0].read(-1 if size < 0 else size - len(chunk))
+            if not data:
+                self._parts.pop(0).close()
+                continue
+            chunk += data
+        self.bytes_sent += len(chunk)
+        return chunk
 
-# Set the headers with the content type
-# headers = {}
+    def close(self):
+        for part in self._parts:
+            part.close()
+        self._parts = []
 
-# Make the HTTP PUT request to upload the file bytes
-url = f'{hmi_server}/datasets/{id}/upload-file'
-response = requests.put(url, data=payload, files=files, auth={{auth}})
+
+# Dataset (or binary data bytes) to upload
+_dataset = {{data}}
+
+# Serialization options: an explicit per-variable `encoding`, or a zlib `complevel` applied to every data variable
+_engine = {{ engine|default("None") }}
+_encoding = {{ encoding|default("{}") }}
+_complevel = {{ complevel|default(0) }}
+
+_temp_dir = tempfile.mkdtemp(prefix="beaker-netcdf-")
+_temp_path = os.path.join(_temp_dir, "upload.nc")
+try:
+    # Serialize to a temporary file on disk so the dataset is never held in memory as one bytes object
+    if isinstance(_dataset, bytes):
+        with open(_temp_path, "wb") as _temp_file:
+            _temp_file.write(_dataset)
+    else:
+        if _complevel and not _encoding:
+            _encoding = {var: {"zlib": True, "complevel": _complevel} for var in _dataset.data_vars}
+        _dataset.to_netcdf(_temp_path, engine=_engine, encoding=_encoding or None)
+
+    # Get the HMI_SERVER endpoint and auth token from the environment variable
+    hmi_server = os.getenv('HMI_SERVER_URL')
+
+    # Define the id and filename dynamically
+    id = "{{id}}"
+    filename = "{{filename}}"
+
+    # Prepare the request payload
+    payload = {'id': id, 'filename': filename}
+    _body = _MultipartFileBody(payload, "file", filename, _temp_path)
+
+    # Make the HTTP PUT request, streaming the file from disk
+    url = f'{hmi_server}/datasets/{id}/upload-file'
+    _start = time.perf_counter()
+    try:
+        response = requests.put(url, data=_body, headers={"Content-Type": _body.content_type}, auth={{auth}})
+    finally:
+        _body.close()
+    _seconds = time.perf_counter() - _start
+finally:
+    shutil.rmtree(_temp_dir, ignore_errors=True)
 
 # Check the response status code
 if response.status_code < 300:
@@ -38,4 +104,9 @@ else:
     if response.text:
         message += f' Response message: {response.text}'
 
-message
+{
+    "message": message,
+    "bytes": _body.bytes_sent,
+    "seconds": round(_seconds, 3),
+    "bytes_per_second": round(_body.bytes_sent / _seconds) if _seconds else None,
+}
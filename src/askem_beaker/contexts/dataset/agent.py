@@ -1,6 +1,7 @@
 import json
 import logging
 import re
+from typing import Optional
 
 from archytas.react import Undefined
 from archytas.tool_utils import AgentRef, LoopControllerRef, tool
@@ -37,8 +38,18 @@ class DatasetAgent(BaseAgent):
         # set up the agent
         # str: Valid and correct python code that fulfills the user's request.
         var_sections = []
-        for var_name, dataset_obj in agent.context.asset_map.items():
+        for var_name, dataset_obj in agent.context.loaded_frames().items():
             df_info = await agent.context.describe_dataset(var_name)
+            if dataset_obj.get("lazy"):
+                var_sections.append(f"""
+You have access to a variable name `{var_name}` that is a lazily loaded `pyarrow.dataset.Dataset`, not a dataframe. It may be larger than memory, so never read all of it at once (e.g. with `{var_name}.to_table()` or `{var_name}.to_table().to_pandas()`).
+Instead, read only the columns and rows you need by passing `columns=[...]` and a `filter=` expression built with `pyarrow.dataset.field(...)` to `{var_name}.to_table(...)`, process it in chunks with `{var_name}.to_batches(columns=[...])` and combine the per-batch results (e.g. partial sums and counts), or look at a few rows with `{var_name}.head(n)`.
+`{var_name}` is read-only: store any transformed or aggregated results in new variables, converting them to Pandas only once they are small.
+It has the following structure:
+{df_info}
+--- End description of variable `{var_name}`
+""")
+                continue
             var_sections.append(f"""
 You have access to a variable name `{var_name}` that is a {agent.context.metadata.get("df_lib_name", "Pandas")} Dataframe with the following structure:
 {df_info}
@@ -71,3 +82,37 @@ No addtional text is needed in the response, just the code block.
             }
         )
         return result
+
+    @tool()
+    async def run_sql(self, query: str, agent: AgentRef, result_var: Optional[str] = None) -> str:
+        """
+        Runs a SQL query over the loaded datasets and returns the first rows of the result.
+
+        Use this tool to answer questions that filter, group, join or aggregate the datasets. The query runs in an
+        embedded DuckDB database that reads the datasets in place, using every core, so it is much faster than
+        generating code that copies whole dataframes. Each dataset is a table with the same name as its variable
+        (e.g. `SELECT location, avg(value) FROM df GROUP BY location`). Use DuckDB's SQL dialect.
+        Only a single SELECT statement can be run, and it can't read files or change the datasets.
+
+        Only a limited number of rows are returned, so aggregate or filter the data down in the query rather than
+        selecting whole tables.
+
+        Args:
+            query (str): The SQL query to run.
+            result_var (str): Optional. The name of a new variable to store the whole result in as a dataframe, if the
+                user wants to keep working with it in the notebook.
+
+        Returns:
+            str: The result's columns and rows, or the error raised by the query.
+        """
+        try:
+            result = await agent.context.run_sql(query, result_var=result_var)
+        except ValueError as e:
+            return f"The query was rejected: {e}"
+        if result.get("error"):
+            return f"The query failed: {result['error']}"
+        columns = ", ".join(f"{column} ({column_type})" for column, column_type in zip(result["columns"], result["types"]))
+        rows = "\n".join(json.dumps(row) for row in result["rows"])
+        truncated = f" (only the first {len(result['rows'])} rows are shown)" if result["truncated"] else ""
+        stored = f"\nThe whole result was stored in the variable `{result_var}`." if result_var else ""
+        return f"Columns: {columns}\nRows{truncated}:\n{rows}\nThe query took {result['seconds']}s.{stored}"
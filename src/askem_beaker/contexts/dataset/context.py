@@ -1,16 +1,25 @@
-import codecs
+import asyncio
 import copy
 import datetime
+import hashlib
+import json
+import math
 import os
-import requests
+import re
+import time
 from base64 import b64encode
 from typing import TYPE_CHECKING, Any, Dict
 
+import duckdb
+from requests import HTTPError
+
 from beaker_kernel.lib.context import BaseContext
-from beaker_kernel.lib.utils import intercept
+from beaker_kernel.lib.utils import env_enabled, intercept
 
 from .agent import DatasetAgent
-from askem_beaker.utils import get_auth
+from askem_beaker.dataset_cache import get_dataset_cache
+from askem_beaker.hmi import get_hmi_client
+from askem_beaker.utils import gather_with_limit, get_auth, send_response_with_buffers
 
 if TYPE_CHECKING:
     from beaker_kernel.kernel import LLMKernel
@@ -20,6 +29,70 @@ if TYPE_CHECKING:
 import logging
 logger = logging.getLogger(__name__)
 
+# Object stores cap a multipart upload at 10,000 parts
+MAX_UPLOAD_PARTS = 10_000
+PREVIEW_ENCODINGS = ("json", "arrow")
+DOWNLOAD_FORMATS = ("csv", "csv.gz", "parquet")
+# Formats `df_stage` can save a dataframe as, with the content type and file extension of each
+SAVE_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "csv.gz": ("application/gzip", ".csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", ".arrow"),
+}
+# Compression codecs for each save format, the first being the default
+SAVE_COMPRESSIONS = {"parquet": ("snappy", "zstd", "gzip", "none"), "arrow": ("lz4", "zstd", "none")}
+# SQL queries must start, after any comments or opening parentheses, with one of these keywords
+SQL_QUERY_PATTERN = re.compile(
+    r"^\s*(?:(?:--[^\n]*\n|/\*.*?\*/)\s*)*[(\s]*(select|with|from)\b", re.IGNORECASE | re.DOTALL
+)
+# Default for the fraction of distinct values at or below which `downcast_dataset_request` turns a string column
+# categorical
+DOWNCAST_CATEGORICAL_RATIO = 0.5
+# Formats that can be opened lazily, as a pyarrow dataset in the Python subkernel
+LAZY_FORMATS = ("csv", "csv.gz", "csv.zst", "parquet", "feather")
+# File extensions, longest first, and the format `load_df` reads them as
+LOAD_FORMATS = {
+    ".csv.gz": "csv.gz",
+    ".csv.zst": "csv.zst",
+    ".parquet": "parquet",
+    ".feather": "feather",
+    ".arrow": "feather",
+    ".xlsx": "excel",
+    ".csv": "csv",
+    ".gz": "csv.gz",
+    ".zst": "csv.zst",
+    ".pq": "parquet",
+    ".ipc": "feather",
+    ".xls": "excel",
+}
+# HMI dataset column types and the type hint `load_df` reads the column as
+COLUMN_TYPE_HINTS = {
+    "BOOLEAN": "bool",
+    "STRING": "string",
+    "CHAR": "string",
+    "INT": "int",
+    "INTEGER": "int",
+    "FLOAT": "float",
+    "DOUBLE": "float",
+    "DATE": "datetime",
+    "DATETIME": "datetime",
+    "TIMESTAMP": "datetime",
+}
+# The type hints `df_stage` reports for a staged frame's columns and the HMI dataset column type of each
+HMI_COLUMN_TYPES = {"bool": "BOOLEAN", "string": "STRING", "int": "INT", "float": "FLOAT", "datetime": "DATETIME"}
+
+
+def detect_format(filename: str) -> str:
+    """
+    Returns the `load_df` format for a file from its extension, defaulting to `csv`.
+    """
+    filename = filename.lower()
+    for extension, file_format in LOAD_FORMATS.items():
+        if filename.endswith(extension):
+            return file_format
+    return "csv"
+
 
 class DatasetContext(BaseContext):
 
@@ -27,7 +100,40 @@ class DatasetContext(BaseContext):
 
     def __init__(self, beaker_kernel: "LLMKernel", config: Dict[str, Any]) -> None:
         self.auth = get_auth()
+        self.hmi = get_hmi_client()
+        self.dataset_cache = get_dataset_cache()
+        # Cached files pinned for the session's lazily opened datasets
+        self.pinned_paths = []
         self.asset_map = {}
+        self.load_errors = {}
+        self.load_concurrency = int(os.environ.get("DATASET_LOAD_CONCURRENCY", 4))
+        # Dataframes with more rows than this are profiled from a sample; 0 always profiles the full frame
+        self.profile_row_budget = int(os.environ.get("DATASET_PROFILE_ROW_BUDGET", 250_000))
+        # Files of at least this many bytes are opened lazily; 0 only opens assets that ask for it lazily
+        self.lazy_threshold = int(os.environ.get("DATASET_LAZY_THRESHOLD", 0))
+        self.sql_max_rows = int(os.environ.get("DATASET_SQL_MAX_ROWS", 200))
+        # Total bytes the session's dataframes may use before a warning is sent; 0 disables the warning
+        self.memory_budget = int(os.environ.get("DATASET_MEMORY_BUDGET", 0))
+        self.memory_frames = {}
+        self.memory_over_budget = False
+        self.download_chunk_size = int(os.environ.get("DATASET_DOWNLOAD_CHUNK_SIZE", 1024 * 1024))
+        self.preview_encoding = os.environ.get("DATASET_PREVIEW_ENCODING", "json")
+        # Seconds without a cell finishing before previews are refreshed, so bursts of executions are coalesced
+        self.preview_debounce = float(os.environ.get("DATASET_PREVIEW_DEBOUNCE", 0.25))
+        self.preview_generation = 0
+        self.preview_requested = 0.0
+        self.preview_parent_header = {}
+        self.preview_task = None
+        self.preview_versions = {}
+        if self.preview_encoding not in PREVIEW_ENCODINGS:
+            raise ValueError(
+                f"Unknown preview encoding '{self.preview_encoding}'. Expected one of: {', '.join(PREVIEW_ENCODINGS)}"
+            )
+        self.pending_uploads = {}
+        self.multipart_threshold = int(os.environ.get("DATASET_MULTIPART_THRESHOLD", 64 * 1024 * 1024))
+        self.upload_part_size = int(os.environ.get("DATASET_UPLOAD_PART_SIZE", 16 * 1024 * 1024))
+        self.upload_concurrency = int(os.environ.get("DATASET_UPLOAD_CONCURRENCY", 4))
+        self.upload_retries = int(os.environ.get("DATASET_UPLOAD_RETRIES", 3))
         super().__init__(beaker_kernel, self.agent_cls, config)
 
     async def setup(self, context_info: dict, parent_header):
@@ -35,91 +141,292 @@ class DatasetContext(BaseContext):
         await self.set_assets(self.config["context_info"], parent_header=parent_header)
 
     async def post_execute(self, message):
-        await self.update_asset_map(parent_header=message.parent_header)
-        await self.send_df_preview_message(parent_header=message.parent_header)
+        self.preview_generation += 1
+        self.preview_requested = time.monotonic()
+        self.preview_parent_header = message.parent_header
+        # A single task refreshes the previews for a whole burst of executions
+        if self.preview_task is None or self.preview_task.done():
+            self.preview_task = asyncio.create_task(self.refresh_previews())
+
+    async def refresh_previews(self):
+        """
+        Refreshes the dataframe summaries and sends updated previews once no other cell has finished within
+        `DATASET_PREVIEW_DEBOUNCE` seconds, and again if another cell finishes while refreshing. A failed refresh is
+        reported to the frontend with a `dataset_preview_error` message.
+        """
+        while True:
+            while (wait := self.preview_requested + self.preview_debounce - time.monotonic()) > 0:
+                await asyncio.sleep(wait)
+            generation = self.preview_generation
+            parent_header = self.preview_parent_header
+            try:
+                await self.update_asset_map(parent_header=parent_header)
+                await self.send_df_preview_message(parent_header=parent_header)
+            except Exception as e:
+                logger.exception("Unable to refresh dataset previews")
+                self.beaker_kernel.send_response(
+                    "iopub", "dataset_preview_error", {"ename": type(e).__name__, "evalue": str(e)},
+                    parent_header=parent_header,
+                )
+            if generation == self.preview_generation:
+                return
 
     async def set_assets(self, assets, parent_header={}):
-        self.asset_map = assets
+        self.asset_map = {}
+        self.load_errors = {}
+        self.preview_versions = {}
         for var_name, asset_item in assets.items():
             if isinstance(asset_item, str):
-                asset_id = asset_item
-                asset_type = "dataset"
                 self.asset_map[var_name] = {
-                    "id": asset_id,
-                    "asset_type": asset_type,
+                    "id": asset_item,
+                    "asset_type": "dataset",
                 }
             elif isinstance(asset_item, dict):
-                asset_id = asset_item["id"]
-                asset_type = asset_item.get("asset_type", "dataset")
+                self.asset_map[var_name] = asset_item
             else:
                 raise ValueError("Unable to parse dataset mapping")
 
-            meta_url = f"{os.environ['HMI_SERVER_URL']}/{asset_type}s/{asset_id}"
-            asset_info_req = requests.get(meta_url, auth=self.auth.requests_auth())
-            if asset_info_req.status_code == 404:
-                raise Exception(f"Dataset '{asset_id}' not found.")
-            asset_info = asset_info_req.json()
-            if asset_info:
-                self.asset_map[var_name]["info"] = asset_info
+        # Metadata lookup and download url resolution are pipelined per asset, with all assets fetched concurrently.
+        var_names = list(self.asset_map.keys())
+        sources = await gather_with_limit(
+            self.load_concurrency,
+            *(self.fetch_asset(var_name) for var_name in var_names),
+            return_exceptions=True,
+        )
+        var_map = {}
+        for var_name, source in zip(var_names, sources):
+            if isinstance(source, Exception):
+                self.load_errors[var_name] = str(source)
+                del self.asset_map[var_name]
             else:
-                raise Exception(f"{asset_type.capitalize()} '{asset_id}' not able to be loaded.")
-        await self.load_dataframes()
-        await self.send_df_preview_message(parent_header=parent_header)
+                var_map[var_name] = source
 
-    async def load_dataframes(self):
-        var_map = {}
-        for var_name, df_obj in self.asset_map.items():
-            asset_type = df_obj.get("asset_type", "dataset")
+        if var_map:
+            await self.load_dataframes(var_map)
+        await self.send_df_preview_message(parent_header=parent_header, snapshot=True)
+        if self.load_errors:
+            self.send_load_errors(parent_header=parent_header)
 
-            if asset_type != "dataset":
-                filename = df_obj["info"].get("resultFiles", [])[0]
-            else:
-                filename = df_obj["info"].get("fileNames", [])[0]
+    async def fetch_asset(self, var_name) -> dict:
+        """
+        Fetches the HMI metadata for an asset and resolves how to load it: the `url` (a path in the node's shared
+        dataset cache) its data can be read from, its file `format` and type hints (`dtypes`) for the columns the
+        metadata describes.
 
-            meta_url = f"{os.environ['HMI_SERVER_URL']}/{asset_type}s/{df_obj['id']}"
-            url = f"{meta_url}/download-url?filename={filename}"
-            data_url_req = requests.get(
-                url=url,
-                auth=self.auth.requests_auth(),
-            )
-            data_url = data_url_req.json().get("url", None)
-            var_map[var_name] = data_url
+        The asset mapping may set `format` or `dtypes` explicitly to override what is derived from the metadata, and
+        `lazy` to open the file out of core (see `is_lazy`).
+        """
+        asset = self.asset_map[var_name]
+        asset_id = asset["id"]
+        asset_type = asset.get("asset_type", "dataset")
+
+        try:
+            asset_info = await self.hmi.get_cached_json(f"{asset_type}s/{asset_id}")
+        except HTTPError as e:
+            if e.response.status_code == 404:
+                raise Exception(f"Dataset '{asset_id}' not found.")
+            raise
+        if not asset_info:
+            raise Exception(f"{asset_type.capitalize()} '{asset_id}' not able to be loaded.")
+        asset["info"] = asset_info
+
+        if asset_type != "dataset":
+            filename = asset_info.get("resultFiles", [])[0]
+        else:
+            filename = asset_info.get("fileNames", [])[0]
+
+        data_url_req = await self.hmi.get(
+            f"{asset_type}s/{asset_id}/download-url",
+            params={"filename": filename},
+        )
+        data_url = data_url_req.json().get("url", None)
+        if not data_url:
+            raise Exception(f"Unable to resolve download url for {asset_type} '{asset_id}' ({filename}).")
+
+        cached = await asyncio.to_thread(self.dataset_cache.fetch, asset_id, filename, data_url)
+        logger.info(
+            f"{'Reused cached' if cached.hit else 'Downloaded'} {asset_type} '{asset_id}' ({filename}, "
+            f"{cached.size} bytes) in {cached.seconds}s"
+        )
+
+        dtypes = {
+            column["name"]: COLUMN_TYPE_HINTS[column.get("dataType")]
+            for column in asset_info.get("columns") or []
+            if column.get("name") and column.get("dataType") in COLUMN_TYPE_HINTS
+        }
+        file_format = asset.get("format") or detect_format(filename)
+        lazy = self.is_lazy(var_name, file_format, cached.size)
+        path = cached.path
+        if lazy:
+            # A lazy dataset reads its file for as long as it is open, so it is opened from a pinned copy that other
+            # kernels evicting or revalidating the shared entry can't remove or change
+            path = await asyncio.to_thread(self.dataset_cache.pin, cached.path)
+            self.pinned_paths.append(path)
+        return {
+            "url": path,
+            "format": file_format,
+            "dtypes": {**dtypes, **asset.get("dtypes", {})},
+            "lazy": lazy,
+        }
+
+    def is_lazy(self, var_name, file_format, size) -> bool:
+        """
+        Whether an asset is opened lazily, as a `pyarrow.dataset.Dataset` that is scanned on demand, rather than read
+        into memory. Assets are opened lazily if their mapping sets `lazy`, or if they are at least
+        `DATASET_LAZY_THRESHOLD` bytes and the mapping doesn't set `lazy` to false. Lazy loading is only available in
+        Python and for the `LAZY_FORMATS`; other assets are read into memory.
+        """
+        lazy = self.asset_map[var_name].get("lazy")
+        if lazy is None:
+            lazy = bool(self.lazy_threshold) and size >= self.lazy_threshold
+        if lazy and (self.lang != "python3" or file_format not in LAZY_FORMATS):
+            logger.warning(f"Unable to open '{var_name}' ({file_format}) lazily in {self.lang}, reading it into memory.")
+            return False
+        return lazy
+
+    async def load_dataframes(self, var_map):
+        """
+        Loads each dataset in `var_map`, a mapping of variable name to the source returned by `fetch_asset`, into the
+        subkernel. Subkernels pick the fastest parser they have available for the source's format.
+        """
         command = "\n".join(
             [
                 self.get_code("setup"),
-                self.get_code("load_df", {"var_map": var_map, "auth": self.auth}),
+                self.get_code("load_df", {
+                    "var_map": var_map,
+                    "auth": self.auth,
+                    "concurrency": self.load_concurrency,
+                }),
             ]
         )
-        await self.execute(command)
+        load_response = await self.evaluate(command)
+        # Each subkernel returns a mapping of variable name to error message for any dataframes that failed to load.
+        for var_name, error in (load_response.get("return") or {}).items():
+            self.load_errors[var_name] = error
+            self.asset_map.pop(var_name, None)
         await self.update_asset_map()
 
+    def send_load_errors(self, parent_header={}):
+        for var_name, error in self.load_errors.items():
+            logger.error(f"Unable to load dataset into variable '{var_name}': {error}")
+        self.beaker_kernel.send_response(
+            "iopub", "error", {
+                "ename": "DatasetLoadError",
+                "evalue": f"Unable to load {len(self.load_errors)} dataset(s): {', '.join(self.load_errors.keys())}",
+                "traceback": [f"{var_name}: {error}" for var_name, error in self.load_errors.items()],
+            }, parent_header=parent_header
+        )
+
     def reset(self):
+        if self.preview_task is not None:
+            self.preview_task.cancel()
+            self.preview_task = None
+        for path in self.pinned_paths:
+            self.dataset_cache.unpin(path)
+        self.pinned_paths = []
         self.asset_map = {}
+        self.load_errors = {}
+        self.memory_frames = {}
+        self.memory_over_budget = False
+        self.preview_versions = {}
+        self.pending_uploads = {}
 
     async def send_df_preview_message(
-        self, server=None, target_stream=None, data=None, parent_header={}
+        self, server=None, target_stream=None, data=None, parent_header={}, snapshot=False
     ):
-        preview = {
-            var_name: {
+        """
+        Sends the previews of the session's dataframes. Each preview has a `version`, which increases whenever it
+        changes. A `snapshot` is sent as a `dataset` message with every preview. Otherwise only the previews that were
+        added or changed since the last message are sent, in the `updated` field of a `dataset_update` message, along
+        with the names of any `removed` dataframes; nothing is sent if nothing changed.
+
+        The message metadata's `encoding` is `json` when every preview's rows are in its `csv` field, or `arrow` when
+        previews may instead reference (by `buffer`) an Arrow IPC stream attached to the message as a binary buffer.
+        Each preview carries the frame's `memory` use and the metadata's `memory` the session's total against the
+        budget.
+        """
+        updated = {}
+        buffers = []
+        frames = self.loaded_frames()
+        for var_name, df in frames.items():
+            preview = {
                 "name": df.get("name"),
                 "headers": df.get("columns"),
-                "csv": df.get("head"),
+                "memory": df.get("memory"),
             }
-            for var_name, df in self.asset_map.items()
-        }
-        self.beaker_kernel.send_response(
-            "iopub", "dataset", preview, parent_header=parent_header
-        )
+            arrow = df.get("preview_arrow")
+            if arrow is None:
+                preview["csv"] = df.get("head")
+            digest = hashlib.sha256(json.dumps(preview, sort_keys=True, default=str).encode())
+            if arrow is not None:
+                digest.update(arrow)
+            digest = digest.hexdigest()
+            previous_digest, version = self.preview_versions.get(var_name, (None, 0))
+            if digest != previous_digest:
+                version += 1
+                self.preview_versions[var_name] = (digest, version)
+            elif not snapshot:
+                continue
+            preview["version"] = version
+            if arrow is not None:
+                preview["buffer"] = len(buffers)
+                buffers.append(arrow)
+            updated[var_name] = preview
+        removed = [var_name for var_name in self.preview_versions if var_name not in frames]
+        for var_name in removed:
+            del self.preview_versions[var_name]
+
+        metadata = {"encoding": self.preview_encoding, "memory": self.memory_usage()}
+        if snapshot:
+            send_response_with_buffers(
+                self.beaker_kernel, "iopub", "dataset", updated,
+                buffers=buffers, metadata=metadata, parent_header=parent_header,
+            )
+        elif updated or removed:
+            send_response_with_buffers(
+                self.beaker_kernel, "iopub", "dataset_update", {"updated": updated, "removed": removed},
+                buffers=buffers, metadata=metadata, parent_header=parent_header,
+            )
         return data
 
+    @intercept()
+    async def dataset_snapshot_request(self, message):
+        """
+        Refreshes the dataframe summaries and sends every preview in a `dataset` message.
+        """
+        await self.update_asset_map(parent_header=message.header)
+        await self.send_df_preview_message(parent_header=message.header, snapshot=True)
+
     async def update_asset_map(self, parent_header={}):
-        code = self.get_code("df_info")
+        code = self.get_code("df_info", {
+            "row_budget": self.profile_row_budget,
+            "preview_encoding": self.preview_encoding,
+            "transfer_dir": os.environ.get("BEAKER_TRANSFER_DIR", ""),
+        })
         df_info_response = await self.evaluate(
             code,
             parent_header=parent_header,
         )
         df_info = df_info_response.get('return')
+        # Forget user created dataframes that have been deleted from the session. Assets from HMI keep their entry, as
+        # they may still be loading or be loaded again, but are marked as not loaded.
+        for var_name in set(self.asset_map) - set(df_info):
+            if "id" in self.asset_map[var_name]:
+                self.asset_map[var_name]["loaded"] = False
+            else:
+                del self.asset_map[var_name]
         for var_name, info in df_info.items():
+            # Arrow previews are handed over in a transfer file, which is read once and removed
+            preview_path = info.pop("preview_path", None)
+            if preview_path:
+                with open(preview_path, "rb") as preview_file:
+                    info["preview_arrow"] = preview_file.read()
+                os.remove(preview_path)
+                info["head"] = None
+            else:
+                info["preview_arrow"] = None
+            info.setdefault("lazy", False)
+            info["loaded"] = True
             if var_name in self.asset_map:
                 self.asset_map[var_name].update(info)
             else:
@@ -128,6 +435,38 @@ class DatasetContext(BaseContext):
                     "description": "",
                     **info,
                 }
+        self.memory_frames = {var_name: (info.get("memory") or {}).get("bytes", 0) for var_name, info in df_info.items()}
+        self.check_memory_budget(parent_header=parent_header)
+
+    def loaded_frames(self) -> dict:
+        """
+        Returns the entries of the asset map for the dataframes currently in the session, leaving out assets that
+        haven't been loaded (yet) or have been deleted.
+        """
+        return {var_name: info for var_name, info in self.asset_map.items() if info.get("loaded")}
+
+    def memory_usage(self) -> dict:
+        """
+        Returns the bytes used by each of the session's dataframes, their total and the `DATASET_MEMORY_BUDGET`.
+        """
+        total = sum(self.memory_frames.values())
+        return {
+            "bytes": total,
+            "budget": self.memory_budget or None,
+            "over_budget": bool(self.memory_budget) and total > self.memory_budget,
+            "frames": self.memory_frames,
+        }
+
+    def check_memory_budget(self, parent_header={}):
+        """
+        Sends a `dataset_memory_warning` when the session's dataframes grow past the memory budget. The warning is sent
+        again only once usage has dropped back under the budget and exceeded it again.
+        """
+        usage = self.memory_usage()
+        if usage["over_budget"] and not self.memory_over_budget:
+            logger.warning(f"Dataframes use {usage['bytes']} bytes, over the budget of {self.memory_budget} bytes")
+            self.beaker_kernel.send_response("iopub", "dataset_memory_warning", usage, parent_header=parent_header)
+        self.memory_over_budget = usage["over_budget"]
 
     async def auto_context(self):
         intro = f"""
@@ -135,12 +474,15 @@ You are an analyst whose goal is to help with scientific data analysis and manip
 
 You are working with the following dataset(s):
 """
+        sql_hint = ""
+        if self.TOOL_ENABLED_RUN_SQL:
+            sql_hint = "To answer questions that filter, group, join or aggregate the datasets, use the run_sql tool.\n"
         outro = f"""
 Please answer any user queries to the best of your ability, but do not guess if you are not sure of an answer.
-If you are asked to manipulate or visualize the dataset, use the generate_code tool.
+{sql_hint}If you are asked to manipulate or visualize the dataset, use the generate_code tool.
 """
         dataset_blocks = []
-        for var_name, dataset_obj in self.asset_map.items():
+        for var_name, dataset_obj in self.loaded_frames().items():
             dataset_info = dataset_obj.get("info", {})
             dataset_description = await self.describe_dataset(var_name)
             dataset_blocks.append(f"""
@@ -170,12 +512,29 @@ The dataset has the following structure:
         # Update the local dataframe to match what's in the shell.
         # This will be factored out when we switch around to allow using multiple runtimes.
 
-        df_info = self.asset_map.get(var_name, None)
+        df_info = self.loaded_frames().get(var_name, None)
         if not df_info:
             return None
-        output = f"""
+        if df_info.get("statistics_mode") == "sampled":
+            statistics_label = f"Statistics (approximate, sampled from {df_info['sample_rows']:,} of {df_info['rows']:,} rows)"
+        elif df_info.get("statistics_mode") == "scanned":
+            statistics_label = f"Statistics (approximate, from the first {df_info['sample_rows']:,} rows)"
+        else:
+            statistics_label = "Statistics"
+        output = ""
+        memory = df_info.get("memory")
+        if memory and not df_info.get("lazy"):
+            output = f"""
+Memory usage: {memory['bytes'] / 1024 ** 2:,.1f} MB{" (estimated)" if memory.get("estimated") else ""}
+"""
+        if df_info.get("lazy"):
+            rows = f"{df_info['rows']:,} rows" if df_info.get("rows") is not None else "an unknown number of rows"
+            output = f"""
+Lazily loaded dataset with {rows}. Only the rows below have been read.
+"""
+        output += f"""
 Dataframe head:
-{df_info["head"][:15]}
+{self.preview_rows(df_info)[:15]}
 
 
 Columns:
@@ -186,86 +545,474 @@ datatypes:
 {df_info["datatypes"]}
 
 
-Statistics:
+{statistics_label}:
 {df_info["statistics"]}
 """
         return output
 
+    @property
+    def TOOL_ENABLED_RUN_SQL(self) -> bool:
+        # The agent's `run_sql` tool is only offered when enabled with TOOL_ENABLED_RUN_SQL=true
+        return env_enabled("TOOL_ENABLED_RUN_SQL")
+
+    def check_sql_query(self, query) -> str:
+        """
+        Checks that `query` is a single SELECT statement (which may start with WITH or, in DuckDB's dialect, FROM),
+        returning it without trailing semicolons. Raises a `ValueError` for anything else.
+        """
+        try:
+            statements = duckdb.extract_statements(query)
+        except duckdb.Error as e:
+            raise ValueError(f"Unable to parse the SQL query: {e}")
+        if (
+            len(statements) != 1
+            or statements[0].type != duckdb.StatementType.SELECT
+            or not SQL_QUERY_PATTERN.match(query)
+        ):
+            raise ValueError("Only a single SELECT statement can be run")
+        return query.strip().rstrip(";").rstrip()
+
+    async def run_sql(self, query, max_rows=None, result_var=None, parent_header={}) -> dict:
+        """
+        Runs a read-only SQL query with the subkernel's embedded DuckDB database, in which every dataframe (and lazily
+        loaded dataset) is a table named after its variable. Returns at most `max_rows` rows of the result along with
+        its `columns`, their `types` and whether the result was `truncated`, or the `error` raised by the query. If
+        `result_var` is given the whole result is also stored in the session as a dataframe of that name.
+
+        Only a single SELECT statement is accepted (see `check_sql_query`), and the database is opened without access
+        to files, the network or extensions, so a query can only read the session's tables.
+        """
+        if result_var is not None and not result_var.isidentifier():
+            raise ValueError(f"'{result_var}' is not a valid variable name")
+        query = self.check_sql_query(query)
+        code = self.get_code("sql_query", {
+            "query": query,
+            "max_rows": int(max_rows or self.sql_max_rows),
+            "result_var": result_var,
+        })
+        sql_response = await self.evaluate(code, parent_header=parent_header)
+        result = sql_response.get("return")
+        if result is None:
+            raise Exception(f"Unable to run SQL query: {sql_response.get('error')}")
+        return result
+
+    def preview_rows(self, df_info) -> list:
+        """
+        Returns the preview of a dataframe as a list of rows, the first being the column names.
+        """
+        if df_info.get("preview_arrow") is None:
+            return df_info["head"]
+        import pyarrow as pa
+        table = pa.ipc.open_stream(df_info["preview_arrow"]).read_all()
+        return [table.column_names] + [list(row.values()) for row in table.to_pylist()]
+
+    @intercept(default_payload="{}")
+    async def downcast_dataset_request(self, message):
+        """
+        Shrinks dataframes in place with conversions that keep every value: integers to the narrowest integer type
+        that holds them, floats to 32 bits where no value changes and string columns with few distinct values to
+        categoricals. `var_names` selects the dataframes (default all of them) and `categorical_ratio` the most
+        distinct values per row a string column may have to become categorical. Returns the bytes used before and
+        after and the conversions made for each dataframe, with the total bytes saved.
+        """
+        content = message.content
+        var_names = content.get("var_names")
+        if var_names is not None:
+            unknown = [var_name for var_name in var_names if var_name not in self.loaded_frames()]
+            if unknown:
+                raise ValueError(f"Unknown dataframe(s): {', '.join(unknown)}")
+            var_names = [var_name for var_name in var_names if not self.asset_map[var_name].get("lazy")]
+        code = self.get_code("df_downcast", {
+            "var_names": var_names,
+            "categorical_ratio": float(content.get("categorical_ratio", DOWNCAST_CATEGORICAL_RATIO)),
+        })
+        downcast_response = await self.evaluate(code, parent_header=message.header)
+        frames = downcast_response.get("return")
+        if frames is None:
+            raise Exception(f"Unable to downcast dataframes: {downcast_response.get('error')}")
+        frames = frames or {}
+        saved = sum(frame["saved"] for frame in frames.values())
+        logger.info(f"Downcasting {len(frames)} dataframe(s) saved {saved} bytes")
+        await self.update_asset_map(parent_header=message.header)
+        await self.send_df_preview_message(parent_header=message.header)
+        return {"frames": frames, "saved": saved, "memory": self.memory_usage()}
+
     @intercept()
     async def download_dataset_request(self, message):
+        """
+        Streams a dataframe to the client as `download_chunk` messages, each carrying one binary buffer of at most
+        `chunk_size` bytes with its `seq` number and `offset`. `download_progress` messages report the bytes sent so
+        far and a final `download_response` carries the number of chunks, total bytes and SHA-256 of the stream.
+        """
         content = message.content
         var_name = content.get("var_name", "df")
-        # TODO: Collect any options that might be needed, if they ever are
+        download_format = content.get("format", "csv")
+        if download_format not in DOWNLOAD_FORMATS:
+            raise ValueError(
+                f"Unknown download format '{download_format}'. Expected one of: {', '.join(DOWNLOAD_FORMATS)}"
+            )
+        chunk_size = int(content.get("chunk_size") or self.download_chunk_size)
+
+        def send_progress(stage, sent=0, total=None):
+            self.beaker_kernel.send_response(
+                "iopub",
+                "download_progress",
+                {"var_name": var_name, "stage": stage, "bytes": sent, "total_bytes": total},
+                parent_header=message.header,
+            )
+
+        send_progress("serializing")
+        code = self.get_code(
+            "df_download",
+            {
+                "var_name": var_name,
+                "format": download_format,
+                "transfer_dir": os.environ.get("BEAKER_TRANSFER_DIR", ""),
+            },
+        )
+        df_response = await self.evaluate(code, parent_header=message.header)
+        download = df_response.get("return")
+        if not download:
+            raise Exception(f"Unable to serialize dataframe '{var_name}' for download: {df_response.get('error')}")
+
+        # The file is read one chunk at a time, so memory use does not depend on the size of the dataframe
+        total = download["size"]
+        checksum = hashlib.sha256()
+        seq = 0
+        sent = 0
+        progress_interval = max(1, math.ceil(total / chunk_size / 20))
+        try:
+            with open(download["path"], "rb") as download_file:
+                while chunk := download_file.read(chunk_size):
+                    checksum.update(chunk)
+                    send_response_with_buffers(
+                        self.beaker_kernel, "iopub", "download_chunk",
+                        {"var_name": var_name, "seq": seq, "offset": sent, "size": len(chunk)},
+                        buffers=[chunk], parent_header=message.header,
+                    )
+                    seq += 1
+                    sent += len(chunk)
+                    if seq % progress_interval == 0:
+                        send_progress("sending", sent, total)
+                    # Let other messages through between chunks
+                    await asyncio.sleep(0)
+        finally:
+            os.remove(download["path"])
+        send_progress("complete", sent, total)
 
-        # TODO: This doesn't work very well. Is very slow to encode, and transfer all of the required messages multiple times proxies through the proxy kernel.
-        # We should find a better way to accomplish this if it's needed.
-        code = self.get_code("df_download", {"var_name": var_name})
-        df_response = await self.evaluate(code)
-        df_contents = df_response.get("stdout_list")
         self.beaker_kernel.send_response(
             "iopub",
             "download_response",
             {
-                "data": [
-                    codecs.encode(line.encode(), "base64").decode()
-                    for line in df_contents
-                ]
+                "var_name": var_name,
+                "format": download_format,
+                "chunks": seq,
+                "bytes": sent,
+                "sha256": checksum.hexdigest(),
             },
-        )  # , parent_header=parent_header)
+            parent_header=message.header,
+        )
 
     @intercept()
     async def save_dataset_request(self, message):
         content = message.content
+        save = self.save_settings(content)
+        [upload] = await self.save_datasets([save], content.get("upload_mode", "auto"))
+        self.send_save_dataset_response(upload, parent_header=message.header)
 
-        parent_dataset_id = content.get("parent_dataset_id")
-        new_name = content.get("name")
-        filename = content.get("filename", None)
-        var_name = content.get("var_name", "df")
-        dataservice_url = os.environ["HMI_SERVER_URL"]
+    @intercept()
+    async def save_datasets_request(self, message):
+        """
+        Saves several dataframes as new datasets in one round trip, replying with a single `save_datasets_response`.
+        """
+        content = message.content
+        saves = [self.save_settings(dataset) for dataset in content.get("datasets") or []]
+        if not saves:
+            raise ValueError("No datasets to save")
+        uploads = await self.save_datasets(saves, content.get("upload_mode", "auto"))
+        self.beaker_kernel.send_response(
+            "iopub",
+            "save_datasets_response",
+            {"datasets": [self.save_dataset_summary(upload) for upload in uploads]},
+            parent_header=message.header,
+        )
 
-        if filename is None:
-            filename = "dataset.csv"
+    def save_settings(self, content) -> dict:
+        """
+        Reads the dataframe (`var_name`), new dataset `name`, `parent_dataset_id`, `filename`, `format` and
+        `compression` of a dataset to save. The format defaults to the filename's extension, or CSV, and the filename
+        and compression to those of the format.
+        """
+        filename = content.get("filename")
+        save_format = content.get("format")
+        if save_format is None:
+            save_format = "csv"
+            for candidate, (_, extension) in SAVE_FORMATS.items():
+                if filename and filename.lower().endswith(extension):
+                    save_format = candidate
+        if save_format not in SAVE_FORMATS:
+            raise ValueError(f"Unknown save format '{save_format}'. Expected one of: {', '.join(SAVE_FORMATS)}")
+        compressions = SAVE_COMPRESSIONS.get(save_format, ("none",))
+        compression = content.get("compression") or compressions[0]
+        if compression not in compressions:
+            raise ValueError(
+                f"Unknown compression '{compression}' for {save_format}. Expected one of: {', '.join(compressions)}"
+            )
+        return {
+            "var_name": content.get("var_name", "df"),
+            "name": content.get("name"),
+            "parent_dataset_id": content.get("parent_dataset_id"),
+            "filename": filename or f"dataset{SAVE_FORMATS[save_format][1]}",
+            "format": save_format,
+            "compression": compression,
+        }
 
-        parent_url = f"{dataservice_url}/datasets/{parent_dataset_id}"
-        parent_dataset = requests.get(parent_url, auth=self.auth.requests_auth()).json()
+    async def save_datasets(self, saves, upload_mode="auto") -> list:
+        """
+        Stages the dataframes of `saves` in the subkernel, in parallel and in one round trip, creates a dataset for
+        each on the HMI server and uploads them all together, returning the uploads.
+        """
+        frames = [
+            {"var_name": save["var_name"], "format": save["format"], "compression": save["compression"]}
+            for save in saves
+        ]
+        stage_response = await self.evaluate(
+            self.get_code("df_stage", {"frames": frames, "concurrency": self.upload_concurrency})
+        )
+        staged = stage_response.get("return")
+        if not staged:
+            raise Exception(f"Unable to stage dataframes for upload: {stage_response.get('error')}")
+        dataset_ids = await asyncio.gather(*(
+            self.create_dataset(save["parent_dataset_id"], save["name"], save["filename"], frame["columns"])
+            for save, frame in zip(saves, staged)
+        ), return_exceptions=True)
+        failures = [str(result) for result in dataset_ids if isinstance(result, Exception)]
+        if failures:
+            # Nothing is uploaded unless every dataset was created, so the ones that were are removed again
+            created = [dataset_id for dataset_id in dataset_ids if not isinstance(dataset_id, Exception)]
+            orphaned = await self.delete_datasets(created)
+            message = f"Unable to create datasets: {'; '.join(failures)}"
+            if orphaned:
+                message += f". Datasets created without data that could not be removed: {', '.join(orphaned)}"
+            raise Exception(message)
+        uploads = await asyncio.gather(*(
+            self.start_upload(
+                dataset_id, save["filename"], frame["path"], frame["size"], upload_mode,
+                content_type=SAVE_FORMATS[save["format"]][0],
+            )
+            for dataset_id, save, frame in zip(dataset_ids, saves, staged)
+        ))
+        for upload, save in zip(uploads, saves):
+            upload["parent_dataset_id"] = save["parent_dataset_id"]
+            upload["format"] = save["format"]
+        await self.upload_parts(*uploads)
+        return uploads
+
+    async def create_dataset(self, parent_dataset_id, name, filename, columns) -> str:
+        """
+        Creates a dataset on the HMI server derived from its parent, with `columns` typed from the staged frame so
+        HMI does not need to re-parse the file. Returns the new dataset's id.
+        """
+        parent_dataset = await self.hmi.get_cached_json(f"datasets/{parent_dataset_id}")
         if not parent_dataset:
             raise Exception(f"Unable to locate parent dataset '{parent_dataset_id}'")
 
         new_dataset = copy.deepcopy(parent_dataset)
         del new_dataset["id"]
-        new_dataset["name"] = new_name
+        new_dataset["name"] = name
         new_dataset["description"] += f"\\nTransformed from dataset '{parent_dataset['name']}' ({parent_dataset['id']}) at {datetime.datetime.utcnow().strftime('%c %Z')}"
         new_dataset["fileNames"] = [filename]
-        #clear the columns field on the new dataset as there was likely a change to either the columns or the data. HMI-Server will deal with regenerating this.
-        new_dataset["columns"] = []
-
-        import pprint
-        logger.error(f"new dataset: {pprint.pformat(new_dataset)}")
-        create_req = requests.post(f"{dataservice_url}/datasets", auth=self.auth.requests_auth(), json=new_dataset)
-        new_dataset_id = create_req.json()["id"]
-        logger.error(f"new dataset: {pprint.pformat(create_req.json())}")
-
-        new_dataset["id"] = new_dataset_id
-        new_dataset_url = f"{dataservice_url}/datasets/{new_dataset_id}"
-        data_url_req = requests.get(f"{new_dataset_url}/upload-url?filename={filename}", auth=self.auth.requests_auth())
-        data_url = data_url_req.json().get('url', None)
-
-        code = self.get_code(
-            "df_save_as",
+        # The columns or data have likely changed, so only the descriptions, annotations and grounding of columns
+        # that are still present are kept from the parent
+        parent_columns = {column.get("name"): column for column in parent_dataset.get("columns") or []}
+        new_dataset["columns"] = [
             {
-                "var_name": var_name,
-                "data_url": data_url,
+                "name": column["name"],
+                "dataType": HMI_COLUMN_TYPES[column["type"]],
+                "annotations": [],
+                **{
+                    key: value for key, value in parent_columns.get(column["name"], {}).items()
+                    if key in ("description", "annotations", "grounding")
+                },
             }
+            for column in columns
+        ]
+
+        logger.debug(f"new dataset: {new_dataset}")
+        create_req = await self.hmi.post("datasets", json=new_dataset)
+        if create_req.status_code >= 300:
+            raise Exception(
+                f"Failed to create dataset '{name}' (reason: {create_req.reason}({create_req.status_code}))"
+            )
+        return create_req.json()["id"]
+
+    async def delete_datasets(self, dataset_ids) -> list:
+        """
+        Deletes the datasets `dataset_ids` from the HMI server, returning the ids of any that could not be deleted.
+        """
+        responses = await asyncio.gather(
+            *(self.hmi.delete(f"datasets/{dataset_id}") for dataset_id in dataset_ids), return_exceptions=True
         )
-        df_response = await self.execute(code)
+        orphaned = []
+        for dataset_id, response in zip(dataset_ids, responses):
+            if isinstance(response, Exception) or response.status_code >= 300:
+                logger.error(f"Unable to delete dataset '{dataset_id}': {getattr(response, 'reason', response)}")
+                orphaned.append(dataset_id)
+        return orphaned
 
-        if df_response:
-            self.beaker_kernel.send_response(
-                "iopub",
-                "save_dataset_response",
+    @intercept()
+    async def resume_save_dataset_request(self, message):
+        dataset_id = message.content.get("dataset_id")
+        upload = self.pending_uploads.get(dataset_id)
+        if upload is None:
+            raise Exception(f"No incomplete upload found for dataset '{dataset_id}'")
+        await self.upload_parts(upload)
+        self.send_save_dataset_response(upload, parent_header=message.header)
+
+    async def start_upload(self, dataset_id, filename, path, size, upload_mode="auto", content_type="text/csv") -> dict:
+        """
+        Plans the upload of a staged file, requesting presigned urls for each part from the HMI server.
+
+        In `auto` mode files of at least `DATASET_MULTIPART_THRESHOLD` bytes are uploaded in parts, falling back to a
+        single upload if the server does not support multipart uploads. `multipart` and `single` force either mode.
+        """
+        upload = {
+            "dataset_id": dataset_id,
+            "filename": filename,
+            "path": path,
+            "size": size,
+            "seconds": 0.0,
+        }
+        if upload_mode == "multipart" or (upload_mode == "auto" and size >= self.multipart_threshold):
+            part_size = max(self.upload_part_size, math.ceil(size / MAX_UPLOAD_PARTS))
+            part_count = max(math.ceil(size / part_size), 1)
+            presigned_req = await self.hmi.get(
+                f"datasets/{dataset_id}/upload-url-multipart",
+                params={"filename": filename, "content-type": content_type, "part-count": part_count},
+            )
+            if presigned_req.ok:
+                presigned = presigned_req.json()
+                return {
+                    **upload,
+                    "mode": "multipart",
+                    "upload_id": presigned["uploadId"],
+                    "part_size": part_size,
+                    "parts": [
+                        {"part_number": part_number, "url": url}
+                        for part_number, url in enumerate(presigned["urls"], start=1)
+                    ],
+                }
+            if upload_mode == "multipart":
+                presigned_req.raise_for_status()
+            logger.warning(
+                f"Multipart upload unavailable for dataset '{dataset_id}' ({presigned_req.status_code}), "
+                "uploading as a single part."
+            )
+
+        data_url = (await self.hmi.get_json(f"datasets/{dataset_id}/upload-url", params={"filename": filename}))["url"]
+        return {
+            **upload,
+            "mode": "single",
+            "upload_id": None,
+            "part_size": max(size, 1),
+            "parts": [{"part_number": 1, "url": data_url}],
+        }
+
+    async def upload_parts(self, *uploads):
+        """
+        Uploads any parts of `uploads` not yet stored, all in one round trip to the subkernel, then completes each
+        upload once every one of its parts has been stored.
+
+        Parts are sent from the subkernel in parallel, each retried with backoff and checked against its MD5. If any
+        part still fails the upload is kept in `pending_uploads`, along with the staged file in the subkernel, so it
+        can be resumed with a `resume_save_dataset_request` without resending the parts that succeeded.
+        """
+        pending = [(upload, part) for upload in uploads for part in upload["parts"] if not part.get("complete")]
+        if pending:
+            code = self.get_code(
+                "df_upload_parts",
                 {
-                    "dataset_id": new_dataset_id,
-                    "filename": filename,
-                    "parent_dataset_id": parent_dataset_id,
+                    "parts": [
+                        {
+                            "part_number": part["part_number"],
+                            "url": part["url"],
+                            "path": upload["path"],
+                            "part_size": upload["part_size"],
+                        }
+                        for upload, part in pending
+                    ],
+                    "concurrency": self.upload_concurrency,
+                    "retries": self.upload_retries,
+                },
+            )
+            start = time.perf_counter()
+            upload_response = await self.evaluate(code)
+            seconds = time.perf_counter() - start
+            results = upload_response.get("return")
+            for upload in {id(upload): upload for upload, _ in pending}.values():
+                upload["seconds"] += seconds
+                if isinstance(results, list):
+                    upload.pop("error", None)
+                else:
+                    # The procedure itself failed, so no part was stored; the upload is kept for resuming
+                    upload["error"] = f"Unable to upload dataset parts: {upload_response.get('error')}"
+            if not isinstance(results, list):
+                results = [{"error": upload["error"]} for upload, _ in pending]
+            # Results come back in the order the parts were sent
+            for (_, part), result in zip(pending, results):
+                part.update(result)
+                part["complete"] = result["error"] is None
+        await asyncio.gather(*(self.complete_upload(upload) for upload in uploads))
+
+    async def complete_upload(self, upload):
+        if not all(part.get("complete") for part in upload["parts"]):
+            self.pending_uploads[upload["dataset_id"]] = upload
+            return
+        if upload["mode"] == "multipart":
+            complete_req = await self.hmi.put(
+                f"datasets/{upload['dataset_id']}/upload-url-multipart-complete",
+                json={
+                    "filename": upload["filename"],
+                    "uploadId": upload["upload_id"],
+                    "etags": [part["etag"] for part in upload["parts"]],
                 },
             )
+            if complete_req.status_code >= 300:
+                # Every part is stored, so resuming only needs to retry the completion.
+                self.pending_uploads[upload["dataset_id"]] = upload
+                upload["error"] = (
+                    f"Unable to complete upload of dataset '{upload['dataset_id']}' "
+                    f"(reason: {complete_req.reason}({complete_req.status_code}))"
+                )
+                return
+        upload["status"] = "complete"
+        upload.pop("error", None)
+        self.hmi.invalidate(f"datasets/{upload['dataset_id']}")
+        self.pending_uploads.pop(upload["dataset_id"], None)
+
+    def save_dataset_summary(self, upload) -> dict:
+        failed_parts = [part["part_number"] for part in upload["parts"] if not part.get("complete")]
+        summary = {
+            "status": upload.get("status", "incomplete"),
+            "mode": upload["mode"],
+            "parts": len(upload["parts"]),
+            "failed_parts": failed_parts,
+            "errors": {part["part_number"]: part.get("error") for part in upload["parts"] if part["part_number"] in failed_parts},
+            "bytes": upload["size"],
+            "seconds": round(upload["seconds"], 3),
+            "retries": sum(max(part.get("attempts", 1) - 1, 0) for part in upload["parts"]),
+            "error": upload.get("error"),
+        }
+        logger.info(f"Upload of dataset '{upload['dataset_id']}' ({upload['filename']}): {summary}")
+        return {
+            "dataset_id": upload["dataset_id"],
+            "filename": upload["filename"],
+            "format": upload.get("format", "csv"),
+            "parent_dataset_id": upload.get("parent_dataset_id"),
+            "upload": summary,
+        }
+
+    def send_save_dataset_response(self, upload, parent_header={}):
+        self.beaker_kernel.send_response(
+            "iopub", "save_dataset_response", self.save_dataset_summary(upload), parent_header=parent_header
+        )
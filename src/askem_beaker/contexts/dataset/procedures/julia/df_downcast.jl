@@ -0,0 +1,62 @@
+# Low-cardinality string columns are pooled when PooledArrays is installed
+_downcast_pooled = Base.find_package("PooledArrays") !== nothing
+if _downcast_pooled
+    using PooledArrays
+end
+
+function _downcast_column(col, categorical_ratio)
+    # Only conversions that keep every value: integers to the narrowest integer type that holds their range, floats to
+    # Float32 where every value survives the round trip, and string columns with at most `categorical_ratio` distinct
+    # values per row to pooled arrays
+    T = nonmissingtype(eltype(col))
+    all(ismissing, col) && return nothing
+    if T <: Signed && isbitstype(T)
+        low, high = extrema(skipmissing(col))
+        for S in (Int8, Int16, Int32)
+            if sizeof(S) < sizeof(T) && typemin(S) <= low && high <= typemax(S)
+                return convert(Vector{eltype(col) === T ? S : Union{Missing, S}}, col)
+            end
+        end
+    elseif T === Float64
+        narrowed = convert(Vector{eltype(col) === T ? Float32 : Union{Missing, Float32}}, col)
+        all(isequal.(narrowed, col)) && return narrowed
+    elseif T <: AbstractString && _downcast_pooled && !(col isa PooledArray)
+        length(Set(col)) <= categorical_ratio * length(col) && return PooledArray(col)
+    end
+    nothing
+end
+
+function _df_downcast(df, categorical_ratio)
+    # Columns are replaced in place
+    before = Base.summarysize(df)
+    columns = Dict{String, Any}()
+    for name in names(df)
+        col = df[!, name]
+        converted = _downcast_column(col, categorical_ratio)
+        converted === nothing && continue
+        saved = Base.summarysize(col) - Base.summarysize(converted)
+        if saved > 0
+            df[!, name] = converted
+            columns[name] = Dict("from" => string(eltype(col)), "to" => string(eltype(converted)), "saved" => saved)
+        end
+    end
+    after = Base.summarysize(df)
+    Dict("before" => before, "after" => after, "saved" => before - after, "columns" => columns)
+end
+
+_downcast_result = Dict{String, Any}()
+{%- if var_names is not none %}
+for _var_name in {{ var_names|tojson }}
+    _downcast_result[_var_name] = _df_downcast(getfield(Main, Symbol(_var_name)), {{ categorical_ratio }})
+end
+{%- else %}
+for _var_sym in names(Main)
+    startswith(string(_var_sym), "_") && continue
+    isdefined(Main, _var_sym) || continue
+    _var = getfield(Main, _var_sym)
+    _var isa DataFrame || continue
+    _downcast_result[string(_var_sym)] = _df_downcast(_var, {{ categorical_ratio }})
+end
+{%- endif %}
+
+JSON3.write(_downcast_result) |> DisplayAs.unlimited
@@ -1,8 +1,9 @@
-_output_buff = IOBuffer()
-CSV.write(_output_buff, {{ var_name|default("df") }}, writeheader=true)
-
-seekstart(_output_buff)
-
-for _line in readlines(_output_buff)
-    println(_line)
+# Write the dataframe straight to a transfer file, which the kernel streams to the client in chunks and removes
+_download_format = "{{ format|default("csv") }}"
+_download_path = tempname(isempty("{{ transfer_dir }}") ? tempdir() : "{{ transfer_dir }}") * "." * _download_format
+if _download_format == "parquet"
+    error("Parquet downloads are not supported for Julia dataframes")
 end
+CSV.write(_download_path, {{ var_name|default("df") }}, writeheader=true, compress=_download_format == "csv.gz")
+
+JSON3.write(Dict("path" => _download_path, "size" => filesize(_download_path))) |> DisplayAs.unlimited
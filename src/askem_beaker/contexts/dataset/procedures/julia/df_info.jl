@@ -1,17 +1,113 @@
+using Random
+
+# With the `arrow` encoding, previews are written as Arrow IPC streams to transfer files the kernel attaches to the
+# preview message as binary buffers. Without Arrow.jl they fall back to JSON rows.
+_preview_arrow = {{ "true" if preview_encoding == "arrow" else "false" }} && Base.find_package("Arrow") !== nothing
+if _preview_arrow
+    using Arrow
+end
+
+# Profiles from earlier runs, keyed by variable name, are reused for any DataFrame that has not changed since
+if !@isdefined(_df_info_cache)
+    _df_info_cache = Dict{String, Any}()
+end
+
+function _df_fingerprint(df)
+    # Identity, size, columns and element types catch most changes and a content hash catches in-place edits. Frames
+    # over `full_hash_rows` rows only hash their head, tail and evenly spaced rows so the check stays cheap.
+    rows = nrow(df)
+    sample = df
+    if rows > {{ full_hash_rows|default(100000) }}
+        sample = view(df, unique(vcat(1:30, round.(Int, range(1, rows; length={{ sample_rows|default(1024) }})), rows-29:rows)), :)
+    end
+    (objectid(df), size(df), names(df), eltype.(eachcol(df)), hash(sample))
+end
+
+function _df_distinct_estimate(col, rows, scale)
+    counts = Dict{eltype(col), Int}()
+    for value in col
+        counts[value] = get(counts, value, 0) + 1
+    end
+    seen_once = count(==(1), values(counts))
+    min(rows, round(Int, sqrt(scale) * seen_once + (length(counts) - seen_once)))
+end
+
+function _df_statistics(df)
+    # Frames over the row budget are described from a seeded uniform sample of about `row_budget` rows rather than in
+    # full. Missing counts are scaled back up to the full frame and the number of distinct values in each non-float
+    # column is estimated with the GEE estimator (sqrt(N/n) * values seen once + values seen more than once).
+    row_budget = {{ row_budget|default(0) }}
+    rows = nrow(df)
+    if row_budget == 0 || rows <= row_budget
+        return Dict{String, Any}("statistics" => string(describe(df)), "statistics_mode" => "exact", "rows" => rows)
+    end
+    sample = view(df, randsubseq(MersenneTwister(0), 1:rows, row_budget / rows), :)
+    scale = rows / nrow(sample)
+    statistics = describe(sample)
+    statistics.nmissing = round.(Int, statistics.nmissing .* scale)
+    statistics[!, "distinct (est.)"] = [
+        eltype(col) <: Union{Missing, AbstractFloat} ? missing : _df_distinct_estimate(col, rows, scale)
+        for col in eachcol(sample)
+    ]
+    Dict{String, Any}(
+        "statistics" => "Approximate, from a uniform sample of $(nrow(sample)) of $(rows) rows:\n$(statistics)",
+        "statistics_mode" => "sampled",
+        "rows" => rows,
+        "sample_rows" => nrow(sample),
+    )
+end
+
+function _df_memory(df)
+    # Memory use in bytes of the frame and each of its columns
+    Dict{String, Any}(
+        "bytes" => Base.summarysize(df),
+        "columns" => Dict(string(name) => Base.summarysize(col) for (name, col) in pairs(eachcol(df))),
+        "estimated" => false,
+    )
+end
+
+function _df_preview(df)
+    # The first 30 rows, either as JSON rows (the column names then one list of values per row) or, for the `arrow`
+    # encoding, as an Arrow IPC stream written to a transfer file
+    preview = first(df, 30)
+    if _preview_arrow
+        preview_path = tempname(isempty("{{ transfer_dir }}") ? tempdir() : "{{ transfer_dir }}") * ".arrow"
+        open(preview_path, "w") do io
+            Arrow.write(io, preview; file=false)
+        end
+        return Dict{String, Any}("columns" => names(df), "preview_path" => preview_path)
+    end
+    cells = Matrix{Any}(preview)
+    Dict{String, Any}("columns" => names(df), "head" => [names(df), (cells[i, :] for i in 1:size(cells, 1))...])
+end
+
 _result = Dict()
-_var_syms = names(Main)
-
-for _var_sym in _var_syms
-    _var = eval(_var_sym)
-    if typeof(_var) == DataFrame
-        _data = [Array(_r) for _r=eachrow(first(_var, 30))]
-        _result["$(_var_sym)"] = Dict(
-            "columns" => names(_var),
-            "head" => _data,
+
+for _var_sym in names(Main)
+    startswith(string(_var_sym), "_") && continue
+    isdefined(Main, _var_sym) || continue
+    _var = getfield(Main, _var_sym)
+    _var isa DataFrame || continue
+    _var_name = string(_var_sym)
+    _fingerprint = _df_fingerprint(_var)
+    _cached = get(_df_info_cache, _var_name, nothing)
+    _profile = if _cached !== nothing && _cached[1] == _fingerprint
+        _cached[2]
+    else
+        Dict{String, Any}(
             "datatypes" => string(eltype.(eachcol(_var))),
-            "statistics" => string(describe(_var)),
+            "memory" => _df_memory(_var),
+            _df_statistics(_var)...,
         )
     end
+    _df_info_cache[_var_name] = (_fingerprint, _profile)
+    # The preview is cheap to rebuild, so it is not cached with the profile
+    _result[_var_name] = merge(_profile, _df_preview(_var))
+end
+
+# Forget DataFrames that have been deleted
+for _var_name in setdiff(keys(_df_info_cache), keys(_result))
+    delete!(_df_info_cache, _var_name)
 end
 
 JSON3.write(_result) |> DisplayAs.unlimited
@@ -0,0 +1,44 @@
+using Dates
+
+# Arrow output needs Arrow.jl; there is no Parquet writer for Julia dataframes
+_stage_arrow = Base.find_package("Arrow") !== nothing
+if _stage_arrow
+    using Arrow
+end
+
+_stage_frames = JSON3.read(raw"""{{ frames|tojson }}""")
+_stage_suffixes = Dict("csv" => ".csv", "csv.gz" => ".csv.gz", "parquet" => ".parquet", "arrow" => ".arrow")
+
+function _stage_column_type(T)
+    # The type hint for a column's element type, which the kernel passes on to HMI as the column's type
+    T = nonmissingtype(T)
+    T <: Bool && return "bool"
+    T <: Integer && return "int"
+    T <: AbstractFloat && return "float"
+    T <: Dates.TimeType && return "datetime"
+    "string"
+end
+
+function _stage_frame(frame)
+    # Stage the dataframe in a file on disk so it can be uploaded, and resumed, in byte ranges
+    df = getfield(Main, Symbol(frame.var_name))
+    path = tempname() * _stage_suffixes[frame.format]
+    if frame.format == "parquet"
+        error("Saving as parquet is not supported for Julia dataframes")
+    elseif frame.format == "arrow"
+        _stage_arrow || error("Saving as arrow requires Arrow.jl")
+        Arrow.write(path, df; compress=frame.compression == "none" ? nothing : Symbol(frame.compression))
+    else
+        CSV.write(path, df; writeheader=true, compress=frame.format == "csv.gz")
+    end
+    Dict(
+        "path" => path,
+        "size" => filesize(path),
+        "columns" => [Dict("name" => string(name), "type" => _stage_column_type(eltype(col))) for (name, col) in pairs(eachcol(df))],
+    )
+end
+
+# Frames are staged in parallel on the session's threads
+_stage_results = fetch.([Threads.@spawn _stage_frame(frame) for frame in _stage_frames])
+
+JSON3.write(_stage_results) |> DisplayAs.unlimited
@@ -0,0 +1,90 @@
+using Base64
+
+# Parts of one or more staged files, each with the `path` and `part_size` of the file it belongs to
+_upload_parts = JSON3.read(raw"""{{ parts|tojson }}""")
+_upload_retries = {{ retries|default(3) }}
+_upload_chunk_size = 1024 * 1024
+
+function _each_part_chunk(f, path, offset, nbytes)
+    # Calls `f` with the byte range of a staged file in bounded chunks, so a part (in single mode, the whole file) is
+    # never held in memory
+    open(path, "r") do staged
+        seek(staged, offset)
+        remaining = nbytes
+        while remaining > 0
+            chunk = read(staged, min(remaining, _upload_chunk_size))
+            isempty(chunk) && break
+            f(chunk)
+            remaining -= length(chunk)
+        end
+    end
+end
+
+function _upload_part(part)
+    # Each part is the byte range of its staged file at its (1-based) part number
+    offset = (part.part_number - 1) * part.part_size
+    nbytes = max(0, min(part.part_size, filesize(part.path) - offset))
+    hasher = open(`md5sum`, "r+")
+    _each_part_chunk(chunk -> write(hasher, chunk), part.path, offset, nbytes)
+    closewrite(hasher)
+    digest = hex2bytes(first(split(read(hasher, String))))
+    result = Dict{String, Any}(
+        "part_number" => part.part_number,
+        "bytes" => nbytes,
+        "checksum" => base64encode(digest),
+        "etag" => nothing,
+        "attempts" => 0,
+        "error" => nothing,
+    )
+    start = time()
+    while result["attempts"] <= _upload_retries
+        if result["attempts"] > 0
+            sleep(min(0.5 * 2^(result["attempts"] - 1), 8))
+        end
+        result["attempts"] += 1
+        # Content-MD5 has the object store reject a part that was corrupted in transit. The part is written to the
+        # request as it is read from disk.
+        body = ""
+        headers = ["Content-MD5" => result["checksum"], "Content-Length" => string(nbytes)]
+        response = try
+            HTTP.open("PUT", part.url, headers; retry=false, status_exception=false, readtimeout=300) do http
+                _each_part_chunk(chunk -> write(http, chunk), part.path, offset, nbytes)
+                HTTP.closewrite(http)
+                HTTP.startread(http)
+                body = String(read(http))
+            end
+        catch _e
+            result["error"] = sprint(showerror, _e)
+            continue
+        end
+        if response.status >= 300
+            result["error"] = "Status $(response.status): $(first(body, 200))"
+            if response.status in (408, 429) || response.status >= 500 || occursin("BadDigest", body)
+                continue
+            end
+            break
+        end
+        etag = strip(HTTP.header(response, "ETag", ""), '"')
+        # A plain (non-multipart, unencrypted) ETag is the MD5 of what the store received
+        if length(etag) == 32 && etag != bytes2hex(digest)
+            result["error"] = "Checksum mismatch: sent $(bytes2hex(digest)), stored $(etag)"
+            continue
+        end
+        result["etag"] = isempty(etag) ? nothing : etag
+        result["error"] = nothing
+        break
+    end
+    result["seconds"] = round(time() - start; digits=3)
+    return result
+end
+
+_upload_results = asyncmap(_upload_part, _upload_parts; ntasks={{ concurrency|default(4) }})
+
+# Keep each staged file around until every one of its parts is stored so a failed upload can be resumed
+for _upload_path in unique(_part.path for _part in _upload_parts)
+    if all(_result["error"] === nothing for (_part, _result) in zip(_upload_parts, _upload_results) if _part.path == _upload_path)
+        rm(_upload_path; force=true)
+    end
+end
+
+JSON3.write(_upload_results) |> DisplayAs.unlimited
@@ -1,3 +1,55 @@
-{% for var_name, data_url in var_map.items() -%}
-{{ var_name|default("df") }} = DataFrame(CSV.File(IOBuffer(HTTP.get("{{ data_url }}").body)))
+{%- set julia_types = {"int": "Int64", "float": "Float64", "bool": "Bool", "string": "String"} -%}
+_load_optional(_pkg) = Base.find_package(_pkg) !== nothing && (Core.eval(Main, :(using $(Symbol(_pkg)))); true)
+
+function _load_df(_url, _format, _types)
+    # Files in the kernel's dataset cache are read in place. Anything else is streamed to disk so CSV.jl can memory
+    # map it and parse it on multiple threads, rather than holding the whole response in memory. CSV.jl decompresses
+    # gzipped files by their extension.
+    _cached = !startswith(_url, r"https?://")
+    _path = _cached ? _url : HTTP.download(_url, tempname() * (_format == "csv.gz" ? ".csv.gz" : ""); update_period=Inf)
+    try
+        if _format in ("csv", "csv.gz")
+            return try
+                DataFrame(CSV.File(_path; types=_types, ntasks=Threads.nthreads()))
+            catch _e
+                isempty(_types) && rethrow()
+                # The column metadata doesn't match the file; fall back to inferring the types
+                DataFrame(CSV.File(_path; ntasks=Threads.nthreads()))
+            end
+        elseif _format == "feather" && _load_optional("Arrow")
+            return DataFrame(Base.invokelatest(Main.Arrow.Table, _path); copycols=true)
+        elseif _format == "parquet" && _load_optional("Parquet2")
+            return DataFrame(Base.invokelatest(Main.Parquet2.Dataset, _path); copycols=true)
+        elseif _format == "excel" && _load_optional("XLSX")
+            return DataFrame(Base.invokelatest(Main.XLSX.readtable, _path, 1))
+        end
+        error("Unsupported dataset format '$(_format)'")
+    finally
+        _cached || rm(_path; force=true)
+    end
+end
+
+_load_df_safe(_source) = try
+    _load_df(_source...)
+catch _e
+    _e
+end
+
+# Download and parse all of the datasets concurrently, collecting any per-dataset failures.
+_load_names = [{% for var_name in var_map %}"{{ var_name }}", {% endfor %}]
+_load_sources = [
+{%- for source in var_map.values() %}
+    ("{{ source.url }}", "{{ source.format }}", Dict{String, Type}({% for col, hint in source.dtypes.items() if hint in julia_types %}{{ col|tojson }} => Union{Missing, {{ julia_types[hint] }}}, {% endfor %})),
+{%- endfor %}
+]
+_load_results = Dict(zip(_load_names, asyncmap(_load_df_safe, _load_sources; ntasks={{ concurrency|default(4) }})))
+_load_errors = Dict{String, String}()
+
+{% for var_name in var_map -%}
+if _load_results["{{ var_name }}"] isa Exception
+    _load_errors["{{ var_name }}"] = sprint(showerror, _load_results["{{ var_name }}"])
+else
+    {{ var_name }} = _load_results["{{ var_name }}"]
+end
 {% endfor %}
+JSON3.write(_load_errors) |> DisplayAs.unlimited
@@ -0,0 +1,55 @@
+# One in-process DuckDB database per session. Every DataFrame is registered as a view under its variable name, which
+# DuckDB scans in place rather than copying. The database has no access to files, the network or extensions, so
+# queries can only read the registered tables.
+_sql_available = Base.find_package("DuckDB") !== nothing
+if _sql_available
+    using DuckDB
+end
+
+if !_sql_available
+    _sql_result = Dict("error" => "SQL queries require the DuckDB package to be installed")
+else
+    if !@isdefined(_sql_connection)
+        _sql_config = DuckDB.Config()
+        DuckDB.set_config(_sql_config, "enable_external_access", "false")
+        _sql_connection = DBInterface.connect(DuckDB.DB, ":memory:", _sql_config)
+        _sql_registered = Set{String}()
+    end
+    _sql_tables = Set(
+        "$(_var_sym)" for _var_sym in names(Main)
+        if !startswith("$(_var_sym)", "_") && isdefined(Main, _var_sym) && getfield(Main, _var_sym) isa DataFrame
+    )
+    # Views of deleted dataframes would keep them in memory
+    for _sql_name in setdiff(_sql_registered, _sql_tables)
+        DuckDB.unregister_data_frame(_sql_connection, _sql_name)
+    end
+    for _sql_name in _sql_tables
+        DuckDB.register_data_frame(_sql_connection, getfield(Main, Symbol(_sql_name)), _sql_name)
+    end
+    _sql_registered = _sql_tables
+
+    # The query is run as a subquery, which only a SELECT statement can be
+    _sql_query = "SELECT * FROM (" * {{ query|tojson|replace("$", "\\$") }} * "\n) AS _sql_query"
+    _sql_start = time()
+    _sql_result = try
+{%- if result_var %}
+        # The full result is only materialized when it is stored in the session
+        global {{ result_var }} = DataFrame(DBInterface.execute(_sql_connection, _sql_query))
+        _sql_df = first({{ result_var }}, {{ max_rows }} + 1)
+{%- else %}
+        # Queries are limited to `max_rows` rows (plus one, to tell whether there are more) so only those are produced
+        _sql_df = DataFrame(DBInterface.execute(_sql_connection, "$(_sql_query) LIMIT $({{ max_rows }} + 1)"))
+{%- endif %}
+        Dict(
+            "columns" => names(_sql_df),
+            "types" => string.(eltype.(eachcol(_sql_df))),
+            "rows" => [Array(_r) for _r in eachrow(first(_sql_df, {{ max_rows }}))],
+            "truncated" => nrow(_sql_df) > {{ max_rows }},
+        )
+    catch _sql_error
+        Dict("error" => sprint(showerror, _sql_error))
+    end
+    _sql_result["seconds"] = round(time() - _sql_start; digits=3)
+end
+
+JSON3.write(_sql_result) |> DisplayAs.unlimited
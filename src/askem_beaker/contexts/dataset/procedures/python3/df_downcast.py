@@ -0,0 +1,49 @@
+import copy
+import numpy as np
+import pandas as pd
+
+
+def _df_downcast(df, categorical_ratio):
+    # Only conversions that keep every value: integers to the narrowest signed integer type that holds their range,
+    # floats to float32 where every value survives the round trip, and string columns with at most
+    # `categorical_ratio` distinct values per row to categoricals. Columns are replaced in place.
+    before = df.memory_usage(index=False, deep=True)
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        if not isinstance(series, pd.Series) or series.empty:
+            # Duplicated column names
+            continue
+        converted = None
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind == "i":
+            converted = pd.to_numeric(series, downcast="integer")
+        elif series.dtype == np.float64:
+            narrowed = series.astype(np.float32)
+            if np.array_equal(narrowed.to_numpy(np.float64), series.to_numpy(), equal_nan=True):
+                converted = narrowed
+        elif (series.dtype == object or isinstance(series.dtype, pd.StringDtype)) and (
+            pd.api.types.infer_dtype(series, skipna=True) == "string"
+        ):
+            if series.nunique() <= categorical_ratio * len(series):
+                converted = series.astype("category")
+        if converted is None or converted.dtype == series.dtype:
+            continue
+        saved = int(before[column] - converted.memory_usage(index=False, deep=True))
+        if saved > 0:
+            df[column] = converted
+            columns[str(column)] = {"from": str(series.dtype), "to": str(converted.dtype), "saved": saved}
+    after = df.memory_usage(index=False, deep=True)
+    return {"before": int(before.sum()), "after": int(after.sum()), "saved": int(before.sum() - after.sum()), "columns": columns}
+
+
+_downcast_result = {}
+{%- if var_names is not none %}
+for _var_name in {{ var_names|tojson }}:
+    _downcast_result[_var_name] = _df_downcast(globals()[_var_name], {{ categorical_ratio }})
+{%- else %}
+for _var_name, _df in copy.copy(locals()).items():
+    if isinstance(_df, pd.DataFrame) and not _var_name.startswith("_"):
+        _downcast_result[_var_name] = _df_downcast(_df, {{ categorical_ratio }})
+{%- endif %}
+
+_downcast_result
@@ -1,7 +1,28 @@
-import pandas as pd; import io
-output_buff = io.BytesIO()
-{{ var_name|default("df") }}.to_csv(output_buff, index=False, header=True)
-output_buff.seek(0)
+import os
+import tempfile
 
-for line in output_buff.getvalue().splitlines():
-    print(line.decode())
+# Write the dataframe straight to a transfer file, which the kernel streams to the client in chunks and removes
+_download_format = "{{ format|default("csv") }}"
+_download_fd, _download_path = tempfile.mkstemp(
+    prefix="beaker-download-", suffix=f".{_download_format}", dir="{{ transfer_dir }}" or None
+)
+os.close(_download_fd)
+if hasattr({{ var_name|default("df") }}, "to_batches"):
+    # A lazily loaded dataset is written one batch at a time rather than read into memory
+    import pyarrow as _pa
+    import pyarrow.csv as _pa_csv
+    import pyarrow.parquet as _pa_pq
+    _download_writer_cls = _pa_pq.ParquetWriter if _download_format == "parquet" else _pa_csv.CSVWriter
+    _download_compression = "gzip" if _download_format == "csv.gz" else None
+    with _pa.output_stream(_download_path, compression=_download_compression) as _download_sink:
+        with _download_writer_cls(_download_sink, {{ var_name|default("df") }}.schema) as _download_writer:
+            for _download_batch in {{ var_name|default("df") }}.to_batches():
+                _download_writer.write_batch(_download_batch)
+elif _download_format == "parquet":
+    {{ var_name|default("df") }}.to_parquet(_download_path, index=False)
+else:
+    {{ var_name|default("df") }}.to_csv(
+        _download_path, index=False, header=True, compression="gzip" if _download_format == "csv.gz" else None
+    )
+
+{"path": _download_path, "size": os.path.getsize(_download_path)}
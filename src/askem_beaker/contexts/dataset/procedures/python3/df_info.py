@@ -1,17 +1,175 @@
 import copy
+import hashlib
 import json
+import os
+import tempfile
+import numpy as np
 import pandas as pd
 
-_result = {}
+try:
+    import pyarrow as _pa
+    import pyarrow.dataset as _pa_ds
+except ImportError:
+    _pa = None
+
+# Profiles from earlier runs, keyed by variable name, are reused for any dataframe that has not changed since
+_df_info_cache = globals().setdefault("_df_info_cache", {})
+
+
+def _df_fingerprint(df):
+    # Identity, shape, columns and dtypes catch most changes and a content hash catches in-place edits. Frames over
+    # `full_hash_rows` rows only hash their head, tail and evenly spaced rows so the check stays cheap.
+    sample = df
+    if len(df) > {{ full_hash_rows|default(100000) }}:
+        sample = df.iloc[np.unique(np.concatenate([
+            np.arange(30),
+            np.linspace(0, len(df) - 1, {{ sample_rows|default(1024) }}, dtype=int),
+            np.arange(len(df) - 30, len(df)),
+        ]))]
+    try:
+        content = hashlib.blake2b(pd.util.hash_pandas_object(sample, index=True).values.tobytes()).hexdigest()
+    except TypeError:
+        # Unhashable values (e.g. lists in an object column); always re-profile
+        return None
+    return (id(df), df.shape, tuple(df.columns), tuple(map(str, df.dtypes)), content)
+
 
-for _var_name, _df in ((k, v) for k, v in copy.copy(locals()).items() if isinstance(v, pd.DataFrame) and not k.startswith("_")):
-    _split_df = json.loads(_df.head(30).to_json(orient="split"))
+def _df_sample(df):
+    # Frames over the row budget are profiled from a seeded uniform sample of `row_budget` rows, which the statistics
+    # and the memory estimate share. Returns None for frames that are profiled in full.
+    row_budget = {{ row_budget|default(0) }}
+    if not row_budget or len(df) <= row_budget:
+        return None
+    return df.take(np.sort(np.random.default_rng(0).choice(len(df), row_budget, replace=False)))
 
-    _result[_var_name] = {
-        "columns": _split_df["columns"],
-        "datatypes": str(_df.dtypes),
-        "head": [_split_df["columns"]] + _split_df["data"],
-        "statistics": str(_df.describe()),
+
+def _df_statistics(df, sample):
+    # Frames with a sample are described from it rather than in full. Counts are scaled back up to the full frame and
+    # the number of distinct values in each non-float column is estimated with the GEE estimator
+    # (sqrt(N/n) * values seen once + values seen more than once).
+    if sample is None:
+        return {"statistics": str(df.describe()), "statistics_mode": "exact", "rows": len(df)}
+    scale = len(df) / len(sample)
+    try:
+        # Every column is described, as the distinct estimates matter most for string and categorical columns. Their
+        # `unique` count is only that of the sample, so it is replaced by the estimate.
+        statistics = sample.describe(include="all").drop(index="unique", errors="ignore")
+    except TypeError:
+        # Unhashable values (e.g. lists in an object column) can't be counted; describe the numeric columns only
+        statistics = sample.describe()
+    for row in ("count", "freq"):
+        if row in statistics.index:
+            statistics.loc[row] = (statistics.loc[row].astype(float) * scale).round()
+    distinct = {}
+    for column in statistics.columns:
+        if pd.api.types.is_float_dtype(sample[column]):
+            continue
+        try:
+            counts = sample[column].value_counts()
+        except TypeError:
+            continue
+        distinct[column] = min(len(df), round(np.sqrt(scale) * (counts == 1).sum() + (counts > 1).sum()))
+    if distinct:
+        statistics.loc["distinct (est.)"] = pd.Series(distinct)
+    return {
+        "statistics": f"Approximate, from a uniform sample of {len(sample):,} of {len(df):,} rows:\n{statistics}",
+        "statistics_mode": "sampled",
+        "rows": len(df),
+        "sample_rows": len(sample),
     }
 
-_result
\ No newline at end of file
+
+def _df_memory(df, sample):
+    # Deep memory use in bytes of the frame and each of its columns. Measuring an object column means visiting every
+    # value, so for frames with a sample the size of object columns is estimated from it.
+    object_columns = [column for column, dtype in df.dtypes.items() if dtype == object]
+    estimated = bool(object_columns) and sample is not None
+    deep = bool(object_columns) and not estimated
+    usage = df.memory_usage(index=False, deep=deep)
+    if estimated:
+        sample_usage = sample[object_columns].memory_usage(index=False, deep=True)
+        usage[object_columns] = (sample_usage * len(df) / len(sample)).round()
+    return {
+        "bytes": int(usage.sum() + df.index.memory_usage(deep=deep)),
+        "columns": {str(column): int(size) for column, size in usage.items()},
+        "estimated": estimated,
+    }
+
+
+def _lazy_profile(dataset):
+    # Lazily loaded datasets are never read in full: statistics come from the first `row_budget` rows and the row count
+    # is only given where the file's metadata records it, so profiling costs a bounded scan however large the file is.
+    scan_rows = {{ row_budget or 250000 }}
+    head = dataset.head(scan_rows).to_pandas()
+    rows = None
+    if isinstance(dataset.format, (_pa_ds.ParquetFileFormat, _pa_ds.IpcFileFormat)):
+        rows = dataset.count_rows()
+    profile = {
+        "datatypes": str(dataset.schema),
+        "statistics": str(head.describe()),
+        "statistics_mode": "exact",
+        "rows": rows,
+        "lazy": True,
+        # Memory-mapped or scanned on demand, so nothing is held in memory
+        "memory": {"bytes": 0, "columns": {}, "estimated": False},
+    }
+    if len(head) == scan_rows and rows != scan_rows:
+        profile.update({
+            "statistics": f"Approximate, from the first {scan_rows:,} rows:\n{profile['statistics']}",
+            "statistics_mode": "scanned",
+            "sample_rows": scan_rows,
+        })
+    elif rows is None:
+        profile["rows"] = len(head)
+    return profile
+
+
+def _df_preview(df):
+    # The first 30 rows, either as JSON or, for the `arrow` encoding, as an Arrow IPC stream written to a transfer file
+    # that the kernel attaches to the preview message as a binary buffer. Frames Arrow can't represent fall back to JSON.
+    preview = df.head(30)
+{%- if preview_encoding == "arrow" %}
+    try:
+        table = _pa.Table.from_pandas(preview, preserve_index=False) if _pa is not None else None
+    except _pa.ArrowException:
+        table = None
+    if table is not None:
+        fd, path = tempfile.mkstemp(prefix="beaker-preview-", suffix=".arrow", dir="{{ transfer_dir }}" or None)
+        with os.fdopen(fd, "wb") as sink, _pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return {"columns": table.column_names, "preview_path": path}
+{%- endif %}
+    split_df = json.loads(preview.to_json(orient="split"))
+    return {"columns": split_df["columns"], "head": [split_df["columns"]] + split_df["data"]}
+
+
+_result = {}
+
+for _var_name, _df in copy.copy(locals()).items():
+    if _var_name.startswith("_"):
+        continue
+    if isinstance(_df, pd.DataFrame):
+        _fingerprint = _df_fingerprint(_df)
+    elif _pa is not None and isinstance(_df, _pa_ds.FileSystemDataset):
+        # The files behind a lazy dataset don't change, so it only needs profiling once
+        _fingerprint = (id(_df), tuple(_df.files))
+    else:
+        continue
+    _cached = _df_info_cache.get(_var_name)
+    if _fingerprint is not None and _cached is not None and _cached[0] == _fingerprint:
+        _profile = _cached[1]
+    else:
+        if isinstance(_df, pd.DataFrame):
+            _sample = _df_sample(_df)
+            _profile = {"datatypes": str(_df.dtypes), "memory": _df_memory(_df, _sample), **_df_statistics(_df, _sample)}
+        else:
+            _profile = _lazy_profile(_df)
+        _df_info_cache[_var_name] = (_fingerprint, _profile)
+    # The preview is cheap to rebuild, so it is not cached with the profile
+    _result[_var_name] = {**_profile, **_df_preview(_df if isinstance(_df, pd.DataFrame) else _df.head(30).to_pandas())}
+
+# Forget dataframes that have been deleted
+for _var_name in set(_df_info_cache) - set(_result):
+    del _df_info_cache[_var_name]
+
+_result
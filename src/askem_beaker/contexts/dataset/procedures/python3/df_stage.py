@@ -0,0 +1,69 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+_STAGE_SUFFIXES = {"csv": ".csv", "csv.gz": ".csv.gz", "parquet": ".parquet", "arrow": ".arrow"}
+
+
+def _stage_column_type(dtype):
+    # The type hint for a pandas dtype or pyarrow type, which the kernel passes on to HMI as the column's type
+    if hasattr(dtype, "kind"):
+        return {"b": "bool", "i": "int", "u": "int", "f": "float", "M": "datetime"}.get(dtype.kind, "string")
+    import pyarrow as pa
+    if pa.types.is_boolean(dtype):
+        return "bool"
+    if pa.types.is_integer(dtype):
+        return "int"
+    if pa.types.is_floating(dtype):
+        return "float"
+    if pa.types.is_timestamp(dtype) or pa.types.is_date(dtype):
+        return "datetime"
+    return "string"
+
+
+def _stage_frame(df, format, compression):
+    # Stage the dataframe in a file on disk so it can be uploaded, and resumed, in byte ranges
+    compression = None if compression == "none" else compression
+    stage_fd, stage_path = tempfile.mkstemp(prefix="beaker-upload-", suffix=_STAGE_SUFFIXES[format])
+    os.close(stage_fd)
+    if hasattr(df, "to_batches"):
+        # A lazily loaded dataset is written one batch at a time rather than read into memory
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        import pyarrow.ipc as pa_ipc
+        import pyarrow.parquet as pa_pq
+        with pa.output_stream(stage_path, compression="gzip" if format == "csv.gz" else None) as sink:
+            if format == "parquet":
+                writer = pa_pq.ParquetWriter(sink, df.schema, compression=compression or "none")
+            elif format == "arrow":
+                writer = pa_ipc.new_file(sink, df.schema, options=pa_ipc.IpcWriteOptions(compression=compression))
+            else:
+                writer = pa_csv.CSVWriter(sink, df.schema)
+            with writer:
+                for batch in df.to_batches():
+                    writer.write_batch(batch)
+        column_types = {field.name: _stage_column_type(field.type) for field in df.schema}
+    else:
+        if format == "parquet":
+            df.to_parquet(stage_path, index=False, compression=compression)
+        elif format == "arrow":
+            import pyarrow.feather as pa_feather
+            pa_feather.write_feather(df, stage_path, compression=compression or "uncompressed")
+        else:
+            df.to_csv(stage_path, index=False, header=True, compression="gzip" if format == "csv.gz" else None)
+        column_types = {str(column): _stage_column_type(dtype) for column, dtype in df.dtypes.items()}
+    return {
+        "path": stage_path,
+        "size": os.path.getsize(stage_path),
+        "columns": [{"name": name, "type": column_type} for name, column_type in column_types.items()],
+    }
+
+
+# Frames are staged in parallel; the columnar writers release the GIL while they encode and compress
+_stage_frames = {{ frames }}
+with ThreadPoolExecutor(max_workers={{ concurrency|default(4) }}) as _stage_executor:
+    _stage_results = list(_stage_executor.map(
+        lambda frame: _stage_frame(globals()[frame["var_name"]], frame["format"], frame["compression"]), _stage_frames
+    ))
+
+_stage_results
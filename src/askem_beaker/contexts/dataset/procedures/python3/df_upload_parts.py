@@ -0,0 +1,100 @@
+import base64
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Parts of one or more staged files, each with the `path` and `part_size` of the file it belongs to
+_upload_parts = {{ parts }}
+_upload_retries = {{ retries|default(3) }}
+_upload_chunk_size = 1024 * 1024
+
+
+class _PartReader:
+    """
+    File-like view of a part's byte range in its staged file, read in chunks so that a part (in single mode, the whole
+    file) is streamed rather than held in memory. Its length is known up front so the part is sent with a
+    Content-Length rather than chunked.
+    """
+
+    def __init__(self, part, offset, size):
+        self._staged = open(part["path"], "rb")
+        self._staged.seek(offset)
+        self._remaining = size
+
+    def __len__(self):
+        return self._remaining
+
+    def read(self, size=-1):
+        size = self._remaining if size is None or size < 0 else min(size, self._remaining)
+        chunk = self._staged.read(size)
+        self._remaining -= len(chunk)
+        return chunk
+
+    def close(self):
+        self._staged.close()
+
+
+def _upload_part(part):
+    # Each part is the byte range of its staged file at its (1-based) part number
+    offset = (part["part_number"] - 1) * part["part_size"]
+    size = max(0, min(part["part_size"], os.path.getsize(part["path"]) - offset))
+    md5 = hashlib.md5()
+    reader = _PartReader(part, offset, size)
+    try:
+        for chunk in iter(lambda: reader.read(_upload_chunk_size), b""):
+            md5.update(chunk)
+    finally:
+        reader.close()
+    digest = md5.digest()
+    result = {
+        "part_number": part["part_number"],
+        "bytes": size,
+        "checksum": base64.b64encode(digest).decode(),
+        "etag": None,
+        "attempts": 0,
+        "error": None,
+    }
+    start = time.perf_counter()
+    while result["attempts"] <= _upload_retries:
+        if result["attempts"]:
+            time.sleep(min(0.5 * 2 ** (result["attempts"] - 1), 8))
+        result["attempts"] += 1
+        # A fresh reader per attempt, as a failed attempt may have consumed part of the range
+        reader = _PartReader(part, offset, size)
+        try:
+            # Content-MD5 has the object store reject a part that was corrupted in transit
+            response = requests.put(part["url"], data=reader, headers={"Content-MD5": result["checksum"]}, timeout=(5, 300))
+        except requests.RequestException as e:
+            result["error"] = str(e)
+            continue
+        finally:
+            reader.close()
+        if response.status_code >= 300:
+            result["error"] = f"Status {response.status_code}: {response.text[:200]}"
+            if response.status_code in (408, 429) or response.status_code >= 500 or "BadDigest" in response.text:
+                continue
+            break
+        etag = response.headers.get("ETag", "").strip('"')
+        # A plain (non-multipart, unencrypted) ETag is the MD5 of what the store received
+        if len(etag) == 32 and etag != digest.hex():
+            result["error"] = f"Checksum mismatch: sent {digest.hex()}, stored {etag}"
+            continue
+        result["etag"] = etag or None
+        result["error"] = None
+        break
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+with ThreadPoolExecutor(max_workers={{ concurrency|default(4) }}) as _upload_executor:
+    _upload_results = list(_upload_executor.map(_upload_part, _upload_parts))
+
+# Keep each staged file around until every one of its parts is stored so a failed upload can be resumed
+for _upload_path in {part["path"] for part in _upload_parts}:
+    if all(result["error"] is None for part, result in zip(_upload_parts, _upload_results) if part["path"] == _upload_path):
+        os.remove(_upload_path)
+
+_upload_results
@@ -1,5 +1,104 @@
+import os
+import tempfile
 import pandas as pd
+import requests
+from concurrent.futures import ThreadPoolExecutor
 
-{% for var_name, data_url in var_map.items() -%}
-{{ var_name }} = pd.read_csv('{{ data_url }}',)
+try:
+    import pyarrow as _pa
+    import pyarrow.csv as _pa_csv
+    import pyarrow.dataset as _pa_ds
+    import pyarrow.fs as _pa_fs
+except ImportError:
+    _pa = None
+
+_LOAD_COMPRESSION = {"csv": None, "csv.gz": "gzip", "csv.zst": "zstd"}
+
+
+def _csv_convert_options(dtypes):
+    arrow_types = {"int": _pa.int64(), "float": _pa.float64(), "bool": _pa.bool_(), "string": _pa.string()}
+    return _pa_csv.ConvertOptions(
+        column_types={col: arrow_types[hint] for col, hint in dtypes.items() if hint in arrow_types},
+        timestamp_parsers=[_pa_csv.ISO8601],
+    )
+
+
+def _load_csv(path, compression, dtypes):
+    # pyarrow's multithreaded parser when it is installed, otherwise pandas' C parser. Known column types skip inference.
+    if _pa is not None:
+        with _pa.input_stream(path, compression=compression) as stream:
+            return _pa_csv.read_csv(stream, convert_options=_csv_convert_options(dtypes)).to_pandas(date_as_object=False)
+    pandas_types = {"int": "Int64", "float": "float64", "bool": "boolean", "string": "object"}
+    return pd.read_csv(
+        path,
+        compression=compression,
+        dtype={col: pandas_types[hint] for col, hint in dtypes.items() if hint in pandas_types},
+        parse_dates=[col for col, hint in dtypes.items() if hint == "datetime"],
+    )
+
+
+def _open_lazy(path, format, dtypes):
+    # Opens the file as a pyarrow dataset, which reads nothing up front and is scanned in batches on demand. Arrow and
+    # Parquet files are memory-mapped; CSV files are parsed block by block as they are scanned.
+    if _pa is None:
+        raise ImportError("Loading a dataset lazily requires pyarrow")
+    if format in _LOAD_COMPRESSION:
+        file_format = _pa_ds.CsvFileFormat(convert_options=_csv_convert_options(dtypes))
+    else:
+        file_format = {"parquet": "parquet", "feather": "ipc"}[format]
+    return _pa_ds.dataset(path, format=file_format, filesystem=_pa_fs.LocalFileSystem(use_mmap=True))
+
+
+def _load_df(url, format, dtypes):
+    # Files in the kernel's dataset cache are read in place. Anything else is streamed to disk rather than holding
+    # the whole response in memory while it is parsed.
+    if not url.startswith(("http://", "https://")):
+        return _parse_df(url, format, dtypes)
+    fd, path = tempfile.mkstemp(prefix="beaker-load-")
+    try:
+        with os.fdopen(fd, "wb") as download, requests.get(url, stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                download.write(chunk)
+        return _parse_df(path, format, dtypes)
+    finally:
+        os.remove(path)
+
+
+def _parse_df(path, format, dtypes):
+    if format in _LOAD_COMPRESSION:
+        try:
+            return _load_csv(path, _LOAD_COMPRESSION[format], dtypes)
+        except (ValueError, TypeError):
+            if not dtypes:
+                raise
+            # The column metadata doesn't match the file; fall back to inferring the types
+            return _load_csv(path, _LOAD_COMPRESSION[format], {})
+    if format == "parquet":
+        return pd.read_parquet(path)
+    if format == "feather":
+        return pd.read_feather(path)
+    if format == "excel":
+        return pd.read_excel(path)
+    raise ValueError(f"Unsupported dataset format '{format}'")
+
+
+# Download and parse all of the datasets concurrently, collecting any per-dataset failures.
+_load_errors = {}
+with ThreadPoolExecutor(max_workers={{ concurrency|default(4) }}) as _load_executor:
+    _load_futures = {
+{%- for var_name, source in var_map.items() %}
+        "{{ var_name }}": _load_executor.submit(
+            {{ "_open_lazy" if source.lazy else "_load_df" }}, '{{ source.url }}', "{{ source.format }}", {{ source.dtypes }}
+        ),
+{%- endfor %}
+    }
+
+{% for var_name in var_map -%}
+try:
+    {{ var_name }} = _load_futures["{{ var_name }}"].result()
+except Exception as _load_error:
+    _load_errors["{{ var_name }}"] = f"{type(_load_error).__name__}: {_load_error}"
 {% endfor %}
+del _load_futures
+_load_errors
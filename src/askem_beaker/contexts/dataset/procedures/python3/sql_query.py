@@ -0,0 +1,60 @@
+import copy
+import json
+import time
+import pandas as pd
+
+try:
+    import duckdb as _duckdb
+except ImportError:
+    _duckdb = None
+try:
+    import pyarrow.dataset as _pa_ds
+    _sql_table_types = (pd.DataFrame, _pa_ds.Dataset)
+except ImportError:
+    _sql_table_types = (pd.DataFrame,)
+
+# One in-process DuckDB database per session. Every dataframe, and every lazily loaded pyarrow dataset, is registered
+# as a view under its variable name, which DuckDB scans in place rather than copying. The database has no access to
+# files, the network or extensions, so queries can only read the registered tables.
+_sql_connection = globals().get("_sql_connection")
+_sql_registered = globals().get("_sql_registered", set())
+if _duckdb is None:
+    _sql_result = {"error": "SQL queries require the duckdb package to be installed"}
+else:
+    if _sql_connection is None:
+        _sql_connection = _duckdb.connect(config={"enable_external_access": False})
+    _sql_tables = {
+        _sql_name: _sql_table for _sql_name, _sql_table in copy.copy(locals()).items()
+        if not _sql_name.startswith("_") and isinstance(_sql_table, _sql_table_types)
+    }
+    # Views of deleted dataframes would keep them in memory
+    for _sql_name in _sql_registered - set(_sql_tables):
+        _sql_connection.unregister(_sql_name)
+    for _sql_name, _sql_table in _sql_tables.items():
+        _sql_connection.register(_sql_name, _sql_table)
+    _sql_registered = set(_sql_tables)
+
+    _sql_start = time.perf_counter()
+    try:
+        # The query is run as a subquery, which only a SELECT statement can be
+        _sql_relation = _sql_connection.sql("SELECT * FROM (" + {{ query|tojson }} + "\n) AS _sql_query")
+{%- if result_var %}
+        # The full result is only materialized when it is stored in the session
+        {{ result_var }} = _sql_relation.df()
+        _sql_df = {{ result_var }}.head({{ max_rows }} + 1)
+{%- else %}
+        # The relation is lazy, so only `max_rows` rows of the result (plus one, to tell whether there are more) are
+        # ever produced
+        _sql_df = _sql_relation.limit({{ max_rows }} + 1).df()
+{%- endif %}
+        _sql_result = {
+            "columns": _sql_relation.columns,
+            "types": [str(_sql_type) for _sql_type in _sql_relation.types],
+            "rows": json.loads(_sql_df.head({{ max_rows }}).to_json(orient="values", date_format="iso")),
+            "truncated": len(_sql_df) > {{ max_rows }},
+        }
+    except _duckdb.Error as _sql_error:
+        _sql_result = {"error": f"{type(_sql_error).__name__}: {_sql_error}"}
+    _sql_result["seconds"] = round(time.perf_counter() - _sql_start, 3)
+
+_sql_result
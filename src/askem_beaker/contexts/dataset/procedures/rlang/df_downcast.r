@@ -0,0 +1,42 @@
+library(jsonlite)
+
+.df_downcast <- function(df, categorical_ratio) {
+    # Only conversions that keep every value: doubles that all hold whole numbers in integer range to integers, and
+    # character columns with at most `categorical_ratio` distinct values per row to factors
+    before <- as.numeric(object.size(df))
+    columns <- setNames(list(), character(0))
+    for (name in names(df)) {
+        values <- df[[name]]
+        converted <- NULL
+        if (is.double(values) && length(class(values)) == 1 && class(values) == "numeric") {
+            present <- values[!is.na(values)]
+            if (!any(is.nan(values)) && all(present == round(present) & abs(present) <= .Machine$integer.max)) {
+                converted <- as.integer(values)
+            }
+        } else if (is.character(values) && length(values) > 0 && length(unique(values)) <= categorical_ratio * length(values)) {
+            converted <- factor(values)
+        }
+        if (is.null(converted)) next
+        saved <- as.numeric(object.size(values)) - as.numeric(object.size(converted))
+        if (saved > 0) {
+            df[[name]] <- converted
+            columns[[name]] <- list(from = class(values)[1], to = class(converted)[1], saved = saved)
+        }
+    }
+    after <- as.numeric(object.size(df))
+    list(df = df, report = list(before = before, after = after, saved = before - after, columns = columns))
+}
+
+.downcast_result <- list()
+{%- if var_names is not none %}
+.downcast_names <- c({{ var_names|map("tojson")|join(", ") }})
+{%- else %}
+.downcast_names <- Filter(function(.name) is.data.frame(get(.name)), ls())
+{%- endif %}
+for (.var_name in .downcast_names) {
+    .downcast <- .df_downcast(get(.var_name), {{ categorical_ratio }})
+    assign(.var_name, .downcast$df)
+    .downcast_result[[.var_name]] <- .downcast$report
+}
+
+print(toString(toJSON(.downcast_result, auto_unbox = TRUE, digits = NA)))
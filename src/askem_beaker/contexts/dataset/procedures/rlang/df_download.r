@@ -1,8 +1,20 @@
-import pandas as pd; import io
-import time
-output_buff = io.BytesIO()
-{{ var_name|default("df") }}.to_csv(output_buff, index=False, header=True)
-output_buff.seek(0)
+library(jsonlite)
 
-for line in output_buff.getvalue().splitlines():
-    print(line.decode())
+# Write the dataframe straight to a transfer file, which the kernel streams to the client in chunks and removes
+.download_format <- "{{ format|default("csv") }}"
+.download_dir <- if (nchar("{{ transfer_dir }}") > 0) "{{ transfer_dir }}" else tempdir()
+.download_path <- tempfile(pattern = "beaker-download-", tmpdir = .download_dir, fileext = paste0(".", .download_format))
+if (.download_format == "parquet") {
+    if (!requireNamespace("arrow", quietly = TRUE)) {
+        stop("Parquet downloads require the arrow package")
+    }
+    arrow::write_parquet({{ var_name|default("df") }}, .download_path)
+} else if (.download_format == "csv.gz") {
+    .download_conn <- gzfile(.download_path, "w")
+    write.csv({{ var_name|default("df") }}, .download_conn, row.names = FALSE)
+    close(.download_conn)
+} else {
+    write.csv({{ var_name|default("df") }}, .download_path, row.names = FALSE)
+}
+
+print(toString(toJSON(list(path = .download_path, size = file.size(.download_path)), auto_unbox = TRUE, digits = NA)))
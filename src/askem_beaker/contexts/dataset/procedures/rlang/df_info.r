@@ -1,25 +1,118 @@
 library(jsonlite)
 .result = list()
 
+# Profiles from earlier runs, keyed by variable name, are reused for any data.frame that has not changed since
+if (!exists(".df_info_cache")) .df_info_cache <- list()
+
+# With the `arrow` encoding, previews are written as Arrow IPC streams to transfer files the kernel attaches to the
+# preview message as binary buffers. Without the arrow package they fall back to JSON rows.
+.preview_arrow <- {{ "TRUE" if preview_encoding == "arrow" else "FALSE" }} && requireNamespace("arrow", quietly = TRUE)
+
+.df_rows <- function(df, rows) {
+    # Subsets column by column, which works the same for data.frames, tibbles and data.tables
+    data.frame(lapply(df, function(col) col[rows]), check.names = FALSE, stringsAsFactors = FALSE)
+}
+
+.df_fingerprint <- function(df) {
+    # Dimensions, columns and classes catch most changes and a content digest catches in-place edits. Frames over
+    # `full_hash_rows` rows only digest their head, tail and evenly spaced rows so the check stays cheap. Without the
+    # digest package there is no fingerprint and the frame is always re-profiled.
+    if (!requireNamespace("digest", quietly = TRUE)) return(NULL)
+    rows <- nrow(df)
+    sample <- df
+    if (rows > {{ full_hash_rows|default(100000) }}) {
+        sample <- .df_rows(df, unique(c(1:30, round(seq(1, rows, length.out = {{ sample_rows|default(1024) }})), (rows - 29):rows)))
+    }
+    list(dim(df), names(df), lapply(df, class), digest::digest(sample, algo = "xxhash64"))
+}
+
+.df_sample_rows <- function(rows, budget) {
+    # A seeded sample that leaves the session's random number generator as it was
+    if (exists(".Random.seed", envir = globalenv())) {
+        seed <- get(".Random.seed", envir = globalenv())
+        on.exit(assign(".Random.seed", seed, envir = globalenv()))
+    } else {
+        on.exit(rm(".Random.seed", envir = globalenv()))
+    }
+    set.seed(0)
+    sort(sample.int(rows, budget))
+}
+
+.df_statistics <- function(df) {
+    # Frames over the row budget are summarized from a seeded uniform sample of `row_budget` rows rather than in full,
+    # with the number of distinct values in each non-double column estimated with the GEE estimator
+    # (sqrt(N/n) * values seen once + values seen more than once).
+    row_budget <- {{ row_budget|default(0) }}
+    rows <- nrow(df)
+    if (row_budget == 0 || rows <= row_budget) {
+        return(list(
+            statistics = paste(capture.output(summary(df)), collapse = "\n"),
+            statistics_mode = "exact",
+            rows = rows
+        ))
+    }
+    scale <- rows / row_budget
+    sample <- .df_rows(df, .df_sample_rows(rows, row_budget))
+    distinct <- vapply(Filter(Negate(is.double), sample), function(col) {
+        counts <- table(col, useNA = "ifany")
+        min(rows, round(sqrt(scale) * sum(counts == 1) + sum(counts > 1)))
+    }, numeric(1))
+    statistics <- capture.output(summary(sample))
+    if (length(distinct) > 0) {
+        statistics <- c(statistics, "", "Distinct values (est.):", paste0("  ", names(distinct), ": ", distinct))
+    }
+    list(
+        statistics = paste(c(sprintf("Approximate, from a uniform sample of %d of %d rows:", row_budget, rows), statistics), collapse = "\n"),
+        statistics_mode = "sampled",
+        rows = rows,
+        sample_rows = row_budget
+    )
+}
+
+.df_memory <- function(df) {
+    # Memory use in bytes of the frame and each of its columns
+    list(
+        bytes = as.numeric(object.size(df)),
+        columns = lapply(df, function(col) as.numeric(object.size(col))),
+        estimated = FALSE
+    )
+}
+
+.df_preview <- function(df) {
+    # The first 30 rows, either as JSON rows (the column names then one list of values per row) or, for the `arrow`
+    # encoding, as an Arrow IPC stream written to a transfer file
+    preview <- head(df, 30)
+    if (.preview_arrow) {
+        preview_dir <- if (nchar("{{ transfer_dir }}") > 0) "{{ transfer_dir }}" else tempdir()
+        preview_path <- tempfile(pattern = "beaker-preview-", tmpdir = preview_dir, fileext = ".arrow")
+        arrow::write_ipc_stream(preview, preview_path)
+        return(list(columns = names(df), preview_path = preview_path))
+    }
+    # Factors and dates are sent as their labels
+    columns <- lapply(preview, function(col) if (is.factor(col) || inherits(col, c("Date", "POSIXt"))) as.character(col) else col)
+    rows <- if (nrow(preview) > 0) unname(do.call(Map, c(list(list), unname(columns)))) else list()
+    list(columns = names(df), head = c(list(as.list(names(df))), rows))
+}
+
 for (.var_name in ls()) {
     .df <- get(.var_name)
     if (is.data.frame(.df)) {
-        .col_names <- names(.df)
-        .head <- list(as.list(.col_names))
-        for (.i in 1:30) {
-            .row <- list()
-            for (.col_name in .col_names) {
-                .row<-append(.row, .df[[.col_name]][.i])
-            }
-            .head<-append(.head, list(.row))
+        .fingerprint <- .df_fingerprint(.df)
+        .cached <- .df_info_cache[[.var_name]]
+        if (!is.null(.fingerprint) && !is.null(.cached) && identical(.cached$fingerprint, .fingerprint)) {
+            .profile <- .cached$profile
+        } else {
+            .profile <- c(list(datatypes = lapply(.df, class), memory = .df_memory(.df)), .df_statistics(.df))
+            .df_info_cache[[.var_name]] <- list(fingerprint = .fingerprint, profile = .profile)
         }
-        .col_types <- as.list(sapply(.df, class))
-        .col_stats <- toString(as.list(lapply(.df, summary)))
-        .row_info <- list( columns = .col_names, datatypes = .col_types, head = .head, statistics = .col_stats)
-        .result[[.var_name]] <- .row_info
+        # The preview is cheap to rebuild, so it is not cached with the profile
+        .result[[.var_name]] <- c(.profile, .df_preview(.df))
     }
 }
 
-.p <- toJSON(.result, auto_unbox = TRUE)
+# Forget data.frames that have been deleted
+.df_info_cache <- .df_info_cache[intersect(names(.df_info_cache), names(.result))]
+
+.p <- toJSON(.result, auto_unbox = TRUE, null = "null", na = "null", digits = NA)
 .f <- toString(.p)
-print(.f)
\ No newline at end of file
+print(.f)
@@ -0,0 +1,48 @@
+library(jsonlite)
+library(parallel)
+
+.stage_frames <- fromJSON('{{ frames|tojson }}', simplifyVector = FALSE)
+.stage_suffixes <- list(csv = ".csv", csv.gz = ".csv.gz", parquet = ".parquet", arrow = ".arrow")
+
+.stage_column_type <- function(col) {
+    # The type hint for a column, which the kernel passes on to HMI as the column's type
+    if (is.logical(col)) return("bool")
+    if (is.integer(col) && !is.factor(col)) return("int")
+    if (is.double(col) && !inherits(col, c("Date", "POSIXt"))) return("float")
+    if (inherits(col, c("Date", "POSIXt"))) return("datetime")
+    "string"
+}
+
+.stage_frame <- function(frame) {
+    # Stage the dataframe in a file on disk so it can be uploaded, and resumed, in byte ranges
+    df <- get(frame$var_name, envir = globalenv())
+    path <- tempfile(pattern = "beaker-upload-", fileext = .stage_suffixes[[frame$format]])
+    compression <- if (frame$compression == "none") "uncompressed" else frame$compression
+    if (frame$format %in% c("parquet", "arrow") && !requireNamespace("arrow", quietly = TRUE)) {
+        stop(paste0("Saving as ", frame$format, " requires the arrow package"))
+    }
+    if (frame$format == "parquet") {
+        arrow::write_parquet(df, path, compression = compression)
+    } else if (frame$format == "arrow") {
+        arrow::write_feather(df, path, compression = compression)
+    } else if (frame$format == "csv.gz") {
+        connection <- gzfile(path, "w")
+        write.csv(df, connection, row.names = FALSE)
+        close(connection)
+    } else {
+        write.csv(df, path, row.names = FALSE)
+    }
+    list(
+        path = path,
+        size = file.size(path),
+        columns = unname(Map(function(name, col) list(name = name, type = .stage_column_type(col)), names(df), df))
+    )
+}
+
+# Frames are staged in parallel, each in a forked worker
+.stage_results <- mclapply(.stage_frames, .stage_frame, mc.cores = {{ concurrency|default(4) }})
+for (.stage_result in .stage_results) {
+    if (inherits(.stage_result, "try-error")) stop(.stage_result)
+}
+
+print(toString(toJSON(.stage_results, auto_unbox = TRUE, digits = NA)))
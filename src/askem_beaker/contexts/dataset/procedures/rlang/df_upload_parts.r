@@ -0,0 +1,119 @@
+library(jsonlite)
+library(parallel)
+
+if (!requireNamespace("digest", quietly = TRUE)) {
+    stop("Uploading datasets requires the R package 'digest'")
+}
+
+# Parts of one or more staged files, each with the `path` and `part_size` of the file it belongs to
+.upload_parts <- fromJSON('{{ parts|tojson }}', simplifyVector = FALSE)
+.upload_retries <- {{ retries|default(3) }}
+.upload_chunk_size <- 1024 * 1024
+
+.upload_part <- function(part) {
+    # Each part is the byte range of its staged file at its (1-based) part number. The checksum is computed by reading
+    # only that range of the file, so the part is never held in memory.
+    offset <- (part$part_number - 1) * part$part_size
+    size <- max(0, min(part$part_size, file.size(part$path) - offset))
+    digest <- digest::digest(
+        part$path, algo = "md5", serialize = FALSE, file = TRUE, skip = offset, length = size, raw = TRUE
+    )
+    result <- list(
+        part_number = part$part_number,
+        bytes = size,
+        checksum = base64_enc(digest),
+        etag = NA,
+        attempts = 0,
+        error = NA
+    )
+    # A part covering the whole file (as in single mode) is sent from the staged file itself, and any other part is
+    # copied to its own file in bounded chunks; curl streams either from disk
+    part_file <- part$path
+    if (offset > 0 || size < file.size(part$path)) {
+        part_file <- tempfile()
+        staged <- file(part$path, "rb")
+        part_out <- file(part_file, "wb")
+        seek(staged, offset)
+        remaining <- size
+        while (remaining > 0) {
+            chunk <- readBin(staged, "raw", n = min(remaining, .upload_chunk_size))
+            if (length(chunk) == 0) {
+                break
+            }
+            writeBin(chunk, part_out)
+            remaining <- remaining - length(chunk)
+        }
+        close(part_out)
+        close(staged)
+    }
+    header_file <- tempfile()
+    body_file <- tempfile()
+    start <- Sys.time()
+    while (result$attempts <= .upload_retries) {
+        if (result$attempts > 0) {
+            Sys.sleep(min(0.5 * 2^(result$attempts - 1), 8))
+        }
+        result$attempts <- result$attempts + 1
+        # Content-MD5 has the object store reject a part that was corrupted in transit
+        status <- suppressWarnings(as.integer(tail(system2("curl", c(
+            "-sS", "-X", "PUT", "--max-time", "300",
+            "-T", shQuote(part_file),
+            "-H", shQuote(paste0("Content-MD5: ", result$checksum)),
+            "-D", shQuote(header_file), "-o", shQuote(body_file), "-w", "'%{http_code}'",
+            shQuote(part$url)
+        ), stdout = TRUE, stderr = FALSE), 1)))
+        if (length(status) == 0 || is.na(status) || status == 0) {
+            result$error <- "Unable to connect to the object store"
+            next
+        }
+        body <- if (file.exists(body_file)) paste(readLines(body_file, warn = FALSE), collapse = "\n") else ""
+        if (status >= 300) {
+            result$error <- paste0("Status ", status, ": ", substr(body, 1, 200))
+            if (status %in% c(408, 429) || status >= 500 || grepl("BadDigest", body)) {
+                next
+            }
+            break
+        }
+        etag_header <- grep("^etag:", readLines(header_file, warn = FALSE), ignore.case = TRUE, value = TRUE)
+        etag <- if (length(etag_header) > 0) gsub('^[^:]*:\\s*"?|"?\\s*$', "", tail(etag_header, 1)) else ""
+        # A plain (non-multipart, unencrypted) ETag is the MD5 of what the store received
+        if (nchar(etag) == 32 && etag != paste(as.character(digest), collapse = "")) {
+            result$error <- paste0("Checksum mismatch: stored ", etag)
+            next
+        }
+        result$etag <- if (nchar(etag) > 0) etag else NA
+        result$error <- NA
+        break
+    }
+    result$seconds <- round(as.numeric(difftime(Sys.time(), start, units = "secs")), 3)
+    if (part_file != part$path) {
+        unlink(part_file)
+    }
+    unlink(c(header_file, body_file))
+    result
+}
+
+.upload_results <- mclapply(.upload_parts, .upload_part, mc.cores = {{ concurrency|default(4) }})
+# A worker that failed outright is reported as a failed part rather than aborting the whole upload
+.upload_results <- Map(function(.part, .result) {
+    if (inherits(.result, "try-error")) {
+        .condition <- attr(.result, "condition")
+        .message <- if (is.null(.condition)) trimws(as.character(.result)) else conditionMessage(.condition)
+        list(part_number = .part$part_number, error = .message)
+    } else if (is.null(.result)) {
+        list(part_number = .part$part_number, error = "The upload worker exited without a result")
+    } else {
+        .result
+    }
+}, .upload_parts, .upload_results)
+
+# Keep each staged file around until every one of its parts is stored so a failed upload can be resumed
+.upload_stored <- vapply(.upload_results, function(.result) is.na(.result$error), logical(1))
+.upload_paths <- vapply(.upload_parts, function(.part) .part$path, character(1))
+for (.upload_path in unique(.upload_paths)) {
+    if (all(.upload_stored[.upload_paths == .upload_path])) {
+        unlink(.upload_path)
+    }
+}
+
+print(toString(toJSON(.upload_results, auto_unbox = TRUE, na = "null")))
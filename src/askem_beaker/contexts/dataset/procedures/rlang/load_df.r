@@ -1,3 +1,46 @@
-{% for var_name, data_url in var_map.items() -%}
-{{ var_name }} = read.csv("{{ data_url }}")
+{%- set r_types = {"int": "integer", "float": "numeric", "bool": "logical", "string": "character"} -%}
+library(jsonlite)
+.load_errors <- list()
+
+.load_df <- function(url, format, col_classes) {
+    # Files in the kernel's dataset cache are read in place, anything else is downloaded to disk first. Compressed
+    # CSVs are decompressed transparently by the connection R opens for the file.
+    if (grepl("^https?://", url)) {
+        path <- tempfile(pattern = "beaker-load-", fileext = if (format == "csv.gz") ".csv.gz" else "")
+        on.exit(unlink(path))
+        download.file(url, path, mode = "wb", quiet = TRUE)
+    } else {
+        path <- url
+    }
+    if (format %in% c("csv", "csv.gz")) {
+        # data.table's multithreaded fread when it is installed. Known column types skip inference.
+        if (requireNamespace("data.table", quietly = TRUE)) {
+            return(as.data.frame(data.table::fread(path, colClasses = if (length(col_classes)) col_classes else NULL)))
+        }
+        return(read.csv(path, colClasses = if (length(col_classes)) col_classes else NA))
+    }
+    if (format == "parquet" && requireNamespace("arrow", quietly = TRUE)) {
+        return(as.data.frame(arrow::read_parquet(path)))
+    }
+    if (format == "feather" && requireNamespace("arrow", quietly = TRUE)) {
+        return(as.data.frame(arrow::read_feather(path)))
+    }
+    if (format == "excel" && requireNamespace("readxl", quietly = TRUE)) {
+        return(as.data.frame(readxl::read_excel(path)))
+    }
+    stop(paste0("Unsupported dataset format '", format, "'"))
+}
+
+{% for var_name, source in var_map.items() -%}
+tryCatch({
+    .col_classes <- c({% for col, hint in source.dtypes.items() if hint in r_types %}{{ col|tojson }} = "{{ r_types[hint] }}", {% endfor %}NULL)
+    {{ var_name }} <- tryCatch(
+        .load_df("{{ source.url }}", "{{ source.format }}", .col_classes),
+        # The column metadata doesn't match the file; fall back to inferring the types
+        error = function(.e) if (length(.col_classes)) .load_df("{{ source.url }}", "{{ source.format }}", NULL) else stop(.e)
+    )
+}, error = function(.e) {
+    .load_errors[["{{ var_name }}"]] <<- conditionMessage(.e)
+})
 {% endfor %}
+print(toString(toJSON(.load_errors, auto_unbox = TRUE)))
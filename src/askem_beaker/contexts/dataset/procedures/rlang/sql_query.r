@@ -0,0 +1,47 @@
+library(jsonlite)
+
+# One in-process DuckDB database per session. Every data.frame is registered as a view under its variable name, which
+# DuckDB scans in place rather than copying. The database has no access to files, the network or extensions, so
+# queries can only read the registered tables.
+if (!requireNamespace("duckdb", quietly = TRUE)) {
+    .sql_result <- list(error = "SQL queries require the duckdb package to be installed")
+} else {
+    if (!exists(".sql_connection")) {
+        .sql_connection <- DBI::dbConnect(duckdb::duckdb(config = list(enable_external_access = "false")))
+        .sql_registered <- character(0)
+    }
+    .sql_tables <- Filter(function(.name) is.data.frame(get(.name)), ls())
+    # Views of deleted data.frames would keep them in memory
+    for (.sql_name in setdiff(.sql_registered, .sql_tables)) {
+        duckdb::duckdb_unregister(.sql_connection, .sql_name)
+    }
+    for (.sql_name in .sql_tables) {
+        duckdb::duckdb_register(.sql_connection, .sql_name, get(.sql_name), overwrite = TRUE)
+    }
+    .sql_registered <- .sql_tables
+
+    # The query is run as a subquery, which only a SELECT statement can be
+    .sql_query <- paste0("SELECT * FROM (", {{ query|tojson }}, "\n) AS _sql_query")
+    .sql_start <- Sys.time()
+    .sql_result <- tryCatch({
+{%- if result_var %}
+        # The full result is only materialized when it is stored in the session
+        {{ result_var }} <- DBI::dbGetQuery(.sql_connection, .sql_query)
+        .sql_df <- head({{ result_var }}, {{ max_rows }} + 1)
+{%- else %}
+        # Only `max_rows` rows of the result (plus one, to tell whether there are more) are fetched
+        .sql_query_result <- DBI::dbSendQuery(.sql_connection, .sql_query)
+        .sql_df <- DBI::dbFetch(.sql_query_result, n = {{ max_rows }} + 1)
+        DBI::dbClearResult(.sql_query_result)
+{%- endif %}
+        list(
+            columns = names(.sql_df),
+            types = unname(sapply(.sql_df, function(.col) class(.col)[1])),
+            rows = head(.sql_df, {{ max_rows }}),
+            truncated = nrow(.sql_df) > {{ max_rows }}
+        )
+    }, error = function(.sql_error) list(error = conditionMessage(.sql_error)))
+    .sql_result$seconds <- round(as.numeric(Sys.time() - .sql_start, units = "secs"), 3)
+}
+
+print(toString(toJSON(.sql_result, auto_unbox = TRUE, dataframe = "values", digits = NA)))
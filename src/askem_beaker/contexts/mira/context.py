@@ -1,3 +1,4 @@
+import asyncio
 import contextlib
 import io
 import json
@@ -7,7 +8,6 @@ import pickle
 from importlib import import_module
 from typing import TYPE_CHECKING, Any, Dict
 from uuid import uuid4
-import requests
 import datetime
 
 from beaker_kernel.lib.context import BaseContext
@@ -15,6 +15,8 @@ from beaker_kernel.lib.subkernels.python import PythonSubkernel
 from beaker_kernel.lib.utils import action
 
 from .agent import Agent, CONTEXT_JSON
+from askem_beaker.hmi import get_hmi_client
+from askem_beaker.transfer import injection_code
 
 if TYPE_CHECKING:
     from beaker_kernel.kernel import LLMKernel
@@ -51,6 +53,7 @@ class MiraContext(BaseContext):
             ]
         )
         self.amrs = {}
+        self.hmi = get_hmi_client()
 
         super().__init__(beaker_kernel, self.agent_cls, config)
         if not isinstance(self.subkernel, PythonSubkernel):
@@ -60,33 +63,50 @@ class MiraContext(BaseContext):
         self.config["context_info"] = context_info
         self.auth_details = (os.environ.get("AUTH_USERNAME", ""), os.environ.get("AUTH_PASSWORD", ""))
         self.loaded_models = []
+        models = {}
         for item in self.config["context_info"].get("models", []):
             name = item.get("name", None)
             model_id = item.get("model_id", None)
-            self.loaded_models.append(name)
             if name is None or model_id is None:
                 logging.error(f"failed to download dataset from initial context: {name} {model_id}")
-                return
-            await self.fetch_model(name, model_id)
+                continue
+            self.loaded_models.append(name)
+            models[name] = model_id
+        if models:
+            await self.fetch_models(models)
+
+    async def fetch_models(self, models: dict[str, str]):
+        """
+        Fetches the AMRs for a mapping of variable name to model id concurrently and loads them all in a single
+        subkernel execution.
+        """
+        amr_jsons = await asyncio.gather(
+            *(self.hmi.get_cached_json(f"models/{model_id}") for model_id in models.values())
+        )
+        await self.load_mira_models(dict(zip(models.keys(), amr_jsons)))
 
     async def fetch_model(self, name, model_id):
-        model_url = f"{os.environ['HMI_SERVER_URL']}/models/{model_id}"
-        await self.load_mira_model(name, model_url)
+        await self.fetch_models({name: model_id})
 
     async def load_mira_model(self, name, model_url):
-        amr_json = requests.get(model_url, auth=self.auth_details, timeout=10).json()
-        self.amrs[name] = amr_json
-        command = "\n".join(
-            [
-                self.get_code("mira_setup"),
-                self.get_code(
-                    "load_mira_model",
-                    {"var_name": name, "amr_json": amr_json},
-                ),
-            ]
-        )
-        print(f"Running command:\n-------\n{command}\n---------")
-        await self.execute(command)
+        amr_json = await self.hmi.get_cached_json(model_url)
+        await self.load_mira_models({name: amr_json})
+
+    async def load_mira_models(self, amr_jsons: dict[str, dict]):
+        self.amrs.update(amr_jsons)
+        with injection_code("_amr_jsons", amr_jsons) as inject_amrs:
+            command = "\n".join(
+                [
+                    self.get_code("mira_setup"),
+                    inject_amrs,
+                    self.get_code(
+                        "load_mira_model",
+                        {"var_names": list(amr_jsons.keys())},
+                    ),
+                ]
+            )
+            print(f"Running command:\n-------\n{command}\n---------")
+            await self.execute(command)
 
     @action()
     async def save_amr(self, message):
@@ -134,21 +154,14 @@ class MiraContext(BaseContext):
                 "description"
             ] += f"\nTransformed from model '{original_name}' ({original_model_id}) at {datetime.datetime.utcnow().strftime('%c %Z')}"
 
-        create_req = requests.post(
-            f"{os.environ['HMI_SERVER_URL']}/models",
-            json=new_model,
-            auth=self.auth_details,
-        )
+        create_req = await self.hmi.post("models", json=new_model)
         if create_req.status_code >= 300:
             msg = f"failed to put new model: {create_req.status_code}"
             raise ValueError(msg)
         new_model_id = create_req.json()["id"]
 
         if project_id is not None:
-            update_req = requests.post(
-                f"{os.environ['HMI_SERVER_URL']}/projects/{project_id}/assets/model/{new_model_id}",
-                auth=self.auth_details,
-            )
+            update_req = await self.hmi.post(f"projects/{project_id}/assets/model/{new_model_id}")
             if update_req.status_code >= 300:
                 msg = f"failed to add to project id {project_id}: {new_model_id}: {update_req.status_code}"
                 raise ValueError(msg)
@@ -1,5 +1,7 @@
 import copy
 from mira.sources.amr import model_from_json
-amr_json = {{amr_json}}
-{{ var_name|default("model") }} = model_from_json(amr_json)
-_{{ var_name|default("model") }}_orig = copy.deepcopy({{ var_name|default("model") }})
\ No newline at end of file
+{% for var_name in var_names %}
+amr_json = _amr_jsons["{{ var_name }}"]
+{{ var_name }} = model_from_json(amr_json)
+_{{ var_name }}_orig = copy.deepcopy({{ var_name }})
+{%- endfor %}
@@ -2,16 +2,15 @@ import copy
 import datetime
 import json
 import logging
-import os
 from typing import TYPE_CHECKING, Any, Dict, Optional
 
-import requests
-from requests.auth import HTTPBasicAuth
-
 from beaker_kernel.lib.context import BaseContext
 from beaker_kernel.lib.utils import intercept
 
 from .agent import MiraConfigEditAgent
+from askem_beaker.hmi import get_hmi_client
+from askem_beaker.transfer import injection_code
+from askem_beaker.model_preview import ModelPreviewMixin
 
 if TYPE_CHECKING:
     from beaker_kernel.kernel import LLMKernel
@@ -21,7 +20,7 @@ logger = logging.getLogger(__name__)
 
 from mira.sources.amr import model_from_json; 
 
-class MiraConfigEditContext(BaseContext):
+class MiraConfigEditContext(ModelPreviewMixin, BaseContext):
 
     agent_cls = MiraConfigEditAgent
 
@@ -32,11 +31,12 @@ class MiraConfigEditContext(BaseContext):
 
     def __init__(self, beaker_kernel: "LLMKernel", config: Dict[str, Any]) -> None:
         self.reset()
+        self.hmi = get_hmi_client()
         logger.error("initializing...")
         super().__init__(beaker_kernel, self.agent_cls, config)
 
     def reset(self):
-        pass
+        self.reset_preview()
         
     async def setup(self, context_info, parent_header):
         logger.error(f"performing setup...")
@@ -53,12 +53,9 @@ class MiraConfigEditContext(BaseContext):
 
     async def set_model_config(self, item_id, agent=None, parent_header={}):
         self.config_id = item_id
-        meta_url = f"{os.environ['HMI_SERVER_URL']}/model-configurations/as-configured-model/{self.config_id}"
+        meta_url = self.hmi.url(f"model-configurations/as-configured-model/{self.config_id}")
         logger.error(f"Meta url: {meta_url}")
-        self.amr = requests.get(meta_url,
-                                          auth=(os.environ['AUTH_USERNAME'],
-                                                os.environ['AUTH_PASSWORD'])
-                                                ).json()
+        self.amr = await self.hmi.get_cached_json(meta_url)
         logger.error(f"Succeeded in fetching configured model, proceeding.")
         self.schema_name = self.amr.get("header",{}).get("schema_name","petrinet")
         self.original_amr = copy.deepcopy(self.amr)
@@ -67,32 +64,23 @@ class MiraConfigEditContext(BaseContext):
             self.model_config = model_from_json(self.amr)            
         else:
             raise Exception(f"Model config '{item_id}' not found.")
+        # A newly loaded model is always sent in full
+        self.preview_fingerprint = None
         await self.send_mira_preview_message(parent_header=parent_header)
 
     async def load_mira(self):
-        command = "\n".join(
-            [
-                self.get_code("setup"),
-                self.get_code("load_model", {
-                    "var_name": self.var_name,
-                    "model": self.amr,
-                }),
-            ]
-        )
-        print(f"Running command:\n-------\n{command}\n---------")
-        await self.execute(command)        
-
-    async def send_mira_preview_message(
-        self, server=None, target_stream=None, data=None, parent_header={}
-    ):
-        try:
-            preview = await self.evaluate(self.get_code("model_preview"), {"var_name": self.var_name, "schema_name": self.schema_name})
-            content = preview["return"]
-            self.beaker_kernel.send_response(
-                "iopub", "model_preview", content, parent_header=parent_header
+        with injection_code("amr_json", self.amr) as inject_amr:
+            command = "\n".join(
+                [
+                    self.get_code("setup"),
+                    inject_amr,
+                    self.get_code("load_model", {
+                        "var_name": self.var_name,
+                    }),
+                ]
             )
-        except Exception as e:
-            raise
+            print(f"Running command:\n-------\n{command}\n---------")
+            await self.execute(command)
 
     @intercept()
     async def save_model_config_request(self, message):
@@ -112,10 +100,10 @@ class MiraConfigEditContext(BaseContext):
             await self.evaluate(unloader)
         )["return"]
 
-        create_req = requests.put(
-            f"{os.environ['HMI_SERVER_URL']}/model-configurations/as-configured-model/{self.config_id}", json=new_model,
-                auth =(os.environ['AUTH_USERNAME'], os.environ['AUTH_PASSWORD'])
+        create_req = await self.hmi.put(
+            f"model-configurations/as-configured-model/{self.config_id}", json=new_model,
         )
+        self.hmi.invalidate(f"model-configurations/as-configured-model/{self.config_id}")
 
         if create_req.status_code == 200:
             logger.error(f"Successfuly updated model config {self.config_id}")
@@ -3,15 +3,15 @@ import copy
 import datetime
 import json
 import logging
-import os
 from typing import TYPE_CHECKING, Any, Dict, Optional
 
-import requests
-
 from beaker_kernel.lib.context import BaseContext
 from beaker_kernel.lib.utils import intercept
 
 from .agent import MiraModelAgent
+from askem_beaker.hmi import get_hmi_client
+from askem_beaker.transfer import injection_code
+from askem_beaker.model_preview import ModelPreviewMixin
 from askem_beaker.utils import get_auth
 
 if TYPE_CHECKING:
@@ -21,7 +21,7 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
-class MiraModelContext(BaseContext):
+class MiraModelContext(ModelPreviewMixin, BaseContext):
 
     agent_cls = MiraModelAgent
 
@@ -34,6 +34,7 @@ class MiraModelContext(BaseContext):
     def __init__(self, beaker_kernel: "LLMKernel", config: Dict[str, Any]) -> None:
         self.reset()
         self.auth = get_auth()
+        self.hmi = get_hmi_client()
         super().__init__(beaker_kernel, self.agent_cls, config)
 
     async def setup(self, context_info, parent_header):
@@ -52,13 +53,11 @@ class MiraModelContext(BaseContext):
         if item_type == "model":
             self.model_id = item_id
             self.config_id = "default"
-            meta_url = f"{os.environ['HMI_SERVER_URL']}/models/{self.model_id}"
-            self.amr = requests.get(meta_url, auth=self.auth.requests_auth()).json()
+            self.amr = await self.hmi.get_cached_json(f"models/{self.model_id}")
             self.schema_name = self.amr.get("header",{}).get("schema_name","petrinet")
         elif item_type == "model_config":
             self.config_id = item_id
-            meta_url = f"{os.environ['HMI_SERVER_URL']}/model_configurations/{self.config_id}"
-            self.configuration = requests.get(meta_url, auth=self.auth.requests_auth()).json()
+            self.configuration = await self.hmi.get_cached_json(f"model_configurations/{self.config_id}")
             self.model_id = self.configuration.get("model_id")
             self.amr = self.configuration.get("configuration")
             self.schema_name = self.amr.get("header",{}).get("schema_name","petrinet")
@@ -67,25 +66,28 @@ class MiraModelContext(BaseContext):
             await self.load_mira()
         else:
             raise Exception(f"Model '{item_id}' not found.")
+        # A newly loaded model is always sent in full
+        self.preview_fingerprint = None
         await self.send_mira_preview_message(parent_header=parent_header)
 
     async def load_mira(self):
-        model_url = f"{os.environ['HMI_SERVER_URL']}/models/{self.model_id}"
-        command = "\n".join(
-            [
-                self.get_code("setup"),
-                self.get_code("load_model", {
-                    "var_name": self.var_name,
-                    "model_url": model_url,
-                    "auth_header": self.auth.auth_header(),
-                }),
-            ]
-        )
-        print(f"Running command:\n-------\n{command}\n---------")
-        await self.execute(command)
+        # Hand the already-fetched AMR to the subkernel rather than having it download the model again.
+        with injection_code("amr_json", self.amr) as inject_amr:
+            command = "\n".join(
+                [
+                    self.get_code("setup"),
+                    inject_amr,
+                    self.get_code("load_model", {
+                        "var_name": self.var_name,
+                    }),
+                ]
+            )
+            print(f"Running command:\n-------\n{command}\n---------")
+            await self.execute(command)
 
     def reset(self):
         self.model_id = None
+        self.reset_preview()
 
     async def auto_context(self):
         return f"""You are an scientific modeler whose goal is to use the MIRA modeling library to manipulate and stratify Petrinet models in Python.
@@ -121,19 +123,6 @@ If you are asked to manipulate, stratify, or visualize the model, use the genera
         )["return"]
         return json.dumps(amr, indent=2)
 
-    async def send_mira_preview_message(
-        self, server=None, target_stream=None, data=None, parent_header={}
-    ):
-        try:
-
-            preview = await self.evaluate(self.get_code("model_preview", {"var_name": self.var_name, "schema_name": self.schema_name}))
-            content = preview["return"]
-            self.beaker_kernel.send_response(
-                "iopub", "model_preview", content, parent_header=parent_header
-            )
-        except Exception as e:
-            raise
-
     @intercept()
     async def save_amr_request(self, message):
         content = message.content
@@ -175,17 +164,11 @@ If you are asked to manipulate, stratify, or visualize the model, use the genera
                     "description"
                 ] += f"\nfrom base configuration '{self.configuration.get('name')}' ({self.configuration.get('id')})"
 
-        create_req = requests.post(
-            f"{os.environ['HMI_SERVER_URL']}/models", json=new_model,
-            auth=self.auth.requests_auth(),
-        )
+        create_req = await self.hmi.post("models", json=new_model)
         new_model_id = create_req.json()["id"]
 
         if project_id is not None:
-            update_req = requests.post(
-                f"{os.environ['HMI_SERVER_URL']}/projects/{project_id}/assets/model/{new_model_id}",
-                auth=self.auth.requests_auth(),
-            )
+            update_req = await self.hmi.post(f"projects/{project_id}/assets/model/{new_model_id}")
 
         content = {"model_id": new_model_id}
         self.beaker_kernel.send_response(
@@ -2,16 +2,15 @@ import copy
 import datetime
 import json
 import logging
-import os
 from typing import TYPE_CHECKING, Any, Dict, Optional
 
-import requests
-from requests.auth import HTTPBasicAuth
-
 from beaker_kernel.lib.context import BaseContext
 from beaker_kernel.lib.utils import intercept
 
 from .agent import MiraModelEditAgent
+from askem_beaker.hmi import get_hmi_client
+from askem_beaker.transfer import injection_code
+from askem_beaker.model_preview import ModelPreviewMixin
 from askem_beaker.utils import get_auth
 
 if TYPE_CHECKING:
@@ -21,7 +20,7 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
-class MiraModelEditContext(BaseContext):
+class MiraModelEditContext(ModelPreviewMixin, BaseContext):
 
 	agent_cls = MiraModelEditAgent
 
@@ -34,6 +33,7 @@ class MiraModelEditContext(BaseContext):
 	def __init__(self, beaker_kernel: "LLMKernel", config: Dict[str, Any]) -> None:
 		self.reset()
 		self.auth = get_auth()
+		self.hmi = get_hmi_client()
 		super().__init__(beaker_kernel, self.agent_cls, config)
     
 	async def setup(self, context_info, parent_header):
@@ -53,45 +53,35 @@ class MiraModelEditContext(BaseContext):
 		if item_type == "model":
 			self.model_id = item_id
 			self.config_id = "default"
-			meta_url = f"{os.environ['HMI_SERVER_URL']}/models/{self.model_id}"
-			self.amr = requests.get(meta_url, auth=self.auth.requests_auth()).json()
+			self.amr = await self.hmi.get_cached_json(f"models/{self.model_id}")
 			self.schema_name = self.amr.get("header",{}).get("schema_name","petrinet")
 		self.original_amr = copy.deepcopy(self.amr)
 		if self.amr:
 			await self.load_mira()
 		else:
 			raise Exception(f"Model '{item_id}' not found.")
+		# A newly loaded model is always sent in full
+		self.preview_fingerprint = None
 		await self.send_mira_preview_message(parent_header=parent_header)
 
 	async def load_mira(self):
-		model_url = f"{os.environ['HMI_SERVER_URL']}/models/{self.model_id}"
-		command = "\n".join(
+		# Hand the already-fetched AMR to the subkernel rather than having it download the model again.
+		with injection_code("amr_json", self.amr) as inject_amr:
+			command = "\n".join(
 				[
-						self.get_code("setup"),
-						self.get_code("load_model", {
-								"var_name": self.var_name,
-								"model_url": model_url,
-								"auth_header": self.auth.auth_header(),
-						}),
+					self.get_code("setup"),
+					inject_amr,
+					self.get_code("load_model", {
+						"var_name": self.var_name,
+					}),
 				]
-		)
-		print(f"Running command:\n-------\n{command}\n---------")
-		await self.execute(command)
+			)
+			print(f"Running command:\n-------\n{command}\n---------")
+			await self.execute(command)
 
 	def reset(self):
 		self.model_id = None
-
-	async def send_mira_preview_message(
-		self, server=None, target_stream=None, data=None, parent_header={}
-	):
-		try:
-			preview = await self.evaluate(self.get_code("model_preview", {"var_name": self.var_name, "schema_name": self.schema_name}))
-			content = preview["return"]
-			self.beaker_kernel.send_response(
-					"iopub", "model_preview", content, parent_header=parent_header
-			)
-		except Exception as e:
-			raise
+		self.reset_preview()
 
 	@intercept()
 	async def reset_request(self, message):
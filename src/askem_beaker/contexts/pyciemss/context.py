@@ -3,7 +3,6 @@ import copy
 import json
 import datetime
 import os
-import requests
 from base64 import b64encode
 from typing import TYPE_CHECKING, Any, Dict
 
@@ -11,6 +10,8 @@ from beaker_kernel.lib.context import BaseContext
 from beaker_kernel.lib.utils import action
 
 from .agent import PyCIEMSSAgent
+from askem_beaker.hmi import get_hmi_client
+from askem_beaker.transfer import inject_object
 from askem_beaker.utils import get_auth
 
 if TYPE_CHECKING:
@@ -28,6 +29,8 @@ class PyCIEMSSContext(BaseContext):
 
     def __init__(self, beaker_kernel: "LLMKernel", config: Dict[str, Any]) -> None:
         self.auth = get_auth()
+        self.hmi = get_hmi_client()
+        self.upload_concurrency = int(os.environ.get("PYCIEMSS_UPLOAD_CONCURRENCY", 4))
         super().__init__(beaker_kernel, self.agent_cls, config)
 
     async def setup(self, context_info: dict, parent_header):
@@ -39,17 +42,11 @@ class PyCIEMSSContext(BaseContext):
     async def set_model_config(self, config_id, agent=None, parent_header=None):
         if parent_header is None: parent_header = {}
         self.config_id = config_id
-        meta_url = f"{os.environ['HMI_SERVER_URL']}/model-configurations/as-configured-model/{self.config_id}"
-        self.amr = requests.get(meta_url,
-                                          auth=(os.environ['AUTH_USERNAME'],
-                                                os.environ['AUTH_PASSWORD'])
-                                                ).json()
+        self.amr = await self.hmi.get_cached_json(f"model-configurations/as-configured-model/{self.config_id}")
         logger.info(f"Succeeded in fetching configured model, proceeding.")
         self.schema_name = self.amr.get("header",{}).get("schema_name","petrinet")
         self.original_amr = copy.deepcopy(self.amr)
-        command = f"model = {self.amr}"
-        print(f"Running command:\n-------\n{command}\n---------")
-        await self.execute(command)        
+        await inject_object(self, "model", self.amr)
 
     @action()
     async def get_optimize(self, message):
@@ -74,7 +71,7 @@ class PyCIEMSSContext(BaseContext):
 
     @action()
     async def save_results_to_hmi(self, message):
-        post_url = os.environ["HMI_SERVER_URL"] + "/simulations"
+        post_url = "simulations"
         sim_type = message.content.get("sim_type", "simulate")
         auth = self.auth.requests_auth()
         response = await self.evaluate(
@@ -89,7 +86,7 @@ class PyCIEMSSContext(BaseContext):
             "status": "complete",
             "engine": "ciemss",
         }
-        response = requests.post(post_url, json=payload, auth=auth)
+        response = await self.hmi.post(post_url, json=payload)
         if response.status_code >= 300:
             raise Exception(
                 (
@@ -100,53 +97,67 @@ class PyCIEMSSContext(BaseContext):
 
         sim_id = response.json()["id"]
         sim_url = post_url + f"/{sim_id}"
-        payload = requests.get(sim_url, auth=auth).json()
-        result_files = await self.evaluate(
-           f"_save_result('{sim_id}', '{auth.username}', '{auth.password}')" 
+        payload = (await self.hmi.get(sim_url)).json()
+
+        # The dataset is created up front so the simulation's `result.csv` can be uploaded to it as well, without
+        # serializing the data frame twice
+        dataset_id = None
+        data_url = None
+        if "result.csv" in result_files:
+            dataset_payload = {
+                "name": "Beaker Kernel Results",
+                "temporary": False,
+                "publicAsset": True,
+                "description": "Dataset created in the Beaker Kernel PyCIEMSS Context",
+                "fileNames": [
+                    "result.csv"
+                ],
+                "columns": [
+                ],
+                "metadata": {},
+                "source": "beaker-kernel",
+                "grounding": {
+                    "identifiers": {},
+                    "context": {}
+                }
+            }
+
+            dataservice_url = "datasets"
+            create_req = await self.hmi.post(dataservice_url, json=dataset_payload)
+            if create_req.status_code >= 300:
+                raise Exception(
+                    (
+                        "Failed to create dataset on TDS "
+                        f"(reason: {create_req.reason}({create_req.status_code}) - {json.dumps(dataset_payload)}"
+                    )
+                )
+            dataset_id = create_req.json()["id"]
+            dataset_url = dataservice_url + f"/{dataset_id}"
+            data_url_req = await self.hmi.get(f"{dataset_url}/upload-url", params={"filename": "result.csv"})
+            data_url = data_url_req.json().get('url', None)
+
+        save_response = await self.evaluate(
+           f"_save_result('{sim_id}', '{auth.username}', '{auth.password}', max_concurrency={self.upload_concurrency}, "
+           f"dataset_upload_url={data_url!r})"
         )
-        assert isinstance(result_files["return"], list)
+        uploads = save_response.get("return")
+        if not isinstance(uploads, list):
+            raise Exception(f"Failed to upload simulation results: {save_response.get('error')}")
+        for upload in uploads:
+            logger.info(
+                f"Uploaded {upload['filename']} for simulation {sim_id}: {upload['bytes']} bytes in {upload['seconds']}s"
+            )
+        result_files = [upload["filename"] for upload in uploads]
 
-        if "result.csv" not in result_files["return"]:
+        if dataset_id is None:
             return {
                 "simulation_id": sim_id,
-                "result_files": result_files["return"]
+                "result_files": result_files,
+                "uploads": uploads,
             }
 
-
-        dataset_payload = {
-            "name": "Beaker Kernel Results",
-            "temporary": False,
-            "publicAsset": True,
-            "description": "Dataset created in the Beaker Kernel PyCIEMSS Context",
-            "fileNames": [
-                "result.csv"
-            ],
-            "columns": [
-            ],
-            "metadata": {},
-            "source": "beaker-kernel",
-            "grounding": {
-                "identifiers": {},
-                "context": {}
-            }
-        }
-
-        dataservice_url = os.environ["HMI_SERVER_URL"] + "/datasets"
-        create_req = requests.post(dataservice_url, auth=auth, json=dataset_payload)
-        dataset_id = create_req.json()["id"]
-        dataset_url = dataservice_url + f"/{dataset_id}"
-        data_url_req = requests.get(f"{dataset_url}/upload-url?filename=result.csv", auth=auth)
-        data_url = data_url_req.json().get('url', None)
-        code = self.get_code(
-            "df_save_as",
-            {
-                "data_url": data_url,
-            }
-        )
-        kernel_response = await self.execute(code) # TODO: Check error
-
-        add_asset_url = os.environ["HMI_SERVER_URL"] + f"/projects/{message.content['project_id']}/assets/dataset/{dataset_id}"
-        response = requests.post(add_asset_url, auth=auth)
+        add_asset_url = f"projects/{message.content['project_id']}/assets/dataset/{dataset_id}"
+        response = await self.hmi.post(add_asset_url)
         if response.status_code >= 300:
             raise Exception(
                 (
@@ -158,6 +169,7 @@ class PyCIEMSSContext(BaseContext):
         return {
             "dataset_id": dataset_id,
             "simulation_id": sim_id,
+            "uploads": uploads,
         }
 
     save_results_to_hmi._default_payload = '{\n\t"project_id": "a22f4865-c979-4ca2-aae0-5c9afc81b72a"\n}'
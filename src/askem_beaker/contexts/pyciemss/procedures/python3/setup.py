@@ -1,6 +1,10 @@
 import pyciemss
+import io
 import os
+import tempfile
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from requests.auth import HTTPBasicAuth
 import json, dill
 import torch
@@ -48,80 +52,88 @@ def _result_fields() -> list[str]:
     to_filename = lambda key: mapping[key] if key in result else None
     return [to_filename(key) for key in mapping.keys() if to_filename(key) is not None]
    
-# adapted from the pyciemss-service
-def _save_result(job_id, username, password):
-    result_exists = "result" in vars() or "result" in globals()
-    if not (result_exists and isinstance(result, dict)):
-        return
-    auth = HTTPBasicAuth(username, password)
-    sim_results_url = os.environ["HMI_SERVER_URL"] + "/simulations/" + str(job_id)
+def _serialize_result_files() -> dict:
+    """
+    Serializes each artifact in `result` to an in-memory buffer (small JSON documents) or an anonymous temporary
+    file (data frames, pickles), keyed by the filename it is uploaded as.
+    """
     files = {}
 
-    output_filename = "./result.csv"
+    def to_json(obj, **kwargs):
+        return io.BytesIO(json.dumps(obj, default=str, **kwargs).encode("utf-8"))
+
+    def to_temp_file(write):
+        temp_file = tempfile.TemporaryFile()
+        write(temp_file)
+        temp_file.seek(0)
+        return temp_file
+
     data_result = result.get("data", None)
     if data_result is not None:
-        data_result.to_csv(output_filename, index=False)
-        files[output_filename] = "result.csv"
+        files["result.csv"] = to_temp_file(lambda f: data_result.to_csv(f, index=False))
 
     risk_result = result.get("risk", None)
     if risk_result is not None:
-        # Update qoi (tensor) to a list before serializing with json.dumps
-        for k, v in risk_result.items():
-            risk_result[k]["qoi"] = v["qoi"].tolist()
-        risk_json_obj = json.dumps(risk_result, default=str)
-        json_obj = json.loads(risk_json_obj)
-        json_filename = "./risk.json"
-        with open(json_filename, "w") as f:
-            json.dump(json_obj, f, ensure_ascii=False, indent=4)
-        files[json_filename] = "risk.json"
-
-    eval_output_filename = "./eval.csv"
+        # Convert qoi (tensor) to a list for serialization, without modifying the result itself
+        risk_result = {k: {**v, "qoi": v["qoi"].tolist()} for k, v in risk_result.items()}
+        files["risk.json"] = to_json(risk_result, ensure_ascii=False, indent=4)
+
     eval_result = result.get("quantiles", None)
     if eval_result is not None:
-        eval_result.to_csv(eval_output_filename, index=False)
-        files[eval_output_filename] = "eval.csv"
+        files["eval.csv"] = to_temp_file(lambda f: eval_result.to_csv(f, index=False))
 
-    params_filename = "./parameters.dill"
     params_result = result.get("inferred_parameters", None)
     if params_result is not None:
-        with open(params_filename, "wb") as file:
-            dill.dump(params_result, file)
-        files[params_filename] = "parameters.dill"
+        files["parameters.dill"] = to_temp_file(lambda f: dill.dump(params_result, f))
 
-    policy_filename = "./policy.json"
     policy = result.get("policy", None)
     if policy is not None:
-        with open(policy_filename, "w") as file:
-            json.dump(policy.tolist(), file)
-        files[policy_filename] = "policy.json"
+        files["policy.json"] = to_json(policy.tolist())
 
-    results_filename = "./optimize_results.dill"
+    # Only the JSON form of the optimize results is uploaded (see `_result_fields`).
     results = result.get("OptResults", None)
     if results is not None:
-        json_obj = json.loads(json.dumps(results, default=str))
-        json_filename = "./optimize_result.json"
-        with open(json_filename, "w") as f:
-            json.dump(json_obj, f, ensure_ascii=False, indent=4)
-        files[json_filename] = "optimize_results.json"
+        files["optimize_results.json"] = to_json(results, ensure_ascii=False, indent=4)
 
-        with open(results_filename, "wb") as file:
-            dill.dump(results, file)
-        files[results_filename] = "optimize_results.dill"
-
-    visualization_filename = "./visualization.json"
     viz_result = result.get("visual", None)
     if viz_result is not None:
-        with open(visualization_filename, "w") as f:
-            json.dump(viz_result, f, indent=2)
-        files[visualization_filename] = "visualization.json"
+        files["visualization.json"] = to_json(viz_result, indent=2)
+
+    return files
 
-    for location, handle in files.items():
-        upload_url = f"{sim_results_url}/upload-url?filename={handle}"
-        upload_response = requests.get(upload_url, auth=auth)
+
+# adapted from the pyciemss-service
+def _save_result(job_id, username, password, max_concurrency=4, dataset_upload_url=None) -> list[dict]:
+    """
+    Uploads the artifacts in `result` to the simulation in parallel, returning the filename, size in bytes and
+    upload time in seconds of each file. With a presigned `dataset_upload_url`, `result.csv` is also uploaded there
+    from the same serialized file.
+    """
+    result_exists = "result" in vars() or "result" in globals()
+    if not (result_exists and isinstance(result, dict)):
+        return []
+    sim_results_url = os.environ["HMI_SERVER_URL"] + "/simulations/" + str(job_id)
+    files = _serialize_result_files()
+
+    hmi_session = requests.Session()
+    hmi_session.auth = HTTPBasicAuth(username, password)
+    # Presigned upload urls must not be sent the HMI credentials
+    storage_session = requests.Session()
+
+    def upload(handle, file_obj):
+        start = time.perf_counter()
+        upload_response = hmi_session.get(f"{sim_results_url}/upload-url", params={"filename": handle})
         presigned_upload_url = upload_response.json()["url"]
 
-        with open(location, "rb") as f:
-            upload_response = requests.put(presigned_upload_url, f)
+        file_obj.seek(0, os.SEEK_END)
+        size = file_obj.tell()
+        file_obj.seek(0)
+        upload_urls = [presigned_upload_url]
+        if handle == "result.csv" and dataset_upload_url is not None:
+            upload_urls.append(dataset_upload_url)
+        for upload_url in upload_urls:
+            file_obj.seek(0)
+            upload_response = storage_session.put(upload_url, data=file_obj)
             if upload_response.status_code >= 300:
                 raise Exception(
                     (
@@ -129,5 +141,12 @@ def _save_result(job_id, username, password):
                         f"(status: {upload_response.status_code}): {handle}"
                     )
                 )
-
-    return list(files.values())
+        return {"filename": handle, "bytes": size, "seconds": round(time.perf_counter() - start, 3)}
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            futures = [executor.submit(upload, handle, file_obj) for handle, file_obj in files.items()]
+        return [future.result() for future in futures]
+    finally:
+        for file_obj in files.values():
+            file_obj.close()
@@ -0,0 +1,291 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = "~/.cache/askem_beaker/datasets"
+DEFAULT_CACHE_MAX_BYTES = 20 * 1024 ** 3
+CHUNK_SIZE = 1024 * 1024
+METRICS = ("hits", "misses", "bytes_saved", "bytes_downloaded", "evictions")
+
+
+@dataclass
+class CachedFile:
+    path: str
+    hit: bool
+    size: int
+    seconds: float
+
+
+@contextlib.contextmanager
+def _locked(path: str, blocking: bool = True) -> Iterator[None]:
+    """
+    Holds an exclusive `flock` on `path` for the duration of the block. Raises `BlockingIOError` if `blocking` is
+    false and another process holds the lock.
+    """
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_json(path: str, obj: dict) -> None:
+    # Written to a temporary file in the same directory and renamed over the original so readers never see a partial
+    # file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    with os.fdopen(fd, "w") as temp_file:
+        json.dump(obj, temp_file)
+    os.replace(temp_path, path)
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class DatasetCache:
+    """
+    Node-local cache of dataset files, shared by every kernel on the node.
+
+    Each entry holds the file for one asset id and filename along with the ETag (or Last-Modified date) it was served
+    with. A cached file is revalidated with a conditional GET every time it is requested, so a changed file is fetched
+    again while an unchanged one costs a single round trip rather than the whole download.
+
+    Files are written to a temporary file and renamed into place, and a per-entry file lock makes concurrent kernels
+    asking for the same file wait for a single download. Once the cache grows beyond `max_bytes` the least recently
+    used entries are evicted. Hit, miss and byte counts are kept for the node in `metrics.json`.
+
+    Files that are opened lazily, and so are read again long after `fetch` returns, are `pin`ned: hard-linked into a
+    directory owned by the kernel process, where evicting or revalidating the entry can't remove or change them.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None) -> None:
+        self.root = os.path.expanduser(root or os.environ.get("BEAKER_DATASET_CACHE_DIR", DEFAULT_CACHE_DIR))
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.environ.get("BEAKER_DATASET_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES)
+        )
+        self.entries_dir = os.path.join(self.root, "entries")
+        self.metrics_path = os.path.join(self.root, "metrics.json")
+        self.lock_path = os.path.join(self.root, ".lock")
+        self.sessions_dir = os.path.join(self.root, "sessions")
+        os.makedirs(self.entries_dir, exist_ok=True)
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        self.session = requests.Session()
+        self._session_dir = None
+        self._session_lock = None
+
+    def entry_dir(self, asset_id: str, filename: str) -> str:
+        key = hashlib.sha256(f"{asset_id}\0{filename}".encode()).hexdigest()[:32]
+        return os.path.join(self.entries_dir, key)
+
+    def fetch(
+        self,
+        asset_id: str,
+        filename: str,
+        url: str,
+        progress: Optional[Callable[[int, Optional[int]], None]] = None,
+        **kwargs,
+    ) -> CachedFile:
+        """
+        Returns the cached copy of `filename` for `asset_id`, downloading it from `url` if it is not cached or has
+        changed. `progress` is called with the bytes transferred and the total (if known) while downloading. Any other
+        keyword arguments are passed on to the request.
+        """
+        start = time.perf_counter()
+        entry_dir = self.entry_dir(asset_id, filename)
+        while True:
+            os.makedirs(entry_dir, exist_ok=True)
+            with _locked(os.path.join(entry_dir, ".lock")):
+                # The entry may have been evicted while waiting for the lock
+                if not os.path.isdir(entry_dir):
+                    continue
+                cached = self._fetch_locked(entry_dir, asset_id, filename, url, progress, **kwargs)
+                break
+        self.enforce_limit(keep=entry_dir)
+        cached.seconds = round(time.perf_counter() - start, 3)
+        return cached
+
+    def _fetch_locked(self, entry_dir, asset_id, filename, url, progress, **kwargs) -> CachedFile:
+        data_path = os.path.join(entry_dir, os.path.basename(filename))
+        meta_path = os.path.join(entry_dir, "meta.json")
+        meta = _read_json(meta_path) if os.path.exists(data_path) else None
+
+        headers = dict(kwargs.pop("headers", {}))
+        if meta and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        elif meta and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        with self.session.get(url, headers=headers, stream=True, **kwargs) as response:
+            if meta and response.status_code == 304:
+                _write_json(meta_path, {**meta, "last_access": time.time()})
+                self._record(hits=1, bytes_saved=meta["size"])
+                return CachedFile(data_path, True, meta["size"], 0.0)
+            response.raise_for_status()
+
+            total = int(response.headers.get("Content-Length", 0)) or None
+            transferred = 0
+            last_report = time.perf_counter()
+            fd, temp_path = tempfile.mkstemp(dir=entry_dir, prefix=".download-")
+            try:
+                with os.fdopen(fd, "wb") as temp_file:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        temp_file.write(chunk)
+                        transferred += len(chunk)
+                        if progress and time.perf_counter() - last_report >= 0.5:
+                            progress(transferred, total)
+                            last_report = time.perf_counter()
+                os.replace(temp_path, data_path)
+            except BaseException:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(temp_path)
+                raise
+            if progress:
+                progress(transferred, total)
+
+            _write_json(meta_path, {
+                "asset_id": asset_id,
+                "filename": filename,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "size": transferred,
+                "last_access": time.time(),
+            })
+        self._record(misses=1, bytes_downloaded=transferred)
+        return CachedFile(data_path, False, transferred, 0.0)
+
+    def pin(self, path: str) -> str:
+        """
+        Returns a path to the cached file at `path` that stays valid until it is unpinned or this process exits, for
+        files that are opened lazily. The file is hard-linked (or, where the filesystem doesn't support hard links,
+        copied) into this process's session directory, so a later eviction or revalidation of the entry leaves it as
+        it is. Pinned files don't count towards `max_bytes`. Raises `FileNotFoundError` if the entry has been evicted
+        since it was fetched.
+        """
+        pinned_path = os.path.join(self.session_dir(), f"{uuid.uuid4().hex[:8]}-{os.path.basename(path)}")
+        with _locked(os.path.join(os.path.dirname(path), ".lock")):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Cached file '{path}' has been evicted")
+            try:
+                os.link(path, pinned_path)
+            except OSError:
+                shutil.copyfile(path, pinned_path)
+        return pinned_path
+
+    def unpin(self, pinned_path: str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(pinned_path)
+
+    def session_dir(self) -> str:
+        """
+        Returns this process's directory for pinned files, creating it on first use. The directory is locked for as
+        long as the process runs, and directories left behind by processes that have exited are removed.
+        """
+        if self._session_dir is None:
+            self._remove_stale_sessions()
+            # Locked before it is renamed into place so it is never mistaken for a stale session
+            new_dir = tempfile.mkdtemp(dir=self.sessions_dir, prefix=".new-")
+            self._session_lock = open(os.path.join(new_dir, ".lock"), "a")
+            fcntl.flock(self._session_lock, fcntl.LOCK_EX)
+            session_dir = os.path.join(self.sessions_dir, f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+            os.rename(new_dir, session_dir)
+            self._session_dir = session_dir
+        return self._session_dir
+
+    def _remove_stale_sessions(self) -> None:
+        for name in os.listdir(self.sessions_dir):
+            if name.startswith("."):
+                continue
+            session_dir = os.path.join(self.sessions_dir, name)
+            try:
+                with _locked(os.path.join(session_dir, ".lock"), blocking=False):
+                    shutil.rmtree(session_dir, ignore_errors=True)
+            except (BlockingIOError, FileNotFoundError):
+                continue
+
+    def enforce_limit(self, keep: Optional[str] = None) -> None:
+        """
+        Evicts the least recently used entries until the cache fits in `max_bytes`. The `keep` entry and any entry
+        that is being downloaded are never evicted.
+        """
+        with _locked(self.lock_path):
+            entries = []
+            for key in os.listdir(self.entries_dir):
+                entry_dir = os.path.join(self.entries_dir, key)
+                meta = _read_json(os.path.join(entry_dir, "meta.json"))
+                if meta:
+                    entries.append((meta.get("last_access", 0), meta.get("size", 0), entry_dir))
+            total = sum(size for _, size, _ in entries)
+            evictions = 0
+            for _, size, entry_dir in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if entry_dir == keep:
+                    continue
+                try:
+                    with _locked(os.path.join(entry_dir, ".lock"), blocking=False):
+                        shutil.rmtree(entry_dir)
+                except BlockingIOError:
+                    continue
+                total -= size
+                evictions += 1
+            if evictions:
+                self._record_locked(evictions=evictions)
+
+    def _record(self, **deltas) -> None:
+        with _locked(self.lock_path):
+            self._record_locked(**deltas)
+
+    def _record_locked(self, **deltas) -> None:
+        metrics = _read_json(self.metrics_path) or {}
+        for name, delta in deltas.items():
+            metrics[name] = metrics.get(name, 0) + delta
+        _write_json(self.metrics_path, metrics)
+
+    def stats(self) -> dict:
+        """
+        Returns the node-wide hit, miss, byte and eviction counts along with the current size of the cache.
+        """
+        # Held so that no entry is evicted while the entries are walked
+        with _locked(self.lock_path):
+            metrics = _read_json(self.metrics_path) or {}
+            sizes = [
+                (_read_json(os.path.join(self.entries_dir, key, "meta.json")) or {}).get("size", 0)
+                for key in os.listdir(self.entries_dir)
+            ]
+        return {
+            **{name: metrics.get(name, 0) for name in METRICS},
+            "entries": len(sizes),
+            "bytes": sum(sizes),
+            "max_bytes": self.max_bytes,
+        }
+
+
+_cache: Optional[DatasetCache] = None
+
+
+def get_dataset_cache() -> DatasetCache:
+    """
+    Returns the process-wide handle on the node's dataset cache, creating it on first use.
+    """
+    global _cache
+    if _cache is None:
+        _cache = DatasetCache()
+    return _cache
@@ -0,0 +1,240 @@
+import asyncio
+import copy
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from askem_beaker.utils import TerariumAuth, get_auth
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 60.0
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_CACHE_TTL = 30.0
+DEFAULT_CACHE_MAX_ENTRIES = 256
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    etag: Optional[str]
+    last_modified: Optional[str]
+    validated_at: float
+
+
+class MetadataCache:
+    """
+    Size-bounded LRU cache of JSON documents fetched from the HMI server, keyed by request url.
+
+    Entries younger than `ttl` seconds are served without contacting the server. Older entries are revalidated with a
+    conditional GET (`If-None-Match`/`If-Modified-Since`) so an unchanged document is not transferred again. Entries
+    are dropped explicitly with `invalidate` after the kernel writes to the asset they describe.
+    """
+
+    def __init__(self, ttl: float, max_entries: int) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.monotonic() - entry.validated_at < self.ttl
+
+    def put(self, key: str, value: Any, etag: Optional[str], last_modified: Optional[str]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = CacheEntry(value, etag, last_modified, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def touch(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._entries[key].validated_at = time.monotonic()
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """
+        Drops the entry for `key` along with any entries for the same url with query parameters, or every entry if no
+        key is given.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                return
+            for cached_key in [k for k in self._entries if k == key or k.startswith(f"{key}?")]:
+                del self._entries[cached_key]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "revalidations": self.revalidations,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class HMIClient:
+    """
+    Awaitable client for the HMI server.
+
+    Requests are made through a single keep-alive `requests.Session` on a bounded thread pool so that async context
+    handlers never block the kernel's event loop and connections are reused between calls. The pool size caps the
+    number of in-flight requests; any request beyond that waits for a free slot.
+
+    Asset metadata read with `get_cached_json` is kept in a `MetadataCache` shared by every context in the process.
+    """
+
+    auth: Optional[TerariumAuth]
+    timeout: tuple[float, float]
+    max_concurrency: int
+    cache: MetadataCache
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        auth: Optional[TerariumAuth] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+    ) -> None:
+        self._base_url = base_url
+        self.auth = auth if auth is not None else get_auth()
+        self.timeout = (
+            connect_timeout or float(os.environ.get("HMI_CLIENT_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+            read_timeout or float(os.environ.get("HMI_CLIENT_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)),
+        )
+        self.max_concurrency = max_concurrency or int(
+            os.environ.get("HMI_CLIENT_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)
+        )
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_concurrency, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="hmi-client")
+        self.cache = MetadataCache(
+            ttl=float(os.environ.get("HMI_CACHE_TTL", DEFAULT_CACHE_TTL)),
+            max_entries=int(os.environ.get("HMI_CACHE_MAX_ENTRIES", DEFAULT_CACHE_MAX_ENTRIES)),
+        )
+
+    @property
+    def base_url(self) -> str:
+        # Resolved lazily so the client can be created before the environment is fully populated.
+        return (self._base_url or os.environ["HMI_SERVER_URL"]).rstrip("/")
+
+    def url(self, path: str) -> str:
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _send(self, method: str, url: str, use_auth: bool, **kwargs) -> requests.Response:
+        if use_auth and self.auth is not None:
+            kwargs.setdefault("auth", self.auth.requests_auth())
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    async def request(self, method: str, path: str, *, use_auth: bool = True, **kwargs) -> requests.Response:
+        """
+        Perform an HTTP request without blocking the event loop.
+
+        `path` may be relative to `HMI_SERVER_URL` or an absolute URL (e.g. a presigned storage URL, in which case
+        `use_auth=False` should be passed so HMI credentials are not forwarded). Remaining keyword arguments are passed
+        through to `requests.Session.request`.
+        """
+        url = self.url(path)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: self._send(method, url, use_auth, **kwargs))
+
+    async def get(self, path: str, **kwargs) -> requests.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> requests.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def put(self, path: str, **kwargs) -> requests.Response:
+        return await self.request("PUT", path, **kwargs)
+
+    async def delete(self, path: str, **kwargs) -> requests.Response:
+        return await self.request("DELETE", path, **kwargs)
+
+    async def get_json(self, path: str, **kwargs) -> Any:
+        response = await self.get(path, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    async def get_cached_json(self, path: str, params: Optional[dict] = None) -> Any:
+        """
+        Returns the JSON document at `path` (e.g. `datasets/<id>` or `models/<id>`) through the metadata cache.
+
+        A copy of the cached document is returned, so callers are free to modify it.
+        """
+        key = requests.Request("GET", self.url(path), params=params).prepare().url
+        entry = self.cache.get(key)
+        if entry is not None and self.cache.is_fresh(entry):
+            self.cache.hits += 1
+            return copy.deepcopy(entry.value)
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        response = await self.get(key, headers=headers)
+        if entry is not None and response.status_code == 304:
+            self.cache.revalidations += 1
+            self.cache.touch(key)
+            return copy.deepcopy(entry.value)
+
+        self.cache.misses += 1
+        response.raise_for_status()
+        value = response.json()
+        self.cache.put(key, copy.deepcopy(value), response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return value
+
+    def invalidate(self, path: str) -> None:
+        """
+        Drops any cached metadata for `path`. Call this after writing to an asset so the next read sees the change.
+        """
+        self.cache.invalidate(self.url(path))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+_client: Optional[HMIClient] = None
+
+
+def get_hmi_client() -> HMIClient:
+    """
+    Returns the process-wide HMI client, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        _client = HMIClient()
+    return _client
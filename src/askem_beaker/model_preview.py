@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+logger = logging.getLogger(__name__)
+
+MODEL_PREVIEW_FORMATS = ("png", "svg")
+
+# Procedures shared by every context that previews MIRA models, by subkernel slug
+PROCEDURES_DIR = os.path.join(os.path.dirname(__file__), "procedures")
+
+# The graphs the subkernel may lay out, in turn, for a preview, each within `render_seconds`. A render still pending
+# once they all could have been, plus a grace period for building the graphs and polling, is given up on.
+PREVIEW_GRAPH_STRATEGIES = ("full", "collapsed")
+PREVIEW_RENDER_GRACE_SECONDS = 10
+
+
+def get_model_preview_settings() -> dict:
+    """
+    Settings for the MIRA contexts' model previews: the image `render_format`, the most templates and concepts a graph
+    may have to be drawn (`max_templates`, `max_concepts`), and the seconds a layout may take and the bytes the image
+    may have (`render_seconds`, `render_max_bytes`) before the preview falls back to a smaller rendering.
+    """
+    settings = {
+        "render_format": os.environ.get("MODEL_PREVIEW_FORMAT", "png"),
+        "max_templates": int(os.environ.get("MODEL_PREVIEW_MAX_TEMPLATES", 150)),
+        "max_concepts": int(os.environ.get("MODEL_PREVIEW_MAX_CONCEPTS", 75)),
+        "render_seconds": float(os.environ.get("MODEL_PREVIEW_RENDER_SECONDS", 20)),
+        "render_max_bytes": int(os.environ.get("MODEL_PREVIEW_MAX_BYTES", 2 * 1024 * 1024)),
+    }
+    if settings["render_format"] not in MODEL_PREVIEW_FORMATS:
+        raise ValueError(
+            f"Unknown model preview format '{settings['render_format']}'. "
+            f"Expected one of: {', '.join(MODEL_PREVIEW_FORMATS)}"
+        )
+    return settings
+
+
+class ModelPreviewMixin:
+    """
+    Sends `model_preview` messages for the MIRA model held in the context's `var_name`, of schema `schema_name`.
+
+    Mixed in ahead of `BaseContext`, it adds the shared `model_preview` and `model_preview_render` procedures to the
+    context's templates. Contexts call `reset_preview()` from `reset()` and `send_mira_preview_message()` whenever the
+    model may have changed.
+    """
+
+    preview_render_task: Optional[asyncio.Task] = None
+    preview_render_fingerprint: Optional[str] = None
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.preview_settings = get_model_preview_settings()
+        super().__init__(*args, **kwargs)
+        code_dir = os.path.join(PROCEDURES_DIR, self.subkernel.SLUG)
+        if os.path.exists(code_dir):
+            jinja_env = Environment(loader=FileSystemLoader(code_dir), autoescape=select_autoescape())
+            for template_file in jinja_env.list_templates():
+                template_name, _ = os.path.splitext(template_file)
+                self.templates[template_name] = jinja_env.get_template(template_file)
+
+    def reset_preview(self):
+        self.cancel_preview_render()
+        self.preview_fingerprint = None
+        self.preview_content = None
+        self.preview_cache = {}
+
+    async def send_mira_preview_message(
+        self, server=None, target_stream=None, data=None, parent_header={}
+    ):
+        # The AMR is sent straight away while the model is rendered in the background in the subkernel, to be sent in a
+        # follow-up `model_preview` once it is ready. The subkernel only renders the model again once it has changed, and
+        # only returns the preview if it differs from the one last sent.
+        preview = await self.evaluate(self.get_code("model_preview", {
+            "var_name": self.var_name,
+            "schema_name": self.schema_name,
+            "sent_fingerprint": self.preview_fingerprint or "",
+            **self.preview_settings,
+        }))
+        content = preview["return"]
+        self.preview_cache = content["cache"]
+        if content["fingerprint"] != self.preview_render_fingerprint:
+            # The model has changed, so any render of its previous version has been cancelled
+            self.cancel_preview_render()
+        if content["preview"] is None:
+            logger.debug(f"Model preview unchanged: {content['cache']}")
+            self.beaker_kernel.send_response(
+                "iopub", "model_preview_unchanged",
+                {"fingerprint": content["fingerprint"], "cache": content["cache"]},
+                parent_header=parent_header,
+            )
+        else:
+            self.preview_fingerprint = content["fingerprint"]
+            self.preview_content = content["preview"]
+            self.beaker_kernel.send_response(
+                "iopub", "model_preview", content["preview"], parent_header=parent_header
+            )
+        if content["rendering"] and self.preview_render_task is None:
+            self.preview_render_fingerprint = content["fingerprint"]
+            self.preview_render_task = asyncio.create_task(
+                self.send_preview_render(content["fingerprint"], parent_header=parent_header)
+            )
+
+    async def send_preview_render(self, fingerprint, parent_header={}):
+        """
+        Waits for the subkernel to finish rendering the model with `fingerprint`, then sends the preview again with
+        its rendering: the graph, or a summary table for models too large to draw. A render that fails, or that isn't
+        done by the time both graphs could have been laid out, is reported with a `model_preview_error` message.
+        """
+        timeout = len(PREVIEW_GRAPH_STRATEGIES) * self.preview_settings["render_seconds"] + PREVIEW_RENDER_GRACE_SECONDS
+        deadline = time.monotonic() + timeout
+        delay = 0.1
+        status = {"status": "pending"}
+        try:
+            while status["status"] == "pending":
+                await asyncio.sleep(delay)
+                delay = min(delay * 1.5, 0.5)
+                try:
+                    # The subkernel may also be busy running a cell, which holds up the evaluation
+                    render = await asyncio.wait_for(
+                        self.evaluate(self.get_code("model_preview_render", {"fingerprint": fingerprint})),
+                        timeout=deadline - time.monotonic(),
+                    )
+                    if not isinstance(render.get("return"), dict):
+                        raise RuntimeError(f"Unexpected render status from the subkernel: {render.get('return')!r}")
+                    status = render["return"]
+                except asyncio.TimeoutError:
+                    status = {"status": "failed", "error": f"The render was not done within {timeout:g}s"}
+                except Exception as e:
+                    status = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+        finally:
+            if self.preview_render_task is asyncio.current_task():
+                self.preview_render_task = None
+                self.preview_render_fingerprint = None
+        if fingerprint != self.preview_fingerprint:
+            # A newer version of the model has been sent since
+            return
+        if status["status"] == "failed":
+            logger.warning(f"Unable to render model preview: {status['error']}")
+            self.beaker_kernel.send_response(
+                "iopub", "model_preview_error", {"fingerprint": fingerprint, "error": status["error"]},
+                parent_header=parent_header,
+            )
+        elif status["status"] == "done":
+            self.beaker_kernel.send_response(
+                "iopub", "model_preview", {**self.preview_content, **status["output"]}, parent_header=parent_header
+            )
+
+    def cancel_preview_render(self):
+        if self.preview_render_task is not None:
+            self.preview_render_task.cancel()
+        self.preview_render_task = None
+        self.preview_render_fingerprint = None
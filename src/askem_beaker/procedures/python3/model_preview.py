@@ -0,0 +1,268 @@
+import base64
+import hashlib
+import html
+import json
+import subprocess
+import threading
+import time
+from collections import Counter, defaultdict
+
+from mira.modeling.amr.petrinet import template_model_to_petrinet_json
+from mira.modeling.amr.stockflow import template_model_to_stockflow_json
+from mira.modeling.amr.regnet import template_model_to_regnet_json
+
+# Previews, keyed by variable and schema, with the fingerprint of the model each was built from. Laying out and
+# rendering the graph is the slow part, so it is done in a background thread and only done again once the model has
+# changed. The kernel collects the rendering with `model_preview_render`.
+if "_model_preview_cache" not in globals():
+    _model_preview_cache = {}
+    _model_preview_stats = {"renders": 0, "renders_avoided": 0, "renders_cancelled": 0}
+    _model_preview_render = None
+
+_PREVIEW_FORMAT = "{{ render_format|default("png") }}"
+_PREVIEW_MIMETYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def _model_fingerprint(model):
+    # A digest of the whole serialized template model, which is everything the graph and the AMR are built from
+    serialize = getattr(model, "model_dump_json", None) or model.json
+    return hashlib.sha256(serialize().encode()).hexdigest()
+
+
+def _concept_base_name(concept):
+    # The concept's name before stratification. Stratifying in this session keeps it on the concept; a model loaded
+    # from an AMR only has the stratified name, so the strata in the concept's context are stripped from its end.
+    base_name = getattr(concept, "_base_name", None)
+    if base_name and base_name != concept.name:
+        return base_name
+    name = concept.name
+    strata = {str(value) for value in (concept.context or {}).values()}
+    stripped = True
+    while stripped:
+        stripped = False
+        for stratum in strata:
+            if name.endswith(f"_{stratum}") and len(name) > len(stratum) + 1:
+                name = name[: -len(stratum) - 1]
+                stripped = True
+    return name
+
+
+def _template_edges(template):
+    # (subject, outcome) and controllers of a template, any of which may be missing
+    controllers = getattr(template, "controllers", None) or []
+    if getattr(template, "controller", None) is not None:
+        controllers = [template.controller]
+    return getattr(template, "subject", None), getattr(template, "outcome", None), controllers
+
+
+def _dot_id(name):
+    # A quoted DOT id, in which `\n` is kept as a line break
+    return '"' + str(name).replace('"', '\\"') + '"'
+
+
+def _collapsed_graph(model):
+    # The graph with every concept grouped by its pre-stratification name and the templates between two groups drawn
+    # as a single edge labelled with their type and count
+    strata = Counter(_concept_base_name(concept) for concept in model.get_concepts_map().values())
+    edges = Counter()
+    control_edges = Counter()
+    for template in model.templates:
+        subject, outcome, controllers = _template_edges(template)
+        if subject is None and outcome is None:
+            continue
+        source = _concept_base_name(subject) if subject is not None else "∅"
+        target = _concept_base_name(outcome) if outcome is not None else "∅"
+        edges[(source, target, type(template).__name__)] += 1
+        for controller in controllers:
+            control_edges[(_concept_base_name(controller), target)] += 1
+    lines = ["digraph model {", "  rankdir=LR;", '  node [shape=ellipse, style=filled, fillcolor="#e8f1fb"];']
+    for name, count in strata.items():
+        label = f"{name}\\n({count} strata)" if count > 1 else name
+        lines.append(f"  {_dot_id(name)} [label={_dot_id(label)}];")
+    if any("∅" in edge[:2] for edge in edges):
+        lines.append('  "∅" [shape=point];')
+    for (source, target, kind), count in edges.items():
+        lines.append(f"  {_dot_id(source)} -> {_dot_id(target)} [label={_dot_id(f'{kind} ×{count}')}];")
+    for (controller, target), count in control_edges.items():
+        lines.append(f"  {_dot_id(controller)} -> {_dot_id(target)} [style=dashed, label={_dot_id(f'×{count}')}];")
+    lines.append("}")
+    return "\n".join(lines), len(strata), len(edges) + len(control_edges)
+
+
+def _summary_table(model):
+    # A table of the model's size: templates by type, concepts by pre-stratification name and the strata
+    groups = defaultdict(list)
+    strata = defaultdict(set)
+    for concept in model.get_concepts_map().values():
+        groups[_concept_base_name(concept)].append(concept.name)
+        for key, value in (concept.context or {}).items():
+            strata[key].add(str(value))
+    rows = [
+        ("Templates", len(model.templates)),
+        ("Concepts", sum(len(names) for names in groups.values())),
+        ("Parameters", len(model.parameters or {})),
+    ]
+    sections = [
+        ("Model", rows),
+        ("Templates by type", sorted(Counter(type(template).__name__ for template in model.templates).items())),
+        ("Concepts by name before stratification", sorted((name, len(names)) for name, names in groups.items())),
+        ("Strata", sorted((key, ", ".join(sorted(values))) for key, values in strata.items())),
+    ]
+    cells = []
+    for title, section_rows in sections:
+        if not section_rows:
+            continue
+        cells.append(f'<tr><th colspan="2">{html.escape(title)}</th></tr>')
+        cells.extend(f"<tr><td>{html.escape(str(key))}</td><td>{html.escape(str(value))}</td></tr>" for key, value in section_rows)
+    return "<table>" + "".join(cells) + "</table>"
+
+
+def _render_model_preview(render, entry):
+    # Tries each rendering in turn, laying out and rendering graphs with graphviz in a subprocess that is killed if it
+    # runs over the time budget or the render is cancelled. The summary table always fits.
+    try:
+        for strategy, dot in render["graphs"]:
+            start = time.perf_counter()
+            process = subprocess.Popen(
+                ["dot", f"-T{_PREVIEW_FORMAT}"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            render["process"] = process
+            if render["cancelled"]:
+                process.kill()
+            try:
+                image, error = process.communicate(dot.encode(), timeout={{ render_seconds|default(20) }})
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                render["reasons"].append(f"laying out the {strategy} graph took over {{ render_seconds|default(20) }}s")
+                continue
+            if render["cancelled"]:
+                return
+            if process.returncode != 0:
+                render["reasons"].append(f"graphviz failed on the {strategy} graph: {error.decode(errors='replace').strip()}")
+                continue
+            if len(image) > {{ render_max_bytes|default(2097152) }}:
+                render["reasons"].append(
+                    f"the {strategy} graph rendered to {len(image)} bytes, over the {{ render_max_bytes|default(2097152) }} byte budget"
+                )
+                continue
+            data = base64.b64encode(image).decode() if _PREVIEW_FORMAT == "png" else image.decode()
+            render["output"] = {_PREVIEW_MIMETYPES[_PREVIEW_FORMAT]: data}
+            render["rendering"].update({
+                "strategy": strategy,
+                "format": _PREVIEW_FORMAT,
+                "seconds": round(time.perf_counter() - start, 3),
+                "bytes": len(image),
+            })
+            break
+        else:
+            render["output"] = {"text/html": render["summary"]}
+            render["rendering"].update({"strategy": "summary", "format": "html", "bytes": len(render["summary"])})
+        render["rendering"]["reason"] = "; ".join(render["reasons"]) or None
+        render["output"]["rendering"] = render["rendering"]
+        entry["output"] = render["output"]
+        entry["bytes"] += render["rendering"]["bytes"]
+        _model_preview_stats["renders"] += 1
+    except Exception as e:
+        render["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        render["done"] = True
+
+
+def _cancel_model_preview_render():
+    render = _model_preview_render
+    if render is not None and not render["done"] and not render["cancelled"]:
+        render["cancelled"] = True
+        _model_preview_stats["renders_cancelled"] += 1
+        if render["process"] is not None:
+            render["process"].kill()
+
+
+def _start_model_preview_render(model, fingerprint, entry):
+    # Picks the renderings to try from the size of the model: the full graph if it is within the limits, otherwise the
+    # strata-collapsed graph if that is, with the summary table as the last resort. The graphs are built from the model
+    # now, so later changes to the model don't affect the render.
+    global _model_preview_render
+    templates, concepts = len(model.templates), len(model.get_concepts_map())
+    render = {
+        "fingerprint": fingerprint,
+        "graphs": [],
+        "summary": _summary_table(model),
+        "reasons": [],
+        "rendering": {"templates": templates, "concepts": concepts},
+        "process": None,
+        "cancelled": False,
+        "done": False,
+        "error": None,
+        "output": None,
+    }
+    if templates <= {{ max_templates|default(150) }} and concepts <= {{ max_concepts|default(75) }}:
+        render["graphs"].append(("full", GraphicalModel(model).graph.to_string()))
+    else:
+        render["reasons"].append(
+            f"the model has {templates} templates and {concepts} concepts, over the limit of "
+            f"{{ max_templates|default(150) }} templates and {{ max_concepts|default(75) }} concepts for the full graph"
+        )
+    collapsed, collapsed_concepts, collapsed_edges = _collapsed_graph(model)
+    if collapsed_concepts < concepts:
+        if collapsed_edges <= {{ max_templates|default(150) }} and collapsed_concepts <= {{ max_concepts|default(75) }}:
+            render["graphs"].append(("collapsed", collapsed))
+        elif not render["graphs"]:
+            render["reasons"].append(
+                f"the strata-collapsed graph has {collapsed_edges} edges and {collapsed_concepts} concepts, also over the limit"
+            )
+    _model_preview_render = render
+    threading.Thread(target=_render_model_preview, args=(render, entry), daemon=True).start()
+
+
+_preview_model = {{ var_name }}
+_preview_key = ("{{ var_name }}", "{{ schema_name }}")
+_preview_fingerprint = _model_fingerprint(_preview_model)
+_preview_entry = _model_preview_cache.get(_preview_key)
+if _preview_entry is None or _preview_entry["fingerprint"] != _preview_fingerprint:
+    if "{{ schema_name }}" == "regnet":
+        _model_json = template_model_to_regnet_json(_preview_model)
+    elif "{{ schema_name }}" == "stockflow":
+        _model_json = template_model_to_stockflow_json(_preview_model)
+    else:
+        _model_json = template_model_to_petrinet_json(_preview_model)
+    _preview_entry = {
+        "fingerprint": _preview_fingerprint,
+        "json": _model_json,
+        "output": None,
+        "bytes": len(json.dumps(_model_json, default=str)),
+    }
+    _model_preview_cache[_preview_key] = _preview_entry
+elif _preview_entry["output"] is not None:
+    _model_preview_stats["renders_avoided"] += 1
+
+# A render of an older version of the model is no longer needed
+if _model_preview_render is not None and _model_preview_render["fingerprint"] != _preview_fingerprint:
+    _cancel_model_preview_render()
+if _preview_entry["output"] is None and (
+    _model_preview_render is None
+    or _model_preview_render["fingerprint"] != _preview_fingerprint
+    or _model_preview_render["cancelled"]
+):
+    _start_model_preview_render(_preview_model, _preview_fingerprint, _preview_entry)
+
+# Forget previews of models that have been deleted
+for _key in [_key for _key in _model_preview_cache if _key[0] not in globals()]:
+    del _model_preview_cache[_key]
+
+_model_preview_result = {
+    "fingerprint": _preview_fingerprint,
+    # The kernel already has the preview it last sent, so it is only sent again if it has changed
+    "preview": None if _preview_fingerprint == "{{ sent_fingerprint }}" else {
+        "application/json": _preview_entry["json"],
+        **(_preview_entry["output"] or {}),
+    },
+    "rendering": _preview_entry["output"] is None and _model_preview_render["error"] is None,
+    "cache": {
+        **_model_preview_stats,
+        "entries": len(_model_preview_cache),
+        "bytes": sum(_entry["bytes"] for _entry in _model_preview_cache.values()),
+    },
+}
+
+_model_preview_result
@@ -0,0 +1,12 @@
+# The state of the background render `model_preview` started for the model with this fingerprint
+_render = _model_preview_render
+if _render is None or _render["fingerprint"] != "{{ fingerprint }}" or _render["cancelled"]:
+    _model_preview_render_status = {"status": "cancelled"}
+elif not _render["done"]:
+    _model_preview_render_status = {"status": "pending"}
+elif _render["error"] is not None:
+    _model_preview_render_status = {"status": "failed", "error": _render["error"]}
+else:
+    _model_preview_render_status = {"status": "done", "output": _render["output"]}
+
+_model_preview_render_status
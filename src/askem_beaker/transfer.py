@@ -0,0 +1,62 @@
+import contextlib
+import json
+import os
+import tempfile
+from typing import TYPE_CHECKING, Any, Iterator, Optional
+
+if TYPE_CHECKING:
+    from beaker_kernel.lib.context import BaseContext
+
+TRANSFER_MODES = ("file", "json")
+
+
+@contextlib.contextmanager
+def transfer_file(obj: Any) -> Iterator[str]:
+    """
+    Writes `obj` as JSON to a temporary file that a subkernel on the same host can read, yielding the file's path.
+
+    This lets the kernel hand a document it has already fetched to the subkernel without embedding it in the code
+    being executed or having the subkernel download it a second time. The file is removed when the context exits, so
+    the subkernel must finish reading it within the block (i.e. the execution must be awaited inside it).
+    """
+    fd, path = tempfile.mkstemp(prefix="beaker-transfer-", suffix=".json", dir=os.environ.get("BEAKER_TRANSFER_DIR"))
+    try:
+        with os.fdopen(fd, "w") as transfer:
+            transfer.write(json.dumps(obj))
+        yield path
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+@contextlib.contextmanager
+def injection_code(var_name: str, obj: Any, mode: Optional[str] = None) -> Iterator[str]:
+    """
+    Yields Python subkernel code that assigns a JSON-serializable `obj` to `var_name`.
+
+    Rather than rendering the object as a Python literal, which the subkernel has to tokenize and compile, the object
+    is passed as JSON and decoded with `json`:
+
+    * `file` (default): the JSON is written to a transfer file and the code only contains its path.
+    * `json`: the JSON is embedded in the code as a single string literal. Use this when the subkernel does not share
+      a filesystem with the kernel.
+
+    The default mode can be set with the `BEAKER_TRANSFER_MODE` environment variable. As with `transfer_file`, the
+    code must be executed before the context exits.
+    """
+    mode = mode or os.environ.get("BEAKER_TRANSFER_MODE", "file")
+    if mode == "json":
+        yield f"import json as _json\n{var_name} = _json.loads({json.dumps(obj)!r})"
+    elif mode == "file":
+        with transfer_file(obj) as path:
+            yield f"import json as _json\nwith open({path!r}) as _transfer_file:\n    {var_name} = _json.load(_transfer_file)"
+    else:
+        raise ValueError(f"Unknown transfer mode '{mode}'. Expected one of: {', '.join(TRANSFER_MODES)}")
+
+
+async def inject_object(context: "BaseContext", var_name: str, obj: Any, mode: Optional[str] = None):
+    """
+    Assigns a JSON-serializable `obj` to `var_name` in the context's (Python) subkernel.
+    """
+    with injection_code(var_name, obj, mode=mode) as code:
+        return await context.execute(code)
@@ -1,8 +1,16 @@
+import asyncio
+import json
 import os
 from base64 import b64encode
-from typing import TYPE_CHECKING, Any, Dict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable
 from requests.auth import HTTPBasicAuth
 
+if TYPE_CHECKING:
+    from beaker_kernel.kernel import LLMKernel
+
+# Procedures report progress by printing lines of `PROGRESS_PREFIX` followed by a JSON object.
+PROGRESS_PREFIX = "__beaker_progress__"
+
 class TerariumAuth:
     username: str
     password: str
@@ -30,3 +38,62 @@ def get_auth() -> TerariumAuth|None:
         return TerariumAuth()
     except ValueError:
         return None
+
+
+def progress_handler(callback: Callable[[dict], Any]):
+    """
+    Builds a `response_handler` for `BaseContext.execute` that passes each progress record printed by a procedure to
+    `callback`. Output consisting only of progress records is hidden from the notebook.
+    """
+    from beaker_kernel.lib.jupyter_kernel_proxy import JupyterMessage
+
+    async def handle_progress(server, target_stream, data):
+        message = JupyterMessage.parse(data)
+        text = message.content.get("text", "")
+        if PROGRESS_PREFIX not in text:
+            return data
+        other_output = False
+        for line in text.splitlines():
+            if line.startswith(PROGRESS_PREFIX):
+                callback(json.loads(line[len(PROGRESS_PREFIX):]))
+            elif line.strip():
+                other_output = True
+        return data if other_output else None
+
+    return handle_progress
+
+
+async def gather_with_limit(limit: int, *aws, return_exceptions: bool = False) -> list:
+    """
+    Like `asyncio.gather`, but with at most `limit` of the awaitables running at any one time.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*(run(aw) for aw in aws), return_exceptions=return_exceptions)
+
+
+def send_response_with_buffers(
+    beaker_kernel: "LLMKernel",
+    stream: str,
+    msg_type: str,
+    content: dict,
+    buffers: Iterable[bytes] = (),
+    metadata: dict = {},
+    parent_header: dict = {},
+):
+    """
+    Like `LLMKernel.send_response`, but with message `metadata` and binary `buffers` attached to the message.
+
+    Buffers follow the signed parts of a Jupyter message, so they are appended as-is to the message the kernel builds.
+    """
+    socket = getattr(beaker_kernel.server.streams, stream)
+    message = beaker_kernel.server.make_multipart_message(
+        msg_type=msg_type, content=content, parent_header=parent_header, metadata=metadata
+    )
+    socket.send_multipart(message + list(buffers))
+    socket.flush()
+    return message
@@ -0,0 +1,134 @@
+import io
+import os
+
+import pytest
+import requests
+
+from askem_beaker.dataset_cache import DatasetCache, _locked
+
+
+class FakeSession:
+    """
+    Stands in for the cache's `requests.Session`, serving one file per url with an ETag and answering conditional
+    requests for the current version with a 304.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+
+    def get(self, url, headers=None, stream=False, **kwargs):
+        headers = headers or {}
+        self.requests.append((url, headers))
+        data, etag = self.files[url]
+        response = requests.Response()
+        response.url = url
+        response.headers["ETag"] = etag
+        if headers.get("If-None-Match") == etag:
+            response.status_code = 304
+            response.raw = io.BytesIO()
+        else:
+            response.status_code = 200
+            response.headers["Content-Length"] = str(len(data))
+            response.raw = io.BytesIO(data)
+        return response
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = DatasetCache(root=str(tmp_path), max_bytes=250)
+    cache.session = FakeSession()
+    return cache
+
+
+def serve(cache, name, data, etag='"v1"'):
+    url = f"http://store.test/{name}"
+    cache.session.files[url] = (data, etag)
+    return url
+
+
+def test_miss_then_hit(cache):
+    url = serve(cache, "a.csv", b"a" * 100)
+    first = cache.fetch("a", "a.csv", url)
+    assert not first.hit
+    with open(first.path, "rb") as cached_file:
+        assert cached_file.read() == b"a" * 100
+    second = cache.fetch("a", "a.csv", url)
+    assert second.hit and second.path == first.path
+    assert cache.session.requests[-1][1]["If-None-Match"] == '"v1"'
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["bytes_saved"], stats["bytes_downloaded"]) == (1, 1, 100, 100)
+    assert (stats["entries"], stats["bytes"]) == (1, 100)
+
+
+def test_changed_file_is_downloaded_again(cache):
+    url = serve(cache, "a.csv", b"a" * 100)
+    cache.fetch("a", "a.csv", url)
+    serve(cache, "a.csv", b"b" * 50, etag='"v2"')
+    cached = cache.fetch("a", "a.csv", url)
+    assert not cached.hit and cached.size == 50
+    with open(cached.path, "rb") as cached_file:
+        assert cached_file.read() == b"b" * 50
+
+
+def test_progress_is_reported(cache):
+    url = serve(cache, "a.csv", b"a" * 100)
+    reports = []
+    cache.fetch("a", "a.csv", url, progress=lambda transferred, total: reports.append((transferred, total)))
+    assert reports[-1] == (100, 100)
+
+
+def test_least_recently_used_entry_is_evicted(cache):
+    first = cache.fetch("a", "a.csv", serve(cache, "a.csv", b"a" * 100))
+    second = cache.fetch("b", "b.csv", serve(cache, "b.csv", b"b" * 100))
+    # Reading `a` again makes `b` the least recently used
+    cache.fetch("a", "a.csv", serve(cache, "a.csv", b"a" * 100))
+    third = cache.fetch("c", "c.csv", serve(cache, "c.csv", b"c" * 100))
+    assert os.path.exists(first.path) and os.path.exists(third.path)
+    assert not os.path.exists(second.path)
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (2, 200, 1)
+
+
+def test_fetched_entry_is_kept_when_over_the_limit(cache):
+    cached = cache.fetch("a", "a.csv", serve(cache, "a.csv", b"a" * 300))
+    assert os.path.exists(cached.path)
+    assert cache.stats()["evictions"] == 0
+
+
+def test_locked_entries_are_not_evicted(cache):
+    first = cache.fetch("a", "a.csv", serve(cache, "a.csv", b"a" * 150))
+    # Another kernel holds the entry's lock, e.g. while revalidating it
+    with _locked(os.path.join(os.path.dirname(first.path), ".lock")):
+        second = cache.fetch("b", "b.csv", serve(cache, "b.csv", b"b" * 150))
+    assert os.path.exists(first.path) and os.path.exists(second.path)
+    assert cache.stats()["evictions"] == 0
+    # Once released, the next fetch evicts it
+    cache.fetch("b", "b.csv", serve(cache, "b.csv", b"b" * 150))
+    assert not os.path.exists(first.path)
+
+
+def test_pinned_files_survive_eviction_and_revalidation(cache):
+    url = serve(cache, "a.csv", b"a" * 100)
+    pinned_path = cache.pin(cache.fetch("a", "a.csv", url).path)
+    serve(cache, "a.csv", b"b" * 100, etag='"v2"')
+    cache.fetch("a", "a.csv", url)
+    with open(pinned_path, "rb") as pinned_file:
+        assert pinned_file.read() == b"a" * 100
+    cache.fetch("b", "b.csv", serve(cache, "b.csv", b"b" * 200))
+    assert cache.stats()["evictions"] == 1
+    with open(pinned_path, "rb") as pinned_file:
+        assert pinned_file.read() == b"a" * 100
+    cache.unpin(pinned_path)
+    assert not os.path.exists(pinned_path)
+
+
+def test_sessions_of_exited_processes_are_removed(cache, tmp_path):
+    stale_dir = os.path.join(cache.sessions_dir, "1-stale")
+    os.makedirs(stale_dir)
+    open(os.path.join(stale_dir, ".lock"), "a").close()
+    live = DatasetCache(root=str(tmp_path))
+    live_dir = live.session_dir()
+    cache.session_dir()
+    assert not os.path.exists(stale_dir)
+    assert os.path.exists(live_dir)
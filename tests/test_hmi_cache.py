@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+import pytest
+import requests
+
+from askem_beaker import hmi
+from askem_beaker.hmi import HMIClient, MetadataCache
+
+BASE_URL = "http://hmi.test"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSession:
+    """
+    Stands in for the client's `requests.Session`, serving one JSON document per url with an ETag and answering
+    conditional requests for the current version with a 304.
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self.requests = []
+
+    def request(self, method, url, headers=None, **kwargs):
+        headers = headers or {}
+        self.requests.append((url, headers))
+        response = requests.Response()
+        response.url = url
+        if url not in self.documents:
+            response.status_code = 404
+            return response
+        document, etag = self.documents[url]
+        response.headers["ETag"] = etag
+        if headers.get("If-None-Match") == etag:
+            response.status_code = 304
+        else:
+            response.status_code = 200
+            response._content = json.dumps(document).encode()
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(hmi.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def client():
+    client = HMIClient(base_url=BASE_URL, max_concurrency=2)
+    client.cache = MetadataCache(ttl=30, max_entries=2)
+    client.session = FakeSession()
+    yield client
+    client.close()
+
+
+def test_fresh_entries_are_served_from_cache(client, clock):
+    client.session.documents[f"{BASE_URL}/datasets/a"] = ({"name": "a"}, '"v1"')
+    assert asyncio.run(client.get_cached_json("datasets/a")) == {"name": "a"}
+    clock.now += 10
+    assert asyncio.run(client.get_cached_json("datasets/a")) == {"name": "a"}
+    assert len(client.session.requests) == 1
+    assert client.cache.stats()["hits"] == 1
+    assert client.cache.stats()["misses"] == 1
+
+
+def test_cached_documents_are_copies(client, clock):
+    client.session.documents[f"{BASE_URL}/datasets/a"] = ({"columns": []}, '"v1"')
+    document = asyncio.run(client.get_cached_json("datasets/a"))
+    document["columns"].append("changed")
+    assert asyncio.run(client.get_cached_json("datasets/a")) == {"columns": []}
+
+
+def test_stale_entries_are_revalidated(client, clock):
+    url = f"{BASE_URL}/datasets/a"
+    client.session.documents[url] = ({"name": "a"}, '"v1"')
+    asyncio.run(client.get_cached_json("datasets/a"))
+    clock.now += 31
+    # Unchanged: a 304 keeps the cached document and restarts its TTL
+    assert asyncio.run(client.get_cached_json("datasets/a")) == {"name": "a"}
+    assert client.session.requests[-1][1]["If-None-Match"] == '"v1"'
+    assert client.cache.stats()["revalidations"] == 1
+    clock.now += 10
+    asyncio.run(client.get_cached_json("datasets/a"))
+    assert len(client.session.requests) == 2
+    # Changed: a 200 replaces the cached document
+    client.session.documents[url] = ({"name": "b"}, '"v2"')
+    clock.now += 31
+    assert asyncio.run(client.get_cached_json("datasets/a")) == {"name": "b"}
+    assert client.cache.get(url).etag == '"v2"'
+
+
+def test_errors_are_raised_and_not_cached(client, clock):
+    with pytest.raises(requests.HTTPError):
+        asyncio.run(client.get_cached_json("datasets/missing"))
+    assert client.cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(client, clock):
+    for name in ("a", "b", "c"):
+        client.session.documents[f"{BASE_URL}/datasets/{name}"] = ({"name": name}, '"v1"')
+    asyncio.run(client.get_cached_json("datasets/a"))
+    asyncio.run(client.get_cached_json("datasets/b"))
+    # Reading `a` again makes `b` the least recently used
+    asyncio.run(client.get_cached_json("datasets/a"))
+    asyncio.run(client.get_cached_json("datasets/c"))
+    assert client.cache.get(f"{BASE_URL}/datasets/a") is not None
+    assert client.cache.get(f"{BASE_URL}/datasets/b") is None
+    assert client.cache.stats()["evictions"] == 1
+
+
+def test_invalidate_drops_entries_with_query_parameters(client, clock):
+    url = f"{BASE_URL}/datasets/a"
+    client.session.documents[url] = ({"name": "a"}, '"v1"')
+    client.session.documents[f"{url}?filename=a.csv"] = ({"url": "a.csv"}, '"v1"')
+    asyncio.run(client.get_cached_json("datasets/a"))
+    asyncio.run(client.get_cached_json("datasets/a", params={"filename": "a.csv"}))
+    client.invalidate("datasets/a")
+    assert client.cache.stats()["entries"] == 0
+
+
+def test_disabled_cache_stores_nothing(clock):
+    cache = MetadataCache(ttl=30, max_entries=0)
+    cache.put("key", {}, None, None)
+    assert cache.get("key") is None
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from askem_beaker.transfer import injection_code, transfer_file
+
+DOCUMENT = {"name": "SIR", "parameters": [{"id": "beta", "value": 0.1}], "note": "quotes ' and \" and \\ survive"}
+
+
+def run(code):
+    namespace = {}
+    exec(code, namespace)
+    return namespace
+
+
+def test_transfer_file_is_removed_on_exit(tmp_path, monkeypatch):
+    monkeypatch.setenv("BEAKER_TRANSFER_DIR", str(tmp_path))
+    with transfer_file(DOCUMENT) as path:
+        assert os.path.dirname(path) == str(tmp_path)
+        assert os.path.exists(path)
+    assert not os.path.exists(path)
+
+
+@pytest.mark.parametrize("mode", ["file", "json"])
+def test_injection_code_round_trips(mode, tmp_path, monkeypatch):
+    monkeypatch.setenv("BEAKER_TRANSFER_DIR", str(tmp_path))
+    with injection_code("model", DOCUMENT, mode=mode) as code:
+        assert run(code)["model"] == DOCUMENT
+    assert os.listdir(tmp_path) == []
+
+
+def test_json_mode_embeds_document(tmp_path, monkeypatch):
+    monkeypatch.setenv("BEAKER_TRANSFER_DIR", str(tmp_path))
+    with injection_code("model", DOCUMENT, mode="json") as code:
+        assert os.listdir(tmp_path) == []
+        assert "open(" not in code
+
+
+def test_default_mode_from_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("BEAKER_TRANSFER_DIR", str(tmp_path))
+    monkeypatch.setenv("BEAKER_TRANSFER_MODE", "json")
+    with injection_code("model", DOCUMENT) as code:
+        assert "open(" not in code
+    monkeypatch.delenv("BEAKER_TRANSFER_MODE")
+    with injection_code("model", DOCUMENT) as code:
+        assert len(os.listdir(tmp_path)) == 1
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError, match="Unknown transfer mode"):
+        with injection_code("model", DOCUMENT, mode="pickle"):
+            pass
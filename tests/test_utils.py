@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from askem_beaker.utils import gather_with_limit
+
+
+def test_gather_with_limit_caps_concurrency():
+    running = 0
+    peak = 0
+
+    async def work(value):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return value
+
+    results = asyncio.run(gather_with_limit(3, *(work(value) for value in range(10))))
+    assert results == list(range(10))
+    assert peak == 3
+
+
+def test_gather_with_limit_runs_with_a_limit_below_one():
+    async def work(value):
+        return value
+
+    assert asyncio.run(gather_with_limit(0, work(1), work(2))) == [1, 2]
+
+
+def test_gather_with_limit_exceptions():
+    async def work(value):
+        if value == 1:
+            raise ValueError(value)
+        return value
+
+    async def gather(**kwargs):
+        return await gather_with_limit(2, *(work(value) for value in range(3)), **kwargs)
+
+    with pytest.raises(ValueError):
+        asyncio.run(gather())
+    results = asyncio.run(gather(return_exceptions=True))
+    assert results[0] == 0 and isinstance(results[1], ValueError) and results[2] == 2